@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`budget` -- Allocation of an electron budget over a sweep
+================================================================================
+
+.. module:: budget
+   :synopsis: Allocation of an electron budget over a sweep
+
+Instead of simulating every point of a sweep with the same number of
+electrons, the :class:`ElectronBudgetPlanner` distributes a total number of
+electrons where they are needed:
+
+  1. each point is simulated with a small pilot number of electrons;
+  2. the relative uncertainty of each line, which decreases as the inverse
+     square root of the number of electrons, gives the number of electrons
+     needed by the worst line of each point;
+  3. the remaining electrons are allocated so that the worst relative
+     uncertainty is the same at all points (or just reaches the target
+     relative uncertainty, if the budget allows it).
+
+Points whose pilot simulation is already precise enough are not simulated
+again.
+A line without any count in the pilot simulation (e.g. a soft, low-yield
+line) is given the relative uncertainty of a single count,
+:data:`NO_COUNTS_RELUNC`, so that its point is simulated again with more
+electrons rather than ignored.
+Lines of elements absent from a point should therefore not be requested.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import copy
+import logging
+from collections import namedtuple
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.program.winxray.sweep import iter_results
+
+# Globals and constants variables.
+Allocation = namedtuple('Allocation', ['options', 'showers', 'relunc'])
+
+# Relative uncertainty of a line without counts: at best, one count
+# (Poisson, 1 / sqrt(1))
+NO_COUNTS_RELUNC = 1.0
+
+def get_showers(options):
+    """
+    Returns the number of electrons of *options*.
+    """
+    limits = list(options.limits.iterclass(ShowersLimit))
+    if not limits:
+        raise ValueError('No showers limit in options %s' % options.name)
+    return limits[0].showers
+
+def with_showers(options, showers):
+    """
+    Returns a copy of *options* simulating *showers* electrons.
+    """
+    options = copy.deepcopy(options)
+    limits = list(options.limits.iterclass(ShowersLimit))
+    if limits:
+        limits[0].showers = showers
+    else:
+        options.limits.add(ShowersLimit(showers))
+    return options
+
+def relative_uncertainties(results, key, lines):
+    """
+    Returns the relative uncertainty of the emitted intensity of each line
+    (:data:`NO_COUNTS_RELUNC` if the line is absent or not emitted).
+    """
+    result = results[key]
+    reluncs = np.full(len(lines), NO_COUNTS_RELUNC)
+    for j, line in enumerate(lines):
+        try:
+            value, uncertainty = result.intensity(line, absorption=True)
+        except (ValueError, KeyError):
+            continue
+        if value > 0.0:
+            reluncs[j] = max(uncertainty / value, 0.0)
+    return reluncs
+
+def allocate(coefficients, remaining, pilot, target_relunc=None):
+    """
+    Returns the number of electrons of each point (0 where the pilot
+    simulation is kept) and the expected worst relative uncertainty.
+
+    :arg coefficients: squared relative uncertainty times number of
+        electrons of the worst line of each point
+        (``relunc = sqrt(coefficient / electrons)``)
+    :arg remaining: number of electrons to allocate
+    :arg pilot: number of electrons of the pilot simulations
+    :arg target_relunc: relative uncertainty that is sufficient
+    """
+    coefficients = np.nan_to_num(np.asarray(coefficients, dtype=float))
+    showers = np.zeros(len(coefficients))
+
+    # Points needing more electrons than their pilot simulation
+    needed = coefficients > 0.0
+    if target_relunc is not None:
+        needed &= coefficients / target_relunc ** 2 > pilot
+
+    while needed.any():
+        total = coefficients[needed].sum()
+        level = total / max(remaining, 1) # relunc ** 2 at all points
+        if target_relunc is not None:
+            level = max(level, target_relunc ** 2)
+
+        showers[:] = 0.0
+        showers[needed] = coefficients[needed] / level
+
+        # The pilot simulation is better than the allocation
+        worse = needed & (showers <= pilot)
+        if not worse.any():
+            break
+        needed &= ~worse
+
+    showers = np.ceil(showers)
+
+    electrons = np.where(showers > 0, showers, pilot)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reluncs = np.sqrt(coefficients / electrons)
+
+    return showers.astype(int), reluncs
+
+class ElectronBudgetPlanner(object):
+
+    def __init__(self, key, lines, run, total_electrons, pilot_electrons=1000,
+                 target_relunc=None, max_inflight=None):
+        """
+        Creates a planner.
+
+        :arg key: key of the :class:`PhotonIntensityDetector` in the results
+        :arg lines: X-ray lines whose uncertainties are minimised
+        :arg run: function taking an options and returning its results (see
+            :func:`worker_runner <pymontecarlo.program.winxray.sweep.worker_runner>`)
+        :arg total_electrons: number of electrons of the whole sweep,
+            including the pilot simulations
+        :arg pilot_electrons: number of electrons of each pilot simulation
+        :arg target_relunc: relative uncertainty that is sufficient. No more
+            electrons are allocated to a point once its worst line reaches
+            it.
+        :arg max_inflight: see
+            :func:`iter_results <pymontecarlo.program.winxray.sweep.iter_results>`
+        """
+        if pilot_electrons < 1:
+            raise ValueError('Pilot simulations need at least one electron')
+
+        self._key = key
+        self._lines = list(lines)
+        self._run = run
+        self._total_electrons = total_electrons
+        self._pilot_electrons = pilot_electrons
+        self._target_relunc = target_relunc
+        self._max_inflight = max_inflight
+
+    def pilot(self, optionss):
+        """
+        Runs the pilot simulations and returns their (options, results) in
+        the order of *optionss*.
+        """
+        pilots = [with_showers(options, self._pilot_electrons) \
+                  for options in optionss]
+        indexes = dict((id(options), i) for i, options in enumerate(pilots))
+
+        items = [None] * len(pilots)
+        for options, results in iter_results(pilots, self._run,
+                                             self._max_inflight):
+            items[indexes[id(options)]] = (options, results)
+        return items
+
+    def plan(self, items):
+        """
+        Returns the :class:`Allocation` of each point from the results of
+        its pilot simulation.
+        The number of electrons is 0 for the points whose pilot simulation
+        is kept.
+
+        :arg items: (options, results) of the pilot simulations
+        """
+        items = list(items)
+        remaining = self._total_electrons - len(items) * self._pilot_electrons
+        if remaining < 0:
+            raise ValueError('Budget smaller than the pilot simulations')
+
+        reluncs = np.array([relative_uncertainties(results, self._key, self._lines) \
+                            for _options, results in items]).reshape(len(items), -1)
+        worst = np.max(reluncs, axis=1)
+        coefficients = worst ** 2 * self._pilot_electrons
+
+        showers, expected = \
+            allocate(coefficients, remaining, self._pilot_electrons,
+                     self._target_relunc)
+
+        return [Allocation(options, int(n), float(relunc)) \
+                for (options, _results), n, relunc in zip(items, showers, expected)]
+
+    def run(self, optionss):
+        """
+        Runs the pilot simulations and the allocated simulations, and yields
+        (options, results) of each point as they complete.
+        The results of the points whose pilot simulation is precise enough
+        are yielded first.
+        """
+        optionss = list(optionss)
+        items = self.pilot(optionss)
+        allocations = self.plan(items)
+
+        pending = []
+        for options, (_pilot, results), allocation in \
+                zip(optionss, items, allocations):
+            if allocation.showers == 0:
+                yield with_showers(options, self._pilot_electrons), results
+            else:
+                pending.append(with_showers(options, allocation.showers))
+
+        logging.debug('%i point(s) simulated again with %i electrons',
+                      len(pending), sum(get_showers(options) for options in pending))
+
+        for options, results in iter_results(pending, self._run,
+                                             self._max_inflight):
+            yield options, results
+
+    @property
+    def lines(self):
+        return list(self._lines)
+
+    @property
+    def total_electrons(self):
+        return self._total_electrons
+
+    @property
+    def pilot_electrons(self):
+        return self._pilot_electrons
+
+    @property
+    def target_relunc(self):
+        return self._target_relunc
@@ -20,25 +20,57 @@ __license__ = "GPL v3"
 import os
 import sys
 import glob
+import importlib
 
 # Third party modules.
 
 # Local modules.
 from pymontecarlo.settings import get_settings
 from pymontecarlo.program.config import Program
-from pymontecarlo.program.winxray.converter import Converter
-from pymontecarlo.program.winxray.exporter import Exporter
-from pymontecarlo.program.winxray.importer import Importer
-from pymontecarlo.program.winxray.worker import Worker
 
 # Globals and constants variables.
 
+class _LazyClass(object):
+    """
+    Descriptor importing a class the first time it is accessed.
+    The converter, exporter, importer and worker modules import NumPy, pyxray
+    and winxraytools, which are not needed to list the programs or validate
+    the settings.
+    """
+
+    def __init__(self, modname, classname):
+        self._modname = modname
+        self._classname = classname
+        self._clasz = None
+
+    def __get__(self, instance, owner):
+        if self._clasz is None:
+            module = importlib.import_module(self._modname)
+            self._clasz = getattr(module, self._classname)
+        return self._clasz
+
+    def __set__(self, instance, value):
+        # Ignore the placeholder assigned by Program.__init__
+        if value is not None:
+            self._clasz = value
+
 class _WinXRayProgram(Program):
 
+    # Classes are resolved on first use, whether accessed through the
+    # public properties or the attributes set by Program.__init__
+    converter_class = _converter_class = \
+        _LazyClass('pymontecarlo.program.winxray.converter', 'Converter')
+    worker_class = _worker_class = \
+        _LazyClass('pymontecarlo.program.winxray.worker', 'Worker')
+    exporter_class = _exporter_class = \
+        _LazyClass('pymontecarlo.program.winxray.exporter', 'Exporter')
+    importer_class = _importer_class = \
+        _LazyClass('pymontecarlo.program.winxray.importer', 'Importer')
+
     def __init__(self):
         autorun = False if sys.platform == 'darwin' else True
-        Program.__init__(self, 'WinXRay', 'winxray', Converter, Worker,
-                          Exporter, Importer, autorun=autorun)
+        Program.__init__(self, 'WinXRay', 'winxray', None, None,
+                         None, None, autorun=autorun)
 
     def validate(self):
         settings = get_settings()
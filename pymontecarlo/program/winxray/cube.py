@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`cube` -- Array-backed aggregation of the results of a sweep
+================================================================================
+
+.. module:: cube
+   :synopsis: Array-backed aggregation of the results of a sweep
+
+The photon intensities of all the simulations of a sweep are stored in dense
+NumPy arrays indexed by the sweep parameters (beam energy, weight fraction of
+each element, number of electrons, ...) and by X-ray line.
+Missing combinations of parameters are filled with NaN.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+from collections import OrderedDict
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.options.limit import ShowersLimit
+
+# Globals and constants variables.
+
+def _energy_eV(options):
+    return options.beam.energy_eV
+
+def _showers(options):
+    limits = list(options.limits.iterclass(ShowersLimit))
+    return limits[0].showers if limits else np.nan
+
+def _composition(options):
+    composition = {}
+    for material in options.geometry.get_materials():
+        composition.update(material.composition)
+    return composition
+
+def _weight_fraction(z):
+    return lambda options: _composition(options).get(z, 0.0)
+
+def default_parameters(optionss):
+    """
+    Returns the default parameters of a sweep: beam energy, number of
+    electrons and the weight fraction of each element found in *optionss*.
+    """
+    zs = set()
+    for options in optionss:
+        zs.update(_composition(options).keys())
+
+    parameters = [('energy_eV', _energy_eV), ('showers', _showers)]
+    for z in sorted(zs):
+        parameters.append(('wf_%i' % z, _weight_fraction(z)))
+
+    return parameters
+
+def make_axes(parameters, coordinates):
+    """
+    Returns the axes of a grid (:class:`OrderedDict` of parameter name to the
+    sorted array of its values) and the indexes of each simulation along
+    each axis.
+
+    :arg parameters: list of (name, function)
+    :arg coordinates: array of shape ``(number of simulations,
+        number of parameters)`` with the values of the parameters
+    """
+    axes = OrderedDict()
+    indexes = []
+    for k, (name, _func) in enumerate(parameters):
+        axis, index = np.unique(np.round(coordinates[:, k], 9),
+                                return_inverse=True)
+        axes[name] = axis
+        indexes.append(index.ravel())
+
+    return axes, indexes
+
+class PhotonIntensityCube(object):
+
+    def __init__(self, axes, lines, values, uncertainties, absorption=True):
+        """
+        Creates a cube.
+
+        :arg axes: :class:`OrderedDict` of parameter name to the sorted array
+            of its values
+        :arg lines: X-ray lines (e.g. ``'Al Ka1'``), last axis of the arrays
+        :arg values: intensities, array of shape
+            ``(len(axis1), len(axis2), ..., len(lines))``
+        :arg uncertainties: uncertainties of the intensities, same shape as
+            *values*
+        """
+        self._axes = OrderedDict(axes)
+        self._lines = list(lines)
+
+        shape = tuple(len(axis) for axis in self._axes.values()) + (len(self._lines),)
+        values = np.asarray(values, dtype=float)
+        uncertainties = np.asarray(uncertainties, dtype=float)
+        if values.shape != shape or uncertainties.shape != shape:
+            raise ValueError('Values and uncertainties must have shape %s' % (shape,))
+
+        self._values = values
+        self._uncertainties = uncertainties
+        self._absorption = absorption
+
+    @classmethod
+    def from_results(cls, items, key, lines, parameters=None, absorption=True):
+        """
+        Creates a cube from the results of a sweep.
+
+        :arg items: iterable of (options, results)
+        :arg key: key of the :class:`PhotonIntensityDetector` in the results
+        :arg lines: X-ray lines to extract (e.g. ``['Al Ka1', 'Cu La1']``)
+        :arg parameters: list of (name, function) where the function returns
+            the value of the parameter for an options.
+            By default, see :func:`default_parameters`.
+        :arg absorption: whether to extract emitted (``True``) or generated
+            (``False``) intensities
+
+        If two simulations have the same parameters, the last one is kept.
+        """
+        items = list(items)
+        if parameters is None:
+            parameters = default_parameters([options for options, _ in items])
+
+        nruns = len(items)
+        coordinates = np.empty((nruns, len(parameters)))
+        data = np.empty((nruns, len(lines), 2))
+
+        for i, (options, results) in enumerate(items):
+            coordinates[i] = [func(options) for _, func in parameters]
+
+            result = results[key]
+            for j, line in enumerate(lines):
+                try:
+                    data[i, j] = result.intensity(line, absorption=absorption)
+                except (ValueError, KeyError):
+                    data[i, j] = np.nan
+
+        axes, indexes = make_axes(parameters, coordinates)
+
+        # Fill in a single pass
+        shape = tuple(len(axis) for axis in axes.values()) + (len(lines),)
+        values = np.full(shape, np.nan)
+        uncertainties = np.full(shape, np.nan)
+
+        values[tuple(indexes)] = data[:, :, 0]
+        uncertainties[tuple(indexes)] = data[:, :, 1]
+
+        return cls(axes, lines, values, uncertainties, absorption)
+
+    def __repr__(self):
+        axes = ', '.join('%s=%i' % (name, len(axis)) \
+                         for name, axis in self._axes.items())
+        return '<%s(%s, lines=%i)>' % (self.__class__.__name__, axes,
+                                       len(self._lines))
+
+    def _index(self, line=None, **params):
+        index = []
+        for name, axis in self._axes.items():
+            if name not in params:
+                index.append(slice(None))
+                continue
+
+            value = params.pop(name)
+            position = np.flatnonzero(np.isclose(axis, value))
+            if not len(position):
+                raise ValueError('No value %s for parameter %s' % (value, name))
+            index.append(position[0])
+
+        if params:
+            raise ValueError('Unknown parameter(s): %s' % ', '.join(params))
+
+        if line is None:
+            index.append(slice(None))
+        else:
+            index.append(self._lines.index(line))
+
+        return tuple(index)
+
+    def get(self, line=None, **params):
+        """
+        Returns the intensities and uncertainties for the specified *line*
+        and parameter values.
+        The returned arrays have one dimension per unspecified parameter (and
+        one for the lines if *line* is ``None``).
+        """
+        index = self._index(line, **params)
+        return self._values[index], self._uncertainties[index]
+
+    def divide(self, other):
+        """
+        Returns a new cube with the ratios of the intensities of this cube
+        to the ones of *other* (e.g. k-ratios, if *other* contains the
+        intensities of the standards).
+        The axes of *other* must be equal to, or a subset of, the axes of this
+        cube. Missing axes are broadcasted.
+        Uncertainties are propagated assuming independent intensities.
+        """
+        if other.lines != self._lines:
+            raise ValueError('Cubes must have the same lines')
+
+        # Reshape other to broadcast against this cube
+        shape = []
+        for name, axis in self._axes.items():
+            if name not in other.axes:
+                shape.append(1)
+            elif not np.allclose(other.axes[name], axis):
+                raise ValueError('Axis %s is different' % name)
+            else:
+                shape.append(len(axis))
+        shape.append(len(self._lines))
+
+        extra = set(other.axes) - set(self._axes)
+        if extra:
+            raise ValueError('Unknown axes: %s' % ', '.join(extra))
+
+        order = [name for name in self._axes if name in other.axes]
+        transpose = [list(other.axes).index(name) for name in order] + [len(other.axes)]
+        denominator = np.transpose(other.values, transpose).reshape(shape)
+        denominator_unc = np.transpose(other.uncertainties, transpose).reshape(shape)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = self._values / denominator
+            uncertainties = np.abs(values) * \
+                np.sqrt((self._uncertainties / self._values) ** 2 + \
+                        (denominator_unc / denominator) ** 2)
+
+        return self.__class__(self._axes, self._lines, values, uncertainties,
+                              self._absorption)
+
+    @property
+    def axes(self):
+        return self._axes
+
+    @property
+    def lines(self):
+        return self._lines
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def uncertainties(self):
+        return self._uncertainties
+
+    @property
+    def absorption(self):
+        return self._absorption
+
+    @property
+    def shape(self):
+        return self._values.shape
@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`daemon` -- Long-lived local simulation daemon
+================================================================================
+
+.. module:: daemon
+   :synopsis: Long-lived local simulation daemon
+
+Each script running WinX-Ray simulations pays the start-up of Python, the
+loading of the settings and of the program, and manages its own processes.
+The :class:`SimulationDaemon` keeps the converter and a :class:`Scheduler
+<pymontecarlo.program.winxray.scheduler.Scheduler>` warm in one process,
+so that many lightweight clients share a single pool of simulations, with
+the journal, the content store and the archives configured once in the
+settings of the daemon.
+Identical simulations submitted by several clients at the same time are
+run only once (see :mod:`scheduler`).
+
+Clients submit options and fetch their results over a local HTTP API,
+with the :class:`DaemonClient`:
+
+  * ``POST /jobs?priority=interactive|batch``: submits pickled options and
+    returns the identifiers of the converted simulations;
+  * ``GET /jobs/<id>``: status of a simulation;
+  * ``GET /jobs/<id>/results``: pickled results (status 202 while the
+    simulation is not finished);
+  * ``DELETE /jobs/<id>``: cancels a simulation not started yet;
+  * ``GET /metrics``: metrics of the daemon (see :mod:`metrics`).
+
+Options and results are exchanged as pickles, so the server only listens
+on the loopback interface and every request must carry the token of the
+daemon, which is written in a file readable only by its owner.
+
+The daemon is started from the command line::
+
+    python -m pymontecarlo.program.winxray.daemon --port 8765 --outputdir results
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import re
+import json
+import ipaddress
+import time
+import uuid
+import pickle
+import hmac
+import logging
+import argparse
+import binascii
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import urllib.request
+import urllib.error
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.program.winxray import precision
+from pymontecarlo.program.winxray.metrics import REGISTRY, CONTENT_TYPE
+from pymontecarlo.program.winxray.scheduler import \
+    Scheduler, WorkerJobRunner, exported_digest, INTERACTIVE, BATCH
+
+# Globals and constants variables.
+QUEUED = 'queued'
+RUNNING = 'running'
+SUSPENDED = 'suspended'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+PRIORITIES = {'interactive': INTERACTIVE, 'batch': BATCH}
+
+TOKEN_HEADER = 'X-WinXRay-Token'
+PICKLE_CONTENT_TYPE = 'application/octet-stream'
+
+DAEMON_JOBS = REGISTRY.counter('winxray_daemon_jobs_total',
+                               'Simulations submitted to the daemon')
+
+def write_token(filepath, token):
+    """
+    Writes the *token* of a daemon in a file readable only by its owner.
+    """
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as fp:
+        fp.write(token)
+
+def read_token(filepath):
+    """
+    Reads the token written by :func:`write_token`.
+    """
+    with open(filepath, 'r') as fp:
+        return fp.read().strip()
+
+def is_loopback(host):
+    """
+    Returns whether *host* is an address of the loopback interface.
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class SimulationDaemon(object):
+
+    def __init__(self, program, outputdir, capacity=None, reserved=1,
+                 preemption=None, coalesce=True, max_finished=1000,
+                 token=None, run=None):
+        """
+        Creates a daemon.
+
+        :arg program: program whose converter and worker are used
+        :arg outputdir: directory where the worker writes the results
+        :arg capacity, reserved, preemption: see
+            :class:`Scheduler <pymontecarlo.program.winxray.scheduler.Scheduler>`
+        :arg coalesce: whether identical simulations in flight, with the same
+            exported WinX-Ray options, are run only once
+        :arg max_finished: number of finished simulations whose results are
+            kept, the oldest are forgotten
+        :arg token: secret expected in the requests (default: random)
+        :arg run: function taking a job and returning its results
+            (default: :class:`WorkerJobRunner <pymontecarlo.program.winxray.scheduler.WorkerJobRunner>`)
+        """
+        if run is None:
+            run = WorkerJobRunner(program, outputdir)
+
+        self._program = program
+        self._converter = program.converter_class()
+        key = follow = None
+        if coalesce:
+            # Attached simulations get results imported with their own options
+            key = exported_digest(program)
+            follow = getattr(run, 'follow', None)
+        self._scheduler = Scheduler(run, capacity, reserved, preemption,
+                                    key, follow)
+        self._max_finished = max_finished
+        self._token = token or binascii.hexlify(os.urandom(16)).decode('ascii')
+
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict() # Identifier to job
+        self._server = None
+
+    def submit(self, options, priority=BATCH):
+        """
+        Converts *options* and submits the simulations.
+        Returns the identifiers of the simulations.
+        """
+        with self._lock:
+            optionss = self._converter.convert(options)
+        if not optionss:
+            raise ValueError('No options left after conversion of %s' % options.name)
+
+        identifiers = []
+        for ops in optionss:
+            job = self._scheduler.submit(ops, priority)
+            identifier = uuid.uuid4().hex
+            with self._lock:
+                self._jobs[identifier] = job
+            identifiers.append(identifier)
+            DAEMON_JOBS.inc()
+
+        self._forget_finished()
+        return identifiers
+
+    def _forget_finished(self):
+        with self._lock:
+            finished = [identifier for identifier, job in self._jobs.items() \
+                        if job.future.done()]
+            for identifier in finished[:max(0, len(finished) - self._max_finished)]:
+                del self._jobs[identifier]
+
+    def _get_job(self, identifier):
+        with self._lock:
+            try:
+                return self._jobs[identifier]
+            except KeyError:
+                raise KeyError('Unknown simulation: %s' % identifier)
+
+    def status(self, identifier):
+        """
+        Returns the status of a simulation as a :class:`dict`.
+        """
+        job = self._get_job(identifier)
+        future = job.future
+        active = job.leader or job # Job running the simulation
+
+        if future.cancelled():
+            state = CANCELLED
+        elif future.done():
+            state = FAILED if future.exception() is not None else DONE
+        elif active.suspended:
+            state = SUSPENDED
+        elif active.started is not None:
+            state = RUNNING
+        else:
+            state = QUEUED
+
+        status = {'id': identifier, 'name': job.options.name, 'status': state,
+                  'priority': job.priority, 'npreemptions': active.npreemptions,
+                  'coalesced': job.leader is not None,
+                  'latency_s': job.latency_s}
+        if state == FAILED:
+            status['error'] = str(future.exception())
+        return status
+
+    def results(self, identifier, timeout=None):
+        """
+        Returns the results of a simulation, waiting at most *timeout*
+        seconds. Raises the error of the simulation if it failed.
+        """
+        return self._get_job(identifier).future.result(timeout)
+
+    def cancel(self, identifier):
+        """
+        Cancels a simulation not started yet.
+        """
+        return self._scheduler.cancel(self._get_job(identifier))
+
+    def serve(self, port=0, host='127.0.0.1'):
+        """
+        Serves the API over HTTP in a background thread and returns the
+        server. Use port 0 to select a free port.
+        Raises :exc:`ValueError` if *host* is not a loopback address.
+        """
+        if self._server is not None:
+            raise RuntimeError('Daemon is already served')
+        if not is_loopback(host):
+            # Options are unpickled, which must not be exposed to the network
+            raise ValueError('Daemon can only listen on the loopback interface, not %s' % host)
+
+        daemon = self
+        path_pattern = re.compile(r'^/jobs/([0-9a-f]+)(/results)?$')
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def _reply(self, code, data, content_type='application/json'):
+                if content_type == 'application/json':
+                    data = json.dumps(data).encode('utf8')
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _authorized(self):
+                token = self.headers.get(TOKEN_HEADER, '')
+                if hmac.compare_digest(token, daemon.token):
+                    return True
+                self._reply(403, {'error': 'Invalid token'})
+                return False
+
+            def _parse(self):
+                path, _, query = self.path.partition('?')
+                params = dict(item.partition('=')[::2] \
+                              for item in query.split('&') if item)
+                return path, params
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                path, params = self._parse()
+
+                if path == '/metrics':
+                    data = REGISTRY.render().encode('utf8')
+                    return self._reply(200, data, CONTENT_TYPE)
+
+                match = path_pattern.match(path)
+                if match is None:
+                    return self._reply(404, {'error': 'Not found'})
+                identifier, results = match.groups()
+
+                try:
+                    status = daemon.status(identifier)
+                except KeyError as ex:
+                    return self._reply(404, {'error': str(ex)})
+
+                if not results:
+                    return self._reply(200, status)
+
+                timeout = float(params.get('timeout', 0.0))
+                try:
+                    results = daemon.results(identifier, timeout)
+                except Exception:
+                    status = daemon.status(identifier)
+                    if status['status'] in (FAILED, CANCELLED):
+                        return self._reply(500, status)
+                    return self._reply(202, status)
+
+                self._reply(200, precision.dumps(results), PICKLE_CONTENT_TYPE)
+
+            def do_POST(self):
+                if not self._authorized():
+                    return
+                path, params = self._parse()
+                if path != '/jobs':
+                    return self._reply(404, {'error': 'Not found'})
+
+                try:
+                    priority = PRIORITIES[params.get('priority', 'batch')]
+                except KeyError:
+                    return self._reply(400, {'error': 'Unknown priority'})
+
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    options = pickle.loads(self.rfile.read(length))
+                    identifiers = daemon.submit(options, priority)
+                except Exception as ex:
+                    return self._reply(400, {'error': str(ex)})
+
+                self._reply(200, {'ids': identifiers})
+
+            def do_DELETE(self):
+                if not self._authorized():
+                    return
+                path, _params = self._parse()
+
+                match = path_pattern.match(path)
+                if match is None or match.group(2):
+                    return self._reply(404, {'error': 'Not found'})
+
+                try:
+                    cancelled = daemon.cancel(match.group(1))
+                except KeyError as ex:
+                    return self._reply(404, {'error': str(ex)})
+                self._reply(200, {'cancelled': cancelled})
+
+            def log_message(self, format, *args):
+                logging.debug('Daemon request: ' + format, *args)
+
+        class _Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self._server = _Server((host, port), _Handler)
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  name='WinXRay daemon server')
+        thread.daemon = True
+        thread.start()
+
+        logging.info('WinX-Ray daemon listening on http://%s:%i',
+                     host, self._server.server_port)
+        return self._server
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        Stops the server and the scheduler.
+
+        :arg wait, cancel: see
+            :meth:`Scheduler.shutdown <pymontecarlo.program.winxray.scheduler.Scheduler.shutdown>`
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._scheduler.shutdown(wait, cancel)
+
+    @property
+    def token(self):
+        return self._token
+
+    @property
+    def url(self):
+        if self._server is None:
+            return None
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%i' % (host, port)
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+class DaemonClient(object):
+
+    def __init__(self, url, token, poll_interval_s=0.5):
+        """
+        Creates a client of a :class:`SimulationDaemon`.
+
+        :arg url: URL of the daemon (e.g. ``http://127.0.0.1:8765``)
+        :arg token: token of the daemon (see :func:`read_token`)
+        :arg poll_interval_s: longest wait of a single request for results
+        """
+        self._url = url.rstrip('/')
+        self._token = token
+        self._poll_interval_s = poll_interval_s
+
+    def _request(self, method, path, data=None):
+        request = urllib.request.Request(self._url + path, data, method=method)
+        request.add_header(TOKEN_HEADER, self._token)
+        if data is not None:
+            request.add_header('Content-Type', PICKLE_CONTENT_TYPE)
+
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as ex:
+            return ex.code, ex.read()
+
+    def _check(self, code, data):
+        if code == 404:
+            raise KeyError(json.loads(data.decode('utf8'))['error'])
+        if code >= 400:
+            message = json.loads(data.decode('utf8')).get('error', data)
+            raise RuntimeError('Daemon error (%i): %s' % (code, message))
+        return json.loads(data.decode('utf8'))
+
+    def submit(self, options, priority='batch'):
+        """
+        Submits *options* and returns the identifiers of the simulations.
+
+        :arg priority: ``'interactive'`` or ``'batch'``
+        """
+        code, data = self._request('POST', '/jobs?priority=%s' % priority,
+                                   pickle.dumps(options, pickle.HIGHEST_PROTOCOL))
+        return self._check(code, data)['ids']
+
+    def status(self, identifier):
+        """
+        Returns the status of a simulation as a :class:`dict`.
+        """
+        return self._check(*self._request('GET', '/jobs/%s' % identifier))
+
+    def cancel(self, identifier):
+        """
+        Cancels a simulation not started yet.
+        """
+        return self._check(*self._request('DELETE', '/jobs/%s' % identifier))['cancelled']
+
+    def results(self, identifier, timeout=None):
+        """
+        Waits for the results of a simulation and returns them.
+        Raises :exc:`RuntimeError` if the simulation failed and
+        :exc:`TimeoutError` if it is not finished within *timeout* seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            wait = self._poll_interval_s
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+
+            code, data = self._request('GET', '/jobs/%s/results?timeout=%g' % \
+                                       (identifier, wait))
+            if code == 200:
+                return precision.loads(data)
+            if code == 500:
+                status = json.loads(data.decode('utf8'))
+                raise RuntimeError('Simulation %s %s: %s' % \
+                                   (status['name'], status['status'],
+                                    status.get('error', '')))
+            if code != 202:
+                self._check(code, data)
+
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError('Simulation %s not finished' % identifier)
+
+    def metrics(self):
+        """
+        Returns the metrics of the daemon in the text format of Prometheus.
+        """
+        code, data = self._request('GET', '/metrics')
+        if code != 200:
+            self._check(code, data)
+        return data.decode('utf8')
+
+def main():
+    parser = argparse.ArgumentParser(description='WinX-Ray simulation daemon')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Loopback address to listen on')
+    parser.add_argument('--outputdir', required=True)
+    parser.add_argument('--capacity', type=int, default=None)
+    parser.add_argument('--reserved', type=int, default=1)
+    parser.add_argument('--preemption', choices=['kill', 'suspend'], default=None)
+    parser.add_argument('--no-coalesce', dest='coalesce', action='store_false',
+                        help='Run identical simulations in flight separately')
+    parser.add_argument('--token-file', default=None,
+                        help='File where the token is written (default: daemon.token in the output directory)')
+    args = parser.parse_args()
+    if not is_loopback(args.host):
+        parser.error('--host must be a loopback address')
+
+    from pymontecarlo.program.winxray.config import program
+
+    logging.basicConfig(level=logging.INFO)
+
+    if not os.path.exists(args.outputdir):
+        os.makedirs(args.outputdir)
+    token_file = args.token_file or os.path.join(args.outputdir, 'daemon.token')
+
+    daemon = SimulationDaemon(program, args.outputdir, args.capacity,
+                              args.reserved, args.preemption, args.coalesce)
+    write_token(token_file, daemon.token)
+    daemon.serve(args.port, args.host)
+    logging.info('Token written in %s', token_file)
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.shutdown(wait=False, cancel=True)
+
+if __name__ == '__main__': #pragma: no cover
+    main()
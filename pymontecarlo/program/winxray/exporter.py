@@ -21,6 +21,8 @@ __license__ = "GPL v3"
 # Standard library modules.
 import os
 import math
+import hashlib
+import tempfile
 import warnings
 from operator import itemgetter
 
@@ -48,6 +50,7 @@ from pymontecarlo.options.model import \
      RANDOM_NUMBER_GENERATOR, DIRECTION_COSINE, ENERGY_LOSS, MASS_ABSORPTION_COEFFICIENT)
 from pymontecarlo.program.exporter import \
     Exporter as _Exporter, ExporterWarning, ExporterException
+import pymontecarlo.program.winxray.tracing as tracing
 
 from winxraytools.configuration.OptionsFile import OptionsFile
 #import winxraytools.configuration.Crystal as Crystal
@@ -106,11 +109,12 @@ class Exporter(_Exporter):
             self._model_mass_absorption_coefficient
 
     def _export(self, options, dirpath, *args, **kwargs):
-        wxrops = self.export_wxroptions(options, dirpath)
+        with tracing.span('export'):
+            wxrops = self.export_wxroptions(options, dirpath)
 
-        name = options.name.replace(' ', '_') # WinXRay does not support space in name
-        filepath = os.path.join(dirpath, name + '.wxc')
-        wxrops.write(filepath)
+            name = options.name.replace(' ', '_') # WinXRay does not support space in name
+            filepath = os.path.join(dirpath, name + '.wxc')
+            wxrops.write(filepath)
 
         return filepath
 
@@ -132,6 +136,26 @@ class Exporter(_Exporter):
 
         return wxrops
 
+    def digest(self, options):
+        """
+        Returns the SHA-1 hexadecimal digest of the WinX-Ray options file
+        exported from the options.
+        The results path is not part of the digest, so the same simulation
+        exported in two different directories has the same digest.
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ExporterWarning)
+            wxrops = self.export_wxroptions(options)
+
+        fd, filepath = tempfile.mkstemp(suffix='.wxc')
+        os.close(fd)
+        try:
+            wxrops.write(filepath)
+            with open(filepath, 'rb') as fp:
+                return hashlib.sha1(fp.read()).hexdigest()
+        finally:
+            os.remove(filepath)
+
     def _export_detectors(self, options, wxrops):
         # Deactivate all detectors
         wxrops.setXrayCompute(False)
@@ -19,7 +19,14 @@ __copyright__ = "Copyright (c) 2012 Philippe T. Pinard"
 __license__ = "GPL v3"
 
 # Standard library modules.
+import os
+import shutil
+import tempfile
+import posixpath
+import logging
 from operator import mul
+from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 # Third party modules.
 import numpy as np
@@ -28,7 +35,8 @@ from pyxray.element_properties import symbol
 from pyxray.transition import from_string
 
 # Local modules.
-from pymontecarlo.program.importer import Importer as _Importer
+from pymontecarlo.program.importer import \
+    Importer as _Importer, ImporterException
 from pymontecarlo.results.result import \
     (PhotonKey,
      PhotonIntensityResult,
@@ -47,6 +55,10 @@ from pymontecarlo.options.detector import \
      ShowersStatisticsDetector,
      )
 from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.program.winxray.sharedarrays import ArrayArena
+from pymontecarlo.program.winxray.precision import get_dtype, compact
+import pymontecarlo.program.winxray.tracing as tracing
+import pymontecarlo.program.winxray.metrics as metrics
 
 from winxraytools.results.BseResults import BseResults
 from winxraytools.results.GeneralResults import GeneralResults
@@ -62,11 +74,31 @@ from winxraytools.results.XRaySpectrum import \
      TOTAL as WXRSPC_TOTAL,
      BACKGROUND as WXRSPC_BACKGROUND)
 
+# WinX-Ray result files read by the importer of each detector class
+RESULT_FILENAMES = \
+    {PhotonIntensityDetector: ['XCharIntensity_Reg1.txt'],
+     PhotonSpectrumDetector: ['XSEmi_Spectrum.txt'],
+     PhiZDetector: ['XCharPRZGen_Reg1.txt', 'XCharPRZEm_Reg1.txt'],
+     ElectronFractionDetector: ['BSEGeneral.txt'],
+     TimeDetector: ['GenResult.txt'],
+     ShowersStatisticsDetector: ['GenResult.txt'],
+     }
+
 class Importer(_Importer):
 
-    def __init__(self):
+    def __init__(self, precision=None):
+        """
+        Creates an importer.
+
+        :arg precision: precision of the spectra and phi-rho-z distributions,
+            ``'float32'`` or ``'float64'`` (default)
+            (see :mod:`precision <pymontecarlo.program.winxray.precision>`)
+        """
         _Importer.__init__(self)
 
+        self._precision = precision
+        self._dtype = get_dtype(precision)
+
         self._importers[PhotonIntensityDetector] = self._import_photon_intensity
         self._importers[PhotonSpectrumDetector] = self._import_photon_spectrum
         self._importers[PhiZDetector] = self._import_phi_z
@@ -76,8 +108,145 @@ class Importer(_Importer):
         self._importers[ShowersStatisticsDetector] = \
             self._import_showers_statistics
 
-    def _import(self, options, dirpath, *args, **kwargs):
-        return self._run_importers(options, dirpath)
+    def _import(self, options, dirpath, prefetched=None, *args, **kwargs):
+        return self._run_importers(options, dirpath, prefetched)
+
+    def _run_importers(self, options, dirpath, prefetched=None):
+        """
+        Imports the results of all detectors.
+        The results in *prefetched* (detector key to result), which were
+        already imported, are reused.
+        """
+        results = dict(prefetched or {})
+        filepaths = set()
+
+        for name, detector in options.detectors.items():
+            if name in results:
+                continue
+            if detector.__class__ not in self._importers:
+                logging.warning('No importer for detector %s (%s), skipped',
+                                name, detector.__class__.__name__)
+                continue
+            with tracing.span('import %s' % name,
+                              detector=detector.__class__.__name__):
+                results[name] = \
+                    self.import_detector(options, name, detector, dirpath)
+
+            for filename in RESULT_FILENAMES.get(detector.__class__, []):
+                filepaths.add(os.path.join(dirpath, filename))
+
+        metrics.IMPORTS.inc()
+        metrics.IMPORT_BYTES.inc(sum(os.path.getsize(filepath) \
+                                     for filepath in filepaths \
+                                     if os.path.exists(filepath)))
+
+        return results
+
+    def import_archive(self, options, zipfilepath, *args, **kwargs):
+        """
+        Imports the results from a ZIP archive created by the worker.
+        The archive is not extracted as a whole: only the result files
+        required by the detectors of the options are extracted, to a
+        temporary directory, since the WinX-Ray readers only read files from
+        a results directory.
+        """
+        with ZipFile(zipfilepath, 'r') as zipfile:
+            members = self._find_members(options, zipfile.namelist())
+            if not members:
+                raise IOError('Cannot find results in %s' % zipfilepath)
+
+            return self._import_members(options, members, zipfile.open,
+                                        *args, **kwargs)
+
+    def import_store(self, options, store, name, *args, **kwargs):
+        """
+        Imports the results of the simulation *name* from a
+        :class:`ContentStore <pymontecarlo.program.winxray.store.ContentStore>`.
+        As for :meth:`import_archive`, the required result files are
+        extracted to a temporary directory.
+        """
+        members = self._find_members(options, store.namelist(name))
+        if not members:
+            raise IOError('Cannot find results of %s in %s' % \
+                          (name, store.rootdir))
+
+        opener = lambda member: store.open(name, member)
+        return self._import_members(options, members, opener, *args, **kwargs)
+
+    def _import_members(self, options, members, opener, *args, **kwargs):
+        # Extract the selected members, the readers of winxraytools take the
+        # path of a results directory
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for member in members:
+                filepath = os.path.join(tmpdir, posixpath.basename(member))
+                with opener(member) as src, open(filepath, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+
+            return self.import_(options, tmpdir, *args, **kwargs)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def _find_members(self, options, namelist):
+        filenames = set()
+        for detector in options.detectors.values():
+            filenames.update(RESULT_FILENAMES.get(detector.__class__, []))
+
+        # Group the result files per result directory
+        resultdirs = {}
+        for member in namelist:
+            dirname, filename = posixpath.split(member)
+            if dirname:
+                resultdirs.setdefault(dirname, []).append(member)
+
+        if not resultdirs:
+            return []
+
+        members = resultdirs[sorted(resultdirs)[-1]] # Take last result folder
+        if not filenames:
+            return members
+
+        return [member for member in members \
+                if posixpath.basename(member) in filenames]
+
+    def import_archives(self, items, max_workers=None, processes=False):
+        """
+        Imports the results from several ZIP archives in parallel.
+
+        :arg items: iterable of (options, ZIP file path)
+        :arg max_workers: maximum number of archives imported simultaneously
+        :arg processes: whether to import in a pool of processes rather than
+            threads. The arrays of the results are then transferred through
+            an :class:`ArrayArena <pymontecarlo.program.winxray.sharedarrays.ArrayArena>`
+            and memory-mapped, instead of being copied.
+        :return: :class:`list` of results, in the same order as *items*
+        """
+        items = list(items)
+        max_workers = max_workers or os.cpu_count() or 1
+
+        if not processes:
+            with ThreadPoolExecutor(max_workers) as executor:
+                futures = [executor.submit(self.import_archive, options, zipfilepath) \
+                           for options, zipfilepath in items]
+                return [future.result() for future in futures]
+
+        with ArrayArena() as arena, ProcessPoolExecutor(max_workers) as executor:
+            futures = [executor.submit(_import_archive_to_arena, self.__class__,
+                                       self._precision, options, zipfilepath,
+                                       arena.dirpath, arena.min_bytes) \
+                       for options, zipfilepath in items]
+            return [arena.loads(future.result()) for future in futures]
+
+    def import_detector(self, options, name, detector, dirpath):
+        """
+        Imports the result of a single detector from the WinX-Ray results
+        directory.
+        """
+        method = self._importers.get(detector.__class__)
+        if method is None:
+            raise ImporterException("No importer for detector %s (%s)" % \
+                                    (name, detector.__class__.__name__))
+        return method(options, name, detector, dirpath)
 
     def _get_normalization_factor(self, options, detector):
         """
@@ -89,26 +258,49 @@ class Importer(_Importer):
         solidangle_sr = detector.solidangle_sr
         return 1.0 / (nelectron * solidangle_sr)
 
-    def _import_photon_intensity(self, options, name, detector, path):
+    def read_photon_intensities(self, options, detector, path):
+        """
+        Reads the characteristic intensities of all lines, normalized to
+        counts / (sr.electron).
+
+        :return: :class:`list` of (line, generated intensity, emitted
+            intensity), where the line is a :class:`str` (e.g. ``'Al Ka1'``)
+            and the intensities are (value, uncertainty)
+        """
         wxrresult = CharacteristicIntensity(path)
         factor = self._get_normalization_factor(options, detector)
 
-        # Retrieve intensities
-        intensities = {}
+        intensities = []
 
         for z, line in wxrresult.getAtomicNumberLines():
             data = wxrresult.intensities[z][line]
-            transition = from_string("%s %s" % (symbol(z), line))
 
             gnf = list(map(mul, data[WXRGENERATED], [factor] * 2))
             enf = list(map(mul, data[WXREMITTED], [factor] * 2))
 
+            intensities.append(("%s %s" % (symbol(z), line), gnf, enf))
+
+        return intensities
+
+    def _import_photon_intensity(self, options, name, detector, path):
+        # Retrieve intensities
+        intensities = {}
+
+        for line, gnf, enf in self.read_photon_intensities(options, detector, path):
+            transition = from_string(line)
             intensities[PhotonKey(transition, False, PhotonKey.P)] = gnf
             intensities[PhotonKey(transition, True, PhotonKey.P)] = enf
 
         return PhotonIntensityResult(intensities)
 
-    def _import_photon_spectrum(self, options, name, detector, path):
+    def read_photon_spectrum(self, options, detector, path):
+        """
+        Reads the total and background spectra, normalized to
+        counts / (sr.electron.eV), in the precision of the importer.
+
+        :return: total and background spectra, arrays of shape
+            ``(number of channels, 2)`` with the energy (eV) and intensity
+        """
         wxrresult = XRaySpectrum(path)
 
         # Retrieve data
@@ -123,9 +315,21 @@ class Importer(_Importer):
         total[:, 1] *= factor
         background[:, 1] *= factor
 
+        return compact(total, self._dtype), compact(background, self._dtype)
+
+    def _import_photon_spectrum(self, options, name, detector, path):
+        total, background = self.read_photon_spectrum(options, detector, path)
         return PhotonSpectrumResult(total, background)
 
-    def _import_phi_z(self, options, name, detector, path):
+    def read_phi_z(self, path):
+        """
+        Reads the generated and emitted phi-rho-z distributions of all lines,
+        in the precision of the importer.
+
+        :return: :class:`dict` of :class:`PhotonKey` to array of shape
+            ``(number of depths, 3)`` with the depth (m), phi-rho-z and its
+            uncertainty
+        """
         wxrresult = CharateristicPhirhoz(path)
 
         def _extract(data, absorption):
@@ -145,7 +349,7 @@ class Importer(_Importer):
                     dist = dist[::-1]
 
                     key = PhotonKey(transition, absorption, PhotonKey.P)
-                    distributions[key] = dist
+                    distributions[key] = compact(dist, self._dtype)
 
             return distributions
 
@@ -153,7 +357,10 @@ class Importer(_Importer):
         distributions.update(_extract(wxrresult.getPhirhozs('Generated'), False))
         distributions.update(_extract(wxrresult.getPhirhozs('Emitted'), True))
 
-        return PhiZResult(distributions)
+        return distributions
+
+    def _import_phi_z(self, options, name, detector, path):
+        return PhiZResult(self.read_phi_z(path))
 
     def _import_electron_fraction(self, options, name, detector, path):
         wxrresult = BseResults(path)
@@ -176,3 +383,9 @@ class Importer(_Importer):
         showers = wxrresult.numberElectron
 
         return ShowersStatisticsResult(showers)
+
+def _import_archive_to_arena(clasz, precision, options, zipfilepath,
+                             dirpath, min_bytes):
+    # Runs in a child process of Importer.import_archives
+    results = clasz(precision).import_archive(options, zipfilepath)
+    return ArrayArena(dirpath, min_bytes).dumps(results)
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`index` -- SQLite index of imported WinX-Ray results
+================================================================================
+
+.. module:: index
+   :synopsis: SQLite index of imported WinX-Ray results
+
+The index stores, for each simulation, the metadata of the run (beam energy,
+number of electrons, composition, take-off angle) and its scalar results
+(characteristic intensities, backscattered electron yield, simulation time)
+in a local SQLite database.
+Queries over many simulations are answered from the database, without
+reading the result files or archives.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import math
+import time
+import sqlite3
+import logging
+from operator import itemgetter
+from contextlib import contextmanager
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.options.detector import \
+    _DelimitedDetector, PhotonIntensityDetector
+
+from pymontecarlo.program.winxray.importer import Importer, RESULT_FILENAMES
+
+from winxraytools.results.BseResults import BseResults
+from winxraytools.results.GeneralResults import GeneralResults
+
+# Globals and constants variables.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    digest TEXT,
+    archive TEXT,
+    energy_eV REAL,
+    showers INTEGER,
+    nelectron INTEGER,
+    toa_deg REAL,
+    time_s REAL,
+    bse_yield REAL,
+    bse_yield_error REAL,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS runs_energy ON runs (energy_eV);
+CREATE INDEX IF NOT EXISTS runs_nelectron ON runs (nelectron);
+CREATE INDEX IF NOT EXISTS runs_digest ON runs (digest);
+
+CREATE TABLE IF NOT EXISTS compositions (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    z INTEGER NOT NULL,
+    wf REAL NOT NULL,
+    PRIMARY KEY (run_id, z)
+);
+CREATE INDEX IF NOT EXISTS compositions_z ON compositions (z, wf);
+
+CREATE TABLE IF NOT EXISTS intensities (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    line TEXT NOT NULL,
+    absorption INTEGER NOT NULL,
+    value REAL,
+    error REAL,
+    PRIMARY KEY (run_id, line, absorption)
+);
+CREATE INDEX IF NOT EXISTS intensities_line ON intensities (line, absorption, value);
+"""
+
+RUN_COLUMNS = ['name', 'digest', 'archive', 'energy_eV', 'showers', 'nelectron',
+               'toa_deg', 'time_s', 'bse_yield', 'bse_yield_error', 'created']
+
+class ResultIndex(object):
+
+    def __init__(self, filepath):
+        """
+        Opens or creates the index stored in the SQLite database *filepath*.
+        """
+        self._filepath = filepath
+
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # One connection per operation, so the index can be shared by
+        # threads
+        connection = sqlite3.connect(self._filepath, timeout=60.0)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA foreign_keys=ON')
+        try:
+            with connection: # Commit or rollback
+                yield connection
+        finally:
+            connection.close()
+
+    def add(self, options, dirpath, archive=None, digest=None):
+        """
+        Indexes the results of *options* found in the WinX-Ray result
+        directory *dirpath*.
+        An existing entry with the same name is replaced.
+
+        :arg archive: path of the archive of the results
+        :arg digest: digest of the exported options
+        """
+        general = GeneralResults(dirpath)
+
+        limits = list(options.limits.iterclass(ShowersLimit))
+        showers = limits[0].showers if limits else None
+
+        toa_deg = None
+        dets = list(map(itemgetter(1), options.detectors.iterclass(_DelimitedDetector)))
+        if dets:
+            toa_deg = math.degrees(dets[0].takeoffangle_rad)
+
+        bse_yield = bse_yield_error = None
+        if os.path.exists(os.path.join(dirpath, 'BSEGeneral.txt')):
+            bse = BseResults(dirpath)
+            bse_yield, bse_yield_error = bse.getBseYield(), bse.getBseYieldError()
+
+        composition = {}
+        for material in options.geometry.get_materials():
+            composition.update(material.composition)
+
+        # Intensities are normalized with the photon intensity detector
+        intensities = []
+        dets = list(map(itemgetter(1), options.detectors.iterclass(PhotonIntensityDetector)))
+        filenames = RESULT_FILENAMES[PhotonIntensityDetector]
+        if dets and os.path.exists(os.path.join(dirpath, filenames[0])):
+            for line, gnf, enf in \
+                    Importer().read_photon_intensities(options, dets[0], dirpath):
+                intensities.append((line, 0, gnf[0], gnf[1]))
+                intensities.append((line, 1, enf[0], enf[1]))
+
+        values = [options.name, digest, archive, options.beam.energy_eV,
+                  showers, general.numberElectron, toa_deg, general.time_s,
+                  bse_yield, bse_yield_error, time.time()]
+
+        with self._connect() as connection:
+            connection.execute('DELETE FROM runs WHERE name = ?', (options.name,))
+            cursor = connection.execute('INSERT INTO runs (%s) VALUES (%s)' % \
+                                        (', '.join(RUN_COLUMNS),
+                                         ', '.join('?' * len(RUN_COLUMNS))),
+                                        values)
+            run_id = cursor.lastrowid
+
+            connection.executemany('INSERT INTO compositions VALUES (?, ?, ?)',
+                                   [(run_id, z, wf) for z, wf in composition.items()])
+            connection.executemany('INSERT INTO intensities VALUES (?, ?, ?, ?, ?)',
+                                   [(run_id,) + row for row in intensities])
+
+        logging.debug('Indexed %s (%i intensities)', options.name, len(intensities))
+
+        return run_id
+
+    def remove(self, name):
+        """
+        Removes the simulation *name* from the index.
+        """
+        with self._connect() as connection:
+            connection.execute('DELETE FROM runs WHERE name = ?', (name,))
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+
+    def __contains__(self, name):
+        with self._connect() as connection:
+            row = connection.execute('SELECT 1 FROM runs WHERE name = ?',
+                                     (name,)).fetchone()
+        return row is not None
+
+    def get(self, name):
+        """
+        Returns the indexed data of the simulation *name* as a :class:`dict`,
+        or ``None``.
+        The composition (atomic number to weight fraction) and intensities
+        (line and absorption to (value, error)) are included.
+        """
+        with self._connect() as connection:
+            row = connection.execute('SELECT * FROM runs WHERE name = ?',
+                                     (name,)).fetchone()
+            if row is None:
+                return None
+
+            data = dict(row)
+            run_id = data.pop('id')
+
+            data['composition'] = \
+                dict(connection.execute('SELECT z, wf FROM compositions '
+                                        'WHERE run_id = ?', (run_id,)))
+
+            data['intensities'] = {}
+            for line, absorption, value, error in \
+                    connection.execute('SELECT line, absorption, value, error '
+                                       'FROM intensities WHERE run_id = ?',
+                                       (run_id,)):
+                data['intensities'][(line, bool(absorption))] = (value, error)
+
+        return data
+
+    def query(self, line=None, absorption=True, energy_eV=None, nelectron=None,
+              toa_deg=None, intensity=None, elements=None):
+        """
+        Returns the simulations matching all the specified criteria, as a
+        :class:`list` of :class:`dict` with the columns of the runs and, if
+        *line* is specified, the ``value`` and ``error`` of its intensity.
+
+        Ranges are specified as (minimum, maximum); ``None`` means no bound.
+
+        :arg line: only simulations with an intensity for this line
+            (e.g. ``'Al Ka1'``)
+        :arg absorption: emitted (``True``) or generated (``False``) intensity
+        :arg energy_eV: range of beam energies
+        :arg nelectron: range of simulated electrons
+        :arg toa_deg: range of take-off angles
+        :arg intensity: range of intensities of *line*
+        :arg elements: :class:`dict` of atomic number to range of weight
+            fraction
+
+        For example, all Al Ka1 intensities between 10 and 20 keV with more
+        than 100k electrons::
+
+            index.query('Al Ka1', energy_eV=(10e3, 20e3),
+                        nelectron=(100000, None))
+        """
+        columns = ['runs.' + column for column in RUN_COLUMNS]
+        tables = ['runs']
+        conditions = []
+        parameters = []
+
+        def _range(column, bounds):
+            if bounds is None:
+                return
+            low, high = bounds
+            if low is not None:
+                conditions.append('%s >= ?' % column)
+                parameters.append(low)
+            if high is not None:
+                conditions.append('%s <= ?' % column)
+                parameters.append(high)
+
+        if line is not None:
+            tables.append('JOIN intensities ON intensities.run_id = runs.id')
+            columns += ['intensities.value', 'intensities.error']
+            conditions += ['intensities.line = ?', 'intensities.absorption = ?']
+            parameters += [line, int(absorption)]
+            _range('intensities.value', intensity)
+        elif intensity is not None:
+            raise ValueError('A line must be specified to query intensities')
+
+        _range('runs.energy_eV', energy_eV)
+        _range('runs.nelectron', nelectron)
+        _range('runs.toa_deg', toa_deg)
+
+        for z, bounds in (elements or {}).items():
+            subconditions = ['compositions.run_id = runs.id', 'compositions.z = ?']
+            subparameters = [z]
+            low, high = bounds if bounds is not None else (None, None)
+            if low is not None:
+                subconditions.append('compositions.wf >= ?')
+                subparameters.append(low)
+            if high is not None:
+                subconditions.append('compositions.wf <= ?')
+                subparameters.append(high)
+            conditions.append('EXISTS (SELECT 1 FROM compositions WHERE %s)' % \
+                              ' AND '.join(subconditions))
+            parameters += subparameters
+
+        sql = 'SELECT %s FROM %s' % (', '.join(columns), ' '.join(tables))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY runs.energy_eV, runs.name'
+
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(sql, parameters)]
+
+    @property
+    def filepath(self):
+        return self._filepath
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`journal` -- Persistent journal of WinX-Ray simulations
+================================================================================
+
+.. module:: journal
+   :synopsis: Persistent journal of WinX-Ray simulations
+
+The journal records, for each options, the digest of the exported WinX-Ray
+options file, the state reached by the simulation and the path of its
+results archive.
+It allows an interrupted sweep to be restarted without re-launching the
+simulations which were already completed.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import json
+import logging
+import threading
+from collections import namedtuple
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+SIMULATED = 'simulated'
+IMPORTED = 'imported'
+
+JournalEntry = namedtuple('JournalEntry', ['name', 'digest', 'state', 'archive'])
+
+class SweepJournal(object):
+
+    def __init__(self, filepath):
+        """
+        Creates a journal stored in *filepath*.
+        If the file already exists, the previous entries are loaded.
+
+        Each change of state is appended as one JSON line, so that a crash
+        never corrupts the entries written before it.
+        """
+        self._filepath = filepath
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(filepath):
+            self._load()
+
+    def _load(self):
+        with open(self._filepath, 'r') as fp:
+            for lineno, line in enumerate(fp, 1):
+                line = line.strip()
+                if not line:
+                    continue
+
+                try:
+                    entry = JournalEntry(**json.loads(line))
+                except (ValueError, TypeError):
+                    logging.warning('Skipping corrupted line %i of journal %s',
+                                    lineno, self._filepath)
+                    continue
+
+                self._entries[entry.name] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def get(self, name):
+        """
+        Returns the last :class:`JournalEntry` recorded for the options
+        *name* or ``None``.
+        """
+        return self._entries.get(name)
+
+    def record(self, name, digest, state, archive=None):
+        """
+        Records that the simulation *name*, with exported options *digest*,
+        reached the specified *state* (:const:`SIMULATED` or
+        :const:`IMPORTED`).
+        """
+        if state not in (SIMULATED, IMPORTED):
+            raise ValueError('Unknown state: %s' % state)
+
+        entry = JournalEntry(name, digest, state, archive)
+
+        with self._lock:
+            with open(self._filepath, 'a') as fp:
+                fp.write(json.dumps(entry._asdict()) + '\n')
+                fp.flush()
+                os.fsync(fp.fileno())
+            self._entries[name] = entry
+
+        return entry
+
+    def lookup(self, name, digest):
+        """
+        Returns the entry of the simulation *name* if it was recorded with
+        the same *digest* and its archive still exists, ``None`` otherwise.
+        """
+        entry = self._entries.get(name)
+        if entry is None or entry.digest != digest:
+            return None
+        if entry.archive is None or not os.path.exists(entry.archive):
+            return None
+        return entry
+
+    def pending(self, items):
+        """
+        Filters the (name, digest) *items* and returns the ones which have
+        not yet been imported.
+        """
+        pending = []
+
+        for name, digest in items:
+            entry = self.lookup(name, digest)
+            if entry is None or entry.state != IMPORTED:
+                pending.append((name, digest))
+
+        return pending
+
+    @property
+    def filepath(self):
+        return self._filepath
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`kratio` -- K-ratios from WinX-Ray simulations and pure-element standards
+================================================================================
+
+.. module:: kratio
+   :synopsis: K-ratios from WinX-Ray simulations and pure-element standards
+
+The k-ratio of an X-ray line is the ratio of its emitted intensity in the
+unknown to its emitted intensity in a pure-element standard, simulated with
+the same beam energy, take-off angle and models.
+
+The intensities of the standards are memoized in a :class:`StandardsCache`
+under the key (Z, line, beam energy, take-off angle, models), so each
+standard is only simulated once for all the unknowns of a sweep, and for
+the following sweeps if the cache is saved in a file.
+A line absent from a standard is cached as :data:`ABSENT`, so the standard
+is not simulated again; a standard whose intensity is not finite (failed
+run) is not cached and is simulated again next time.
+The :class:`KRatioEngine` finds the standards needed by the unknowns,
+simulates the missing ones and computes the k-ratios of all the unknowns
+at once.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import copy
+import math
+import json
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+
+# Third party modules.
+import numpy as np
+
+from pyxray.transition import from_string
+
+# Local modules.
+from pymontecarlo.options.material import Material
+from pymontecarlo.options.detector import PhotonIntensityDetector
+from pymontecarlo.program.winxray.sweep import iter_results
+
+# Globals and constants variables.
+StandardKey = namedtuple('StandardKey',
+                         ['z', 'line', 'energy_eV', 'toa_deg', 'models'])
+
+class _Absent(object):
+
+    def __repr__(self):
+        return 'ABSENT'
+
+ABSENT = _Absent()
+
+def _toa_deg(options):
+    dets = list(options.detectors.iterclass(PhotonIntensityDetector))
+    if not dets:
+        raise ValueError('No photon intensity detector in options %s' % options.name)
+    return round(math.degrees(dets[0][1].takeoffangle_rad), 6)
+
+def standard_key(options, line):
+    """
+    Returns the :class:`StandardKey` of the standard of *line* (e.g.
+    ``'Al Ka1'``) for the unknown *options*.
+    """
+    models = tuple(sorted(str(model) for model in options.models))
+    return StandardKey(from_string(line).z, line,
+                       round(float(options.beam.energy_eV), 6),
+                       _toa_deg(options), models)
+
+def create_standard_options(options, z):
+    """
+    Returns a copy of the unknown *options* where the material of the
+    substrate is replaced by the pure element *z*.
+    """
+    standard = copy.deepcopy(options)
+    standard.name = '%s+std%i' % (options.name, z)
+    standard.geometry.body.material = Material.pure(z)
+    return standard
+
+def _elements(options):
+    # Atomic numbers of the elements of the materials of the unknown
+    return set(z for material in options.geometry.get_materials() \
+               for z in getattr(material, 'composition', {}))
+
+class StandardsCache(object):
+
+    def __init__(self, filepath=None):
+        """
+        Creates a cache of the intensities of the standards.
+        If *filepath* is not ``None``, the intensities are appended to this
+        file as JSON lines and the ones already in it are loaded.
+        """
+        self._filepath = filepath
+        self._intensities = {}
+        self._lock = threading.Lock()
+
+        if filepath is not None and os.path.exists(filepath):
+            self._load()
+
+    def _load(self):
+        with open(self._filepath, 'r') as fp:
+            for lineno, line in enumerate(fp, 1):
+                line = line.strip()
+                if not line:
+                    continue
+
+                try:
+                    data = json.loads(line)
+                    key = data['key']
+                    key = StandardKey(key[0], key[1], key[2], key[3],
+                                      tuple(key[4]))
+                    if data.get('absent', False):
+                        intensity = ABSENT
+                    else:
+                        intensity = (data['value'], data['uncertainty'])
+                except (ValueError, TypeError, KeyError, IndexError):
+                    logging.warning('Skipping corrupted line %i of standards %s',
+                                    lineno, self._filepath)
+                    continue
+
+                self._intensities[key] = intensity
+
+    def __len__(self):
+        return len(self._intensities)
+
+    def __contains__(self, key):
+        return key in self._intensities
+
+    def get(self, key):
+        """
+        Returns the emitted intensity (value, uncertainty) of the standard
+        *key*, :data:`ABSENT` if the line is absent from the standard, or
+        ``None`` if the standard is not cached.
+        """
+        return self._intensities.get(key)
+
+    def _put(self, key, data, intensity):
+        with self._lock:
+            if self._filepath is not None:
+                with open(self._filepath, 'a') as fp:
+                    data = dict(data, key=list(key))
+                    fp.write(json.dumps(data) + '\n')
+            self._intensities[key] = intensity
+
+    def put(self, key, value, uncertainty):
+        """
+        Stores the emitted intensity of the standard *key*.
+        """
+        self._put(key, {'value': value, 'uncertainty': uncertainty},
+                  (value, uncertainty))
+
+    def put_absent(self, key):
+        """
+        Stores that the line of the standard *key* is absent from its
+        simulation.
+        """
+        self._put(key, {'absent': True}, ABSENT)
+
+    @property
+    def filepath(self):
+        return self._filepath
+
+class KRatioEngine(object):
+
+    def __init__(self, key, lines, run, cache=None, max_inflight=None):
+        """
+        Creates an engine computing the k-ratios of unknowns.
+
+        :arg key: key of the :class:`PhotonIntensityDetector` in the results
+        :arg lines: X-ray lines (e.g. ``['Al Ka1', 'Cu La1']``)
+        :arg run: function taking an options and returning its results,
+            used to simulate the standards (see
+            :func:`worker_runner <pymontecarlo.program.winxray.sweep.worker_runner>`)
+        :arg cache: :class:`StandardsCache` (default: new cache in memory)
+        :arg max_inflight: maximum number of standards simulated
+            concurrently (see
+            :func:`iter_results <pymontecarlo.program.winxray.sweep.iter_results>`)
+        """
+        self._key = key
+        self._lines = list(lines)
+        self._run = run
+        self._cache = cache if cache is not None else StandardsCache()
+        self._max_inflight = max_inflight
+
+        self.nsimulations = 0
+
+    def missing_standards(self, optionss):
+        """
+        Returns the standards needed by the unknowns *optionss* which are not
+        in the cache, as a :class:`list` of (options of the standard,
+        :class:`StandardKey` of its lines).
+        All the lines of an element come from the same simulation.
+        Only the elements present in the unknown are considered.
+        """
+        standards = OrderedDict()
+
+        for options in optionss:
+            zs = _elements(options)
+            for line in self._lines:
+                key = standard_key(options, line)
+                if key.z not in zs or key in self._cache:
+                    continue
+
+                condition = (key.z,) + key[2:]
+                if condition not in standards:
+                    standards[condition] = \
+                        (create_standard_options(options, key.z), OrderedDict())
+                standards[condition][1][key] = None
+
+        return [(options, list(keys)) for options, keys in standards.values()]
+
+    def simulate_standards(self, optionss):
+        """
+        Simulates the standards needed by the unknowns *optionss* which are
+        not in the cache and stores their intensities.
+        Returns the number of simulations.
+        """
+        standards = self.missing_standards(optionss)
+        if not standards:
+            return 0
+
+        logging.debug('Simulating %i standard(s)', len(standards))
+        keys = dict((options.name, keys) for options, keys in standards)
+
+        for options, results in iter_results([options for options, _ in standards],
+                                             self._run, self._max_inflight):
+            result = results[self._key]
+            for key in keys[options.name]:
+                try:
+                    value, uncertainty = result.intensity(key.line, absorption=True)
+                except (ValueError, KeyError):
+                    logging.debug('No intensity of %s in standard %s',
+                                  key.line, options.name)
+                    self._cache.put_absent(key)
+                    continue
+
+                # Failed standards are simulated again next time
+                if not (np.isfinite(value) and np.isfinite(uncertainty)):
+                    logging.warning('Invalid intensity of %s in standard %s',
+                                    key.line, options.name)
+                    continue
+                self._cache.put(key, float(value), float(uncertainty))
+
+        self.nsimulations += len(standards)
+        return len(standards)
+
+    def kratios(self, items):
+        """
+        Returns the k-ratios of the unknowns and their uncertainties, as two
+        arrays of shape ``(number of unknowns, number of lines)``.
+        The missing standards are simulated first.
+        Lines absent from an unknown or a standard give NaN.
+
+        :arg items: iterable of (options, results) of the unknowns
+        """
+        items = list(items)
+        self.simulate_standards([options for options, _ in items])
+
+        shape = (len(items), len(self._lines))
+        unknowns = np.full(shape + (2,), np.nan)
+        standards = np.full(shape + (2,), np.nan)
+
+        for i, (options, results) in enumerate(items):
+            result = results[self._key]
+            for j, line in enumerate(self._lines):
+                try:
+                    unknowns[i, j] = result.intensity(line, absorption=True)
+                except (ValueError, KeyError):
+                    pass
+
+                intensity = self._cache.get(standard_key(options, line))
+                if intensity is not None and intensity is not ABSENT:
+                    standards[i, j] = intensity
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kratios = unknowns[..., 0] / standards[..., 0]
+            relunc = np.hypot(unknowns[..., 1] / unknowns[..., 0],
+                              standards[..., 1] / standards[..., 0])
+            uncertainties = np.abs(kratios) * relunc
+
+        return kratios, uncertainties
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def lines(self):
+        return list(self._lines)
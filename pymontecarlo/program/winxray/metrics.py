@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`metrics` -- Aggregate metrics of the WinX-Ray execution
+================================================================================
+
+.. module:: metrics
+   :synopsis: Aggregate metrics of the WinX-Ray execution
+
+Counters and gauges updated by the worker, the importer and the sweep
+runner (queued and running simulations, completed runs, simulated
+electrons, imported and archived bytes, journal hits).
+Updating a metric only takes a lock and an addition, so the metrics are
+always collected.
+
+The metrics are exported in the Prometheus text format, either written to a
+file (e.g. for the textfile collector of the node exporter) or served over
+HTTP.
+Rates, such as the number of runs or electrons per second, are computed by
+Prometheus from the counters.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class _Metric(object):
+
+    TYPE = None
+
+    def __init__(self, name, help):
+        self._name = name
+        self._help = help
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self._name, self._help),
+                 '# TYPE %s %s' % (self._name, self.TYPE),
+                 '%s %s' % (self._name, repr(float(self.value)))]
+        return '\n'.join(lines)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def value(self):
+        with self._lock:
+            return self._value
+
+class Counter(_Metric):
+
+    TYPE = 'counter'
+
+    def inc(self, amount=1.0):
+        if amount < 0:
+            raise ValueError('Counters can only increase')
+        with self._lock:
+            self._value += amount
+
+class Gauge(_Metric):
+
+    TYPE = 'gauge'
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        """
+        Creates an empty registry.
+        """
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _register(self, clasz, name, help):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = clasz(name, help)
+            elif not isinstance(metric, clasz):
+                raise ValueError('Metric %s is already registered as a %s' % \
+                                 (name, metric.TYPE))
+            return metric
+
+    def counter(self, name, help=''):
+        """
+        Returns the counter *name*, creating it if needed.
+        """
+        return self._register(Counter, name, help)
+
+    def gauge(self, name, help=''):
+        """
+        Returns the gauge *name*, creating it if needed.
+        """
+        return self._register(Gauge, name, help)
+
+    def __getitem__(self, name):
+        return self._metrics[name]
+
+    def __contains__(self, name):
+        return name in self._metrics
+
+    def render(self):
+        """
+        Returns all the metrics in the Prometheus text format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(metric.render() + '\n' for metric in metrics)
+
+    def write(self, filepath):
+        """
+        Writes the metrics in *filepath*.
+        The file is replaced atomically, so it is never read half written.
+        """
+        dirpath = os.path.dirname(os.path.abspath(filepath))
+        fd, tmpfilepath = tempfile.mkstemp(dir=dirpath, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(self.render())
+            os.chmod(tmpfilepath, 0o644) # Readable by node_exporter
+            os.replace(tmpfilepath, filepath)
+        finally:
+            if os.path.exists(tmpfilepath):
+                os.remove(tmpfilepath)
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serves the metrics over HTTP in a background thread and returns the
+        server. Call ``shutdown()`` on the server to stop it.
+        Use port 0 to select a free port (see ``server.server_port``).
+        """
+        registry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                data = registry.render().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logging.debug('Metrics request: ' + format, *args)
+
+        class _Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        server = _Server((host, port), _Handler)
+        thread = threading.Thread(target=server.serve_forever,
+                                  name='WinXRay metrics server')
+        thread.daemon = True
+        thread.start()
+
+        logging.debug('Serving metrics on http://%s:%i/metrics',
+                      host, server.server_port)
+        return server
+
+REGISTRY = MetricsRegistry()
+
+QUEUED = REGISTRY.gauge('winxray_queued_simulations',
+                        'Simulations waiting to be started')
+ACTIVE_PROCESSES = REGISTRY.gauge('winxray_active_processes',
+                                  'Running WinX-Ray processes')
+RUNS = REGISTRY.counter('winxray_runs_total',
+                        'Completed WinX-Ray simulations')
+FAILED_RUNS = REGISTRY.counter('winxray_failed_runs_total',
+                               'Failed WinX-Ray simulations')
+ELECTRONS = REGISTRY.counter('winxray_electrons_total',
+                             'Simulated electrons')
+SIMULATION_SECONDS = REGISTRY.counter('winxray_simulation_seconds_total',
+                                      'Simulation time reported by WinX-Ray')
+IMPORTS = REGISTRY.counter('winxray_imports_total',
+                           'Imported result directories')
+IMPORT_BYTES = REGISTRY.counter('winxray_import_bytes_total',
+                                'Bytes of result files imported')
+ARCHIVE_BYTES = REGISTRY.counter('winxray_archive_bytes_total',
+                                 'Bytes of results archived')
+CACHE_HITS = REGISTRY.counter('winxray_cache_hits_total',
+                              'Simulations skipped, results found in the journal')
+CACHE_MISSES = REGISTRY.counter('winxray_cache_misses_total',
+                                'Simulations not found in the journal')
+COALESCED = REGISTRY.counter('winxray_coalesced_simulations_total',
+                             'Simulations attached to an identical simulation in flight')
+
+_server = None
+_server_lock = threading.Lock()
+
+def serve_once(port, host='127.0.0.1'):
+    """
+    Starts serving the default registry, unless it is already served by
+    this process, and returns the server.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = REGISTRY.serve(port, host)
+        return _server
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`phiz` -- Derived quantities of phi-rho-z distributions
+================================================================================
+
+.. module:: phiz
+   :synopsis: Derived quantities of phi-rho-z distributions
+
+The phi-rho-z distributions of all the lines of a simulation, or of a whole
+sweep, are stacked in arrays of shape ``(..., number of lines, number of
+depths)``.
+The derived quantities are computed for all the distributions at once:
+
+  * integrals of the generated and emitted distributions;
+  * mean depth of production;
+  * absorption correction f(chi), the ratio of the emitted to the generated
+    integrals;
+  * depths above which a fraction of the X-rays is produced.
+
+Each quantity is computed on first use and kept in the :class:`PhiZStack`.
+:func:`get_stack` keeps the stack of each :class:`PhiZResult`, so a
+quantification loop does not derive the quantities again for the same
+results.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import weakref
+import threading
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+
+# Globals and constants variables.
+
+def resample(dist, depths_m):
+    """
+    Returns the values and uncertainties of a distribution *dist* (array of
+    (z, value, uncertainty)) at the depths *depths_m* (positive).
+    Below the deepest point, the distribution is zero.
+    """
+    dist = np.asarray(dist, dtype=float)
+    depths = np.abs(dist[:, 0])
+    order = np.argsort(depths)
+    values = np.interp(depths_m, depths[order], dist[order, 1], right=0.0)
+    uncertainties = np.interp(depths_m, depths[order], dist[order, 2], right=0.0)
+    return values, uncertainties
+
+def trapezoid_weights(depths_m):
+    """
+    Returns the weights of the trapezoidal integration over *depths_m*
+    (along the last axis).
+    """
+    depths_m = np.asarray(depths_m, dtype=float)
+    steps = np.diff(depths_m, axis=-1) / 2.0
+    weights = np.zeros(depths_m.shape)
+    weights[..., :-1] += steps
+    weights[..., 1:] += steps
+    return weights
+
+def line_family(line):
+    """
+    Returns the family of an X-ray line, e.g. ``'Al K'`` for ``'Al Ka1'``.
+    """
+    symbol, name = line.split()
+    return '%s %s' % (symbol, name[0].upper())
+
+def _get(result, line, absorption):
+    try:
+        return np.asarray(result.get(line, absorption=absorption), dtype=float)
+    except (ValueError, KeyError):
+        return None
+
+def _get_distribution(result, line, absorption):
+    dist = _get(result, line, absorption)
+    if dist is not None or absorption:
+        return dist
+
+    # WinX-Ray only gives the generated distribution of each family (shell).
+    # It is scaled to the line with the emitted distribution of the line:
+    # at the surface, nothing is absorbed, so both are equal.
+    family = _get(result, line_family(line), False)
+    emitted = _get(result, line, True)
+    if family is None or emitted is None:
+        return family
+
+    surface_m = np.min(np.abs(emitted[:, 0]))
+    emitted_value = emitted[np.argmin(np.abs(emitted[:, 0])), 1]
+    family_value = resample(family, [surface_m])[0][0]
+    if family_value <= 0.0 or emitted_value <= 0.0:
+        return family
+
+    family = family.copy()
+    family[:, 1:] *= emitted_value / family_value
+    return family
+
+def _stack_distributions(results, lines, ndepth=None):
+    # Returns the common depths and an array of shape (len(results),
+    # len(lines), 2 (generated, emitted), 2 (value, uncertainty), depths)
+    dists = []
+    for result in results:
+        for line in lines:
+            for absorption in (False, True):
+                dists.append(_get_distribution(result, line, absorption))
+
+    depths = [np.sort(np.abs(dist[:, 0])) for dist in dists if dist is not None]
+    if not depths:
+        raise ValueError('No distribution of lines %s' % ', '.join(lines))
+
+    if ndepth is None and \
+            all(len(d) == len(depths[0]) and np.allclose(d, depths[0]) \
+                for d in depths):
+        depths_m = depths[0]
+    else:
+        if ndepth is None:
+            ndepth = max(len(d) for d in depths)
+        depths_m = np.linspace(0.0, max(d[-1] for d in depths), ndepth)
+
+    data = np.zeros((len(dists), 2, len(depths_m)))
+    for i, dist in enumerate(dists):
+        if dist is not None:
+            data[i] = resample(dist, depths_m)
+
+    return depths_m, data.reshape(len(results), len(lines), 2, 2, len(depths_m))
+
+def _take(array, index):
+    return np.take_along_axis(array, index[..., np.newaxis], axis=-1)[..., 0]
+
+class PhiZStack(object):
+
+    def __init__(self, lines, depths_m, generated, emitted,
+                 generated_unc=None, emitted_unc=None):
+        """
+        Creates a stack of phi-rho-z distributions.
+
+        :arg lines: X-ray lines (e.g. ``'Al Ka1'``), second to last axis of
+            the arrays
+        :arg depths_m: positive and increasing depths, array of shape
+            ``(number of depths,)`` or broadcastable to the distributions
+        :arg generated: generated distributions, array of shape
+            ``(..., len(lines), number of depths)``. The leading axes are
+            free, e.g. one per simulation of a sweep.
+        :arg emitted: emitted distributions, same shape
+        :arg generated_unc: uncertainties of the generated distributions
+            (default: zeros)
+        :arg emitted_unc: uncertainties of the emitted distributions
+            (default: zeros)
+        """
+        self._lines = list(lines)
+
+        generated = np.asarray(generated, dtype=float)
+        emitted = np.asarray(emitted, dtype=float)
+        if generated.shape != emitted.shape:
+            raise ValueError('Generated and emitted distributions must have the same shape')
+        if generated.ndim < 2 or generated.shape[-2] != len(self._lines):
+            raise ValueError('Second to last axis must have %i lines' % len(self._lines))
+
+        if generated_unc is None:
+            generated_unc = np.zeros(generated.shape)
+        if emitted_unc is None:
+            emitted_unc = np.zeros(emitted.shape)
+
+        self._depths_m = np.broadcast_to(np.asarray(depths_m, dtype=float),
+                                         generated.shape)
+        self._distributions = {False: (generated, np.asarray(generated_unc, dtype=float)),
+                               True: (emitted, np.asarray(emitted_unc, dtype=float))}
+
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_result(cls, result, lines, ndepth=None):
+        """
+        Creates a stack from a :class:`PhiZResult`, with arrays of shape
+        ``(len(lines), number of depths)``.
+        If the distributions do not share the same depths, they are
+        resampled on *ndepth* depths (default: the largest number of points
+        of a distribution) down to the deepest point.
+        Missing distributions are zero.
+        """
+        depths_m, data = _stack_distributions([result], lines, ndepth)
+        return cls._from_data(lines, depths_m, data[0])
+
+    @classmethod
+    def from_results(cls, items, key, lines, ndepth=None):
+        """
+        Creates a stack of the distributions of a sweep, with arrays of shape
+        ``(number of simulations, len(lines), number of depths)`` on common
+        depths.
+
+        :arg items: iterable of (options, results)
+        :arg key: key of the :class:`PhiZDetector` in the results
+        :arg lines: X-ray lines (e.g. ``['Al Ka1', 'Cu La1']``)
+        :arg ndepth: see :meth:`from_result`
+        """
+        resultss = [results[key] for _options, results in items]
+        depths_m, data = _stack_distributions(resultss, lines, ndepth)
+        return cls._from_data(lines, depths_m, data)
+
+    @classmethod
+    def _from_data(cls, lines, depths_m, data):
+        # Axes: ..., line, generated/emitted, value/uncertainty, depth
+        return cls(lines, depths_m,
+                   data[..., 0, 0, :], data[..., 1, 0, :],
+                   data[..., 0, 1, :], data[..., 1, 1, :])
+
+    def __repr__(self):
+        return '<%s(lines=%i, shape=%s)>' % (self.__class__.__name__,
+                                             len(self._lines), self.shape)
+
+    def _cached(self, name, func):
+        with self._lock:
+            if name not in self._cache:
+                self._cache[name] = func()
+            return self._cache[name]
+
+    def _weights(self):
+        return self._cached('weights', lambda: trapezoid_weights(self._depths_m))
+
+    def _cumulative(self, absorption):
+        def _compute():
+            values, _ = self._distributions[absorption]
+            depths_m = self._depths_m
+            areas = (values[..., 1:] + values[..., :-1]) / 2.0 * \
+                np.diff(depths_m, axis=-1)
+            cumulative = np.concatenate([np.zeros(areas.shape[:-1] + (1,)),
+                                         np.cumsum(areas, axis=-1)], axis=-1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return cumulative / cumulative[..., -1:]
+        return self._cached(('cumulative', absorption), _compute)
+
+    def index(self, line):
+        """
+        Returns the index of *line* along the line axis.
+        """
+        return self._lines.index(line)
+
+    def distribution(self, absorption=True):
+        """
+        Returns the distributions and their uncertainties.
+        """
+        return self._distributions[absorption]
+
+    def integral(self, absorption=True):
+        """
+        Returns the integrals of the distributions and their uncertainties,
+        as arrays of shape ``(..., len(lines))``.
+        The uncertainties of the depths are assumed independent.
+        """
+        def _compute():
+            values, uncertainties = self._distributions[absorption]
+            weights = self._weights()
+            return (np.sum(weights * values, axis=-1),
+                    np.sqrt(np.sum((weights * uncertainties) ** 2, axis=-1)))
+        return self._cached(('integral', absorption), _compute)
+
+    def mean_depth_m(self, absorption=True):
+        """
+        Returns the mean depth of production, shape ``(..., len(lines))``.
+        """
+        def _compute():
+            values, _ = self._distributions[absorption]
+            weights = self._weights()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.sum(weights * self._depths_m * values, axis=-1) / \
+                    self.integral(absorption)[0]
+        return self._cached(('mean_depth', absorption), _compute)
+
+    def fchi(self):
+        """
+        Returns the absorption correction f(chi), the ratio of the emitted to
+        the generated intensities, and its uncertainty.
+        """
+        def _compute():
+            emitted, emitted_unc = self.integral(True)
+            generated, generated_unc = self.integral(False)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fchi = emitted / generated
+                unc = np.abs(fchi) * np.hypot(emitted_unc / emitted,
+                                              generated_unc / generated)
+            return fchi, unc
+        return self._cached('fchi', _compute)
+
+    def depth_percentile_m(self, fraction, absorption=False):
+        """
+        Returns the depth above which *fraction* (between 0 and 1) of the
+        X-rays is produced, shape ``(..., len(lines))``.
+        Empty distributions give NaN.
+        """
+        if not 0.0 <= fraction <= 1.0:
+            raise ValueError('Fraction must be between 0 and 1')
+
+        cumulative = self._cumulative(absorption)
+        depths_m = self._depths_m
+        if cumulative.shape[-1] < 2:
+            return np.full(cumulative.shape[:-1], np.nan)
+
+        above = np.argmax(cumulative >= fraction, axis=-1)
+        above = np.clip(above, 1, cumulative.shape[-1] - 1)
+        below = above - 1
+
+        c0, c1 = _take(cumulative, below), _take(cumulative, above)
+        d0, d1 = _take(depths_m, below), _take(depths_m, above)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(c1 > c0, (fraction - c0) / (c1 - c0), 0.0)
+            depth_m = d0 + np.clip(ratio, 0.0, 1.0) * (d1 - d0)
+
+        return np.where(np.isfinite(cumulative[..., -1]), depth_m, np.nan)
+
+    @property
+    def lines(self):
+        return list(self._lines)
+
+    @property
+    def depths_m(self):
+        return self._depths_m
+
+    @property
+    def shape(self):
+        return self._depths_m.shape
+
+_stacks = weakref.WeakKeyDictionary()
+_stacks_lock = threading.Lock()
+
+def get_stack(result, lines):
+    """
+    Returns the :class:`PhiZStack` of the *lines* of a :class:`PhiZResult`.
+    The stack is kept as long as the result exists, so its derived
+    quantities are only computed once.
+    """
+    lines = tuple(lines)
+    with _stacks_lock:
+        stacks = _stacks.setdefault(result, {})
+        if lines not in stacks:
+            stacks[lines] = PhiZStack.from_result(result, lines)
+        return stacks[lines]
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`precision` -- Compact storage of the imported distributions
+================================================================================
+
+.. module:: precision
+   :synopsis: Compact storage of the imported distributions
+
+WinX-Ray writes its results as text with about 6 significant digits, which
+single precision (:data:`FLOAT32`, 7 digits) holds without loss.
+Storing the spectra and phi-rho-z distributions in single precision halves
+the memory and disk space they use.
+
+The arrays can also be compressed losslessly when results are pickled
+(e.g. spilled to disk by a sweep): the bytes of the floating point values
+are shuffled, so that the bytes of same significance, which vary little
+from one value to the next, are contiguous, and then compressed with zlib.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import io
+import zlib
+import pickle
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+
+# Globals and constants variables.
+FLOAT32 = 'float32'
+FLOAT64 = 'float64'
+
+MAGIC = b'WXRZ\x01'
+
+def get_dtype(precision=None):
+    """
+    Returns the NumPy data type of a *precision* (:data:`FLOAT32`,
+    :data:`FLOAT64` or ``None`` for double precision).
+    """
+    if precision is None:
+        precision = FLOAT64
+    if precision not in (FLOAT32, FLOAT64):
+        raise ValueError('Unknown precision: %s' % precision)
+    return np.dtype(precision)
+
+def compact(array, dtype=None):
+    """
+    Returns *array* as a floating point array of *dtype*, without copy if
+    it already has this data type.
+    """
+    return np.asarray(array, dtype=dtype or np.float64)
+
+def compress_array(array, compresslevel=6):
+    """
+    Returns the shuffled and compressed bytes of a numeric *array*.
+    """
+    array = np.ascontiguousarray(array)
+    itemsize = array.dtype.itemsize
+    data = array.view(np.uint8).reshape(-1, itemsize).T.tobytes()
+    return zlib.compress(data, compresslevel)
+
+def decompress_array(data, dtype, shape):
+    """
+    Returns the array of *dtype* and *shape* compressed by
+    :func:`compress_array`.
+    """
+    dtype = np.dtype(dtype)
+    data = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    data = data.reshape(dtype.itemsize, -1).T.copy()
+    return data.view(dtype).reshape(shape)
+
+class _CompressingPickler(pickle.Pickler):
+
+    def __init__(self, fp, compresslevel):
+        pickle.Pickler.__init__(self, fp, pickle.HIGHEST_PROTOCOL)
+        self._compresslevel = compresslevel
+
+    def persistent_id(self, obj):
+        if type(obj) is np.ndarray and obj.dtype.kind in 'fiuc' and obj.size:
+            return (obj.dtype.str, obj.shape,
+                    compress_array(obj, self._compresslevel))
+        return None
+
+class _CompressingUnpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        dtype, shape, data = pid
+        return decompress_array(data, dtype, shape)
+
+def dumps(obj, compresslevel=6):
+    """
+    Pickles *obj*, compressing its numeric arrays.
+    """
+    fp = io.BytesIO()
+    fp.write(MAGIC)
+    _CompressingPickler(fp, compresslevel).dump(obj)
+    return fp.getvalue()
+
+def loads(data):
+    """
+    Unpickles *data* created by :func:`dumps` or by :func:`pickle.dumps`.
+    """
+    if not data.startswith(MAGIC):
+        return pickle.loads(data)
+    fp = io.BytesIO(data)
+    fp.seek(len(MAGIC))
+    return _CompressingUnpickler(fp).load()
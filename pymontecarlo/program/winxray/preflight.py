@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`preflight` -- Validation of a sweep before any simulation starts
+================================================================================
+
+.. module:: preflight
+   :synopsis: Validation of a sweep before any simulation starts
+
+Errors in the options of a sweep (missing showers limit, detectors with
+different openings, unsupported models, ...) or in the settings of the
+program are normally only raised when the worker reaches the simulation,
+possibly hours after the sweep was started.
+
+:func:`preflight` converts and exports every options in memory, in a pool
+of processes, without running WinX-Ray, and collects all the errors and
+warnings in a :class:`PreflightReport`, with an estimate of the size of the
+results written by WinX-Ray.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import warnings
+from collections import namedtuple, OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.options.detector import \
+    (PhiZDetector,
+     PhotonIntensityDetector,
+     PhotonSpectrumDetector,
+     ElectronFractionDetector,
+     )
+from pymontecarlo.program.winxray.config import program as winxray_program
+
+# Globals and constants variables.
+ERROR = 'error'
+WARNING = 'warning'
+
+Issue = namedtuple('Issue', ['name', 'severity', 'message'])
+
+# Size of the files written by WinX-Ray, measured on the reference
+# simulation of the test data (Al, 10 keV)
+BASE_BYTES = 8 * 1024 # General results and options file
+XRAY_BYTES = 900 * 1024 # Written as soon as X-rays are computed
+SPECTRUM_BYTES_PER_CHANNEL = 58
+PHIZ_BYTES_PER_FILM_ELEMENT = 90
+BSE_BYTES = 20 * 1024
+
+def _spectrum_channels(options):
+    # Same channel width as Exporter._detector_photon_spectrum
+    energy_eV = options.beam.energy_eV
+    dets = list(options.detectors.iterclass(PhotonSpectrumDetector))
+    channels = dets[0][1].channels
+    ev_per_channel = energy_eV / channels
+    if ev_per_channel < 10:
+        return energy_eV // 5
+    elif ev_per_channel < 20:
+        return energy_eV // 10
+    elif ev_per_channel < 40:
+        return energy_eV // 20
+    else:
+        return energy_eV // 40
+
+def estimate_output_bytes(options):
+    """
+    Returns an estimate of the number of bytes written by WinX-Ray for
+    converted *options*.
+    """
+    size = BASE_BYTES
+
+    xray_classes = (PhiZDetector, PhotonIntensityDetector, PhotonSpectrumDetector)
+    if any(list(options.detectors.iterclass(clasz)) for clasz in xray_classes):
+        size += XRAY_BYTES
+
+    if list(options.detectors.iterclass(PhotonSpectrumDetector)):
+        size += SPECTRUM_BYTES_PER_CHANNEL * _spectrum_channels(options)
+
+    dets = list(options.detectors.iterclass(PhiZDetector))
+    if dets:
+        nelements = len(set(z for material in options.geometry.get_materials() \
+                            for z in material.composition))
+        size += PHIZ_BYTES_PER_FILM_ELEMENT * dets[0][1].channels * nelements
+
+    if list(options.detectors.iterclass(ElectronFractionDetector)):
+        size += BSE_BYTES
+
+    return int(size)
+
+def check_options(converter_class, exporter_class, options):
+    """
+    Converts and exports *options* in memory and returns the list of
+    :class:`Issue` and the estimated size of the results.
+    Warnings are collected, so this function must not be called from
+    several threads at the same time.
+    """
+    issues = []
+    size = 0
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+
+        try:
+            converted = converter_class().convert(options)
+        except Exception as ex:
+            issues.append(Issue(options.name, ERROR, 'Conversion failed: %s' % ex))
+            converted = []
+        else:
+            if not converted:
+                issues.append(Issue(options.name, ERROR,
+                                    'No options left after conversion'))
+
+        exporter = exporter_class()
+        for ops in converted:
+            try:
+                exporter.export_wxroptions(ops)
+            except Exception as ex:
+                issues.append(Issue(ops.name, ERROR, 'Export failed: %s' % ex))
+            else:
+                size += estimate_output_bytes(ops)
+
+    for warning in caught:
+        issues.append(Issue(options.name, WARNING, str(warning.message)))
+
+    return issues, size
+
+class PreflightReport(object):
+
+    def __init__(self, noptions, issues, output_bytes):
+        """
+        Result of the validation of a sweep.
+
+        :arg noptions: number of options validated
+        :arg issues: :class:`list` of :class:`Issue`
+        :arg output_bytes: estimated size of the results written by WinX-Ray
+        """
+        self._noptions = noptions
+        self._issues = list(issues)
+        self._output_bytes = output_bytes
+
+    def __repr__(self):
+        return '<%s(%i options, %i errors, %i warnings)>' % \
+            (self.__class__.__name__, self._noptions,
+             len(self.errors), len(self.warnings))
+
+    def __str__(self):
+        lines = ['%i options: %i error(s), %i warning(s), ~%.1f MiB of results' % \
+                 (self._noptions, len(self.errors), len(self.warnings),
+                  self._output_bytes / 1024.0 ** 2)]
+
+        # Same message for several options on a single line
+        for severity in (ERROR, WARNING):
+            names = OrderedDict()
+            for issue in self._issues:
+                if issue.severity == severity:
+                    names.setdefault(issue.message, []).append(issue.name)
+
+            for message, issue_names in names.items():
+                shown = ', '.join(issue_names[:3])
+                if len(issue_names) > 3:
+                    shown += ', ... (%i options)' % len(issue_names)
+                lines.append('%s: %s [%s]' % (severity.upper(), message, shown))
+
+        return '\n'.join(lines)
+
+    @property
+    def ok(self):
+        """
+        Whether no error was found.
+        """
+        return not self.errors
+
+    @property
+    def noptions(self):
+        return self._noptions
+
+    @property
+    def issues(self):
+        return list(self._issues)
+
+    @property
+    def errors(self):
+        return [issue for issue in self._issues if issue.severity == ERROR]
+
+    @property
+    def warnings(self):
+        return [issue for issue in self._issues if issue.severity == WARNING]
+
+    @property
+    def output_bytes(self):
+        return self._output_bytes
+
+def preflight(optionss, program=None, max_workers=None, processes=True):
+    """
+    Validates a sweep and returns a :class:`PreflightReport`.
+
+    :arg optionss: options of the sweep
+    :arg program: program whose settings (:meth:`validate`), converter and
+        exporter are used (default: WinX-Ray)
+    :arg max_workers: number of processes (default: number of CPUs)
+    :arg processes: whether to validate in a pool of processes. Otherwise,
+        the options are validated one after the other in this thread.
+    """
+    if program is None:
+        program = winxray_program
+
+    optionss = list(optionss)
+    issues = []
+
+    try:
+        program.validate()
+    except AssertionError as ex:
+        issues.append(Issue(program.name, ERROR, str(ex)))
+
+    counts = Counter(options.name for options in optionss)
+    for name, count in counts.items():
+        if count > 1:
+            issues.append(Issue(name, ERROR, 'Name used by %i options' % count))
+
+    args = (program.converter_class, program.exporter_class)
+    if processes and len(optionss) > 1:
+        max_workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(optionss) // (4 * max_workers))
+        with ProcessPoolExecutor(max_workers) as executor:
+            results = list(executor.map(check_options,
+                                        [args[0]] * len(optionss),
+                                        [args[1]] * len(optionss),
+                                        optionss, chunksize=chunksize))
+    else:
+        results = [check_options(args[0], args[1], options) \
+                   for options in optionss]
+
+    output_bytes = 0
+    for options_issues, size in results:
+        issues.extend(options_issues)
+        output_bytes += size
+
+    return PreflightReport(len(optionss), issues, output_bytes)
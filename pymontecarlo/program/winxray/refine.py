@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`refine` -- Adaptive refinement of sweeps over energy and composition
+================================================================================
+
+.. module:: refine
+   :synopsis: Adaptive refinement of sweeps over energy and composition
+
+Instead of a dense uniform grid, the :class:`AdaptiveSweep` starts from a
+coarse grid of beam energies and weight fractions and only adds points
+where the intensities are poorly described by linear interpolation
+between the existing points (e.g. near an overvoltage threshold).
+
+At each iteration, the interpolation error in the middle of each interval
+of each axis is estimated from the second divided difference of the
+intensities (as in :mod:`surrogate`).
+Intervals where the error exceeds the relative tolerance, for any line and
+any value of the other parameters, are split in two, and the new points of
+the grid are simulated.
+An interval is not split when its error is within the statistical
+uncertainty of the intensities, since more points would only resolve
+noise.
+
+The grid remains a tensor product of the axes, so the results can be used
+directly by :class:`PhotonIntensityCube <pymontecarlo.program.winxray.cube.PhotonIntensityCube>`
+and :class:`IntensitySurrogate <pymontecarlo.program.winxray.surrogate.IntensitySurrogate>`.
+The refinement is therefore per axis, not per cell: a value added to an
+axis is simulated for all the values of the other axes, even where the
+intensities are already well described.
+Splitting one interval of an axis costs as many simulations as the product
+of the lengths of the other axes, e.g. a threshold in energy refined over
+20 weight fractions costs 20 simulations per new energy.
+With many axes, keep the coarse grid of the smooth axes small.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import copy
+import logging
+import itertools
+from collections import OrderedDict
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.options.material import Material
+from pymontecarlo.program.winxray.sweep import iter_results
+from pymontecarlo.program.winxray.cube import default_parameters
+from pymontecarlo.program.winxray.surrogate import IntensitySurrogate
+
+# Globals and constants variables.
+
+def substrate_factory(options, balance=None):
+    """
+    Returns a function creating a copy of *options* for parameter values:
+    ``energy_eV`` sets the beam energy and ``wf_<Z>`` the weight fraction of
+    element Z in the substrate.
+    The element *balance* makes up the remaining weight fraction.
+    A :exc:`ValueError` is raised if the weight fractions exceed 1.0.
+    """
+    def _create(**params):
+        ops = copy.deepcopy(options)
+        ops.name = '%s+%s' % (options.name,
+                              '+'.join('%s%g' % item for item in sorted(params.items())))
+
+        if 'energy_eV' in params:
+            ops.beam.energy_eV = params['energy_eV']
+
+        composition = dict((int(name[3:]), value) \
+                           for name, value in params.items() \
+                           if name.startswith('wf_'))
+        if composition:
+            if balance is not None:
+                wf = 1.0 - sum(composition.values())
+                if wf < -1e-9:
+                    raise ValueError('Negative weight fraction of balance element %i: %g' % \
+                                     (balance, wf))
+                composition[balance] = max(0.0, wf)
+            composition = dict((z, wf) for z, wf in composition.items() if wf > 0.0)
+
+            material = ops.geometry.body.material
+            ops.geometry.body.material = Material(composition, material.name)
+
+        return ops
+
+    return _create
+
+def interval_errors(axis, values, uncertainties, k, nsigma=2.0):
+    """
+    Returns the maximum relative interpolation error in the middle of each
+    interval of axis *k*, over all the other axes and the last one.
+    The errors within *nsigma* uncertainties are ignored.
+    Intervals with a missing node give NaN.
+    With only two nodes, the error is a quarter of their difference (see
+    :mod:`surrogate`).
+
+    :arg axis: sorted values of axis *k*
+    :arg values: array of shape ``(len(axis1), ..., len(lines))``
+    """
+    axis = np.asarray(axis, dtype=float)
+    n = len(axis)
+    if n < 2:
+        return np.full(0, np.nan)
+
+    values = np.moveaxis(values, k, 0)
+    uncertainties = np.moveaxis(uncertainties, k, 0)
+    shape = (-1,) + (1,) * (values.ndim - 1)
+
+    if n == 2:
+        # No curvature, the slope may change by its own value
+        errors = np.abs(np.diff(values, axis=0)) / 4.0
+    else:
+        # Second divided difference of each stencil of three nodes
+        slopes = np.diff(values, axis=0) / np.diff(axis).reshape(shape)
+        d2 = np.diff(slopes, axis=0) / (axis[2:] - axis[:-2]).reshape(shape)
+
+        # Stencil of each interval
+        stencils = np.minimum(np.arange(n - 1), n - 3)
+        steps = np.diff(axis).reshape(shape)
+        errors = np.abs(d2[stencils]) * steps ** 2 / 4.0
+
+    scale = np.fmax(np.abs(values[:-1]), np.abs(values[1:]))
+    noise = nsigma * np.fmax(uncertainties[:-1], uncertainties[1:])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = np.where(errors > noise, errors / scale, 0.0)
+    relative[np.isnan(errors)] = np.nan
+
+    # Missing nodes give NaN, unless another line or node is refined
+    relative = relative.reshape(n - 1, -1)
+    return np.fmax.reduce(relative, axis=1)
+
+class AdaptiveSweep(object):
+
+    def __init__(self, create_options, axes, run, key, lines, tolerance=0.02,
+                 min_steps=None, max_runs=None, nsigma=2.0, absorption=True,
+                 max_inflight=None):
+        """
+        Creates an adaptive sweep.
+
+        :arg create_options: function taking the parameter values as keyword
+            arguments and returning an options (see :func:`substrate_factory`)
+        :arg axes: :class:`dict` of parameter name (``'energy_eV'``,
+            ``'wf_<Z>'``) to the values of the initial coarse grid
+        :arg run: function taking an options and returning its results (see
+            :func:`worker_runner <pymontecarlo.program.winxray.sweep.worker_runner>`)
+        :arg key: key of the :class:`PhotonIntensityDetector` in the results
+        :arg lines: X-ray lines (e.g. ``['Al Ka1', 'Cu La1']``)
+        :arg tolerance: relative interpolation error to reach
+        :arg min_steps: :class:`dict` of parameter name to the smallest
+            interval that is split
+        :arg max_runs: maximum number of simulations
+        :arg nsigma: errors within this number of uncertainties are
+            considered noise
+        """
+        self._create_options = create_options
+        self._axes = OrderedDict((name, sorted(set(float(v) for v in values))) \
+                                 for name, values in axes.items())
+        self._run = run
+        self._key = key
+        self._lines = list(lines)
+        self._tolerance = tolerance
+        self._min_steps = dict(min_steps or {})
+        self._max_runs = max_runs
+        self._nsigma = nsigma
+        self._absorption = absorption
+        self._max_inflight = max_inflight
+
+        # Node (tuple of parameter values) to (options, results)
+        self._nodes = OrderedDict()
+        self.niterations = 0
+
+    def _simulate_missing(self):
+        missing = [node for node in itertools.product(*self._axes.values()) \
+                   if node not in self._nodes]
+        if self._max_runs is not None:
+            missing = missing[:max(0, self._max_runs - len(self._nodes))]
+        if not missing:
+            return 0
+
+        logging.debug('Adaptive sweep: simulating %i new point(s)', len(missing))
+
+        names = list(self._axes)
+        optionss = []
+        lookup = {}
+        for node in missing:
+            options = self._create_options(**dict(zip(names, node)))
+            lookup[id(options)] = node
+            optionss.append(options)
+
+        for options, results in iter_results(optionss, self._run,
+                                             self._max_inflight):
+            self._nodes[lookup[id(options)]] = (options, results)
+
+        return len(missing)
+
+    def _grid(self):
+        shape = tuple(len(axis) for axis in self._axes.values()) + (len(self._lines),)
+        values = np.full(shape, np.nan)
+        uncertainties = np.full(shape, np.nan)
+
+        positions = [dict((value, i) for i, value in enumerate(axis)) \
+                     for axis in self._axes.values()]
+
+        for node, (_options, results) in self._nodes.items():
+            try:
+                index = tuple(position[value] \
+                              for position, value in zip(positions, node))
+            except KeyError:
+                continue
+
+            result = results[self._key]
+            for j, line in enumerate(self._lines):
+                try:
+                    values[index + (j,)], uncertainties[index + (j,)] = \
+                        result.intensity(line, absorption=self._absorption)
+                except (ValueError, KeyError):
+                    pass
+
+        return values, uncertainties
+
+    def errors(self):
+        """
+        Returns the relative interpolation error of each interval of each
+        axis, as a :class:`dict` of parameter name to array.
+        """
+        values, uncertainties = self._grid()
+        return dict((name, interval_errors(axis, values, uncertainties, k,
+                                           self._nsigma)) \
+                    for k, (name, axis) in enumerate(self._axes.items()))
+
+    def refine(self):
+        """
+        Splits the intervals whose error exceeds the tolerance and returns
+        the number of new values added to the axes.
+        """
+        errors = self.errors()
+        nnew = 0
+
+        for name, axis in self._axes.items():
+            min_step = self._min_steps.get(name, 0.0)
+            new = []
+            for i, error in enumerate(errors[name]):
+                if not error > self._tolerance:
+                    continue
+                a, b = axis[i], axis[i + 1]
+                if (b - a) / 2.0 < min_step:
+                    continue
+                new.append((a + b) / 2.0)
+
+            if new:
+                logging.debug('Adaptive sweep: %i new value(s) of %s',
+                              len(new), name)
+                self._axes[name] = sorted(axis + new)
+                nnew += len(new)
+
+        return nnew
+
+    def run(self, max_iterations=10):
+        """
+        Simulates the grid and refines it until the tolerance is met, no
+        interval can be split or the maximum number of runs is reached.
+        Returns the (options, results) of all the simulations.
+        """
+        self._simulate_missing()
+
+        for _ in range(max_iterations):
+            if self._max_runs is not None and len(self._nodes) >= self._max_runs:
+                break
+            if not self.refine():
+                break
+            self.niterations += 1
+            self._simulate_missing()
+
+        return self.items
+
+    def surrogate(self, tolerance=None):
+        """
+        Returns an :class:`IntensitySurrogate` of the simulated grid.
+        """
+        items = self.items
+        parameters = [(name, func) \
+                      for name, func in default_parameters([ops for ops, _ in items]) \
+                      if name in self._axes]
+        return IntensitySurrogate.from_results(items, self._key, self._lines,
+                                               parameters, self._absorption,
+                                               tolerance or self._tolerance)
+
+    @property
+    def axes(self):
+        return OrderedDict((name, np.array(axis)) \
+                           for name, axis in self._axes.items())
+
+    @property
+    def items(self):
+        return list(self._nodes.values())
+
+    @property
+    def nsimulations(self):
+        return len(self._nodes)
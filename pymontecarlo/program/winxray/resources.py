@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`resources` -- CPU and memory resources of WinX-Ray processes
+================================================================================
+
+.. module:: resources
+   :synopsis: CPU and memory resources of WinX-Ray processes
+
+Utilities to:
+
+  * size the number of concurrent WinX-Ray processes from the available
+    cores and memory (:func:`max_concurrency`);
+  * pin each process to a dedicated core or NUMA node
+    (:class:`CpuAllocator`) and lower its CPU and I/O priorities from its
+    start (:func:`limit_command`, :func:`limit_process`);
+  * measure the CPU utilisation of a process and its children, e.g. the
+    Windows executable started by Wine (:class:`CpuMonitor`).
+
+`psutil <https://github.com/giampaolo/psutil>`_ is used if it is installed,
+otherwise the information is read from ``/proc`` and ``/sys`` on Linux.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import re
+import glob
+import time
+import shutil
+import threading
+
+# Third party modules.
+try:
+    import psutil
+except ImportError: # pragma: no cover
+    psutil = None
+
+# Local modules.
+
+# Globals and constants variables.
+CORE = 'core'
+NUMA = 'numa'
+
+DEFAULT_MEMORY_PER_PROCESS_BYTES = 512 * 1024 ** 2
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+def available_cpus():
+    """
+    Returns the sorted list of the CPUs the current process may run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def available_memory_bytes():
+    """
+    Returns the memory available for new processes in bytes, or ``None`` if
+    it cannot be determined.
+    """
+    if psutil is not None:
+        return psutil.virtual_memory().available
+
+    try:
+        with open('/proc/meminfo', 'r') as fp:
+            for line in fp:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+
+    return None
+
+def max_concurrency(memory_per_process_bytes=DEFAULT_MEMORY_PER_PROCESS_BYTES,
+                    reserved_cpus=0):
+    """
+    Returns the number of WinX-Ray processes that can run concurrently: one
+    per available CPU (minus *reserved_cpus*), limited by the available
+    memory.
+    """
+    concurrency = len(available_cpus()) - reserved_cpus
+
+    memory_bytes = available_memory_bytes()
+    if memory_bytes is not None and memory_per_process_bytes:
+        concurrency = min(concurrency, memory_bytes // memory_per_process_bytes)
+
+    return max(1, int(concurrency))
+
+def _parse_cpulist(text):
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, stop = part.split('-')
+            cpus.update(range(int(start), int(stop) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+def numa_nodes():
+    """
+    Returns the CPUs of each NUMA node as a :class:`dict`.
+    Without NUMA information, all CPUs are in node 0.
+    """
+    nodes = {}
+    for dirpath in glob.glob('/sys/devices/system/node/node[0-9]*'):
+        node = int(re.search(r'(\d+)$', dirpath).group(1))
+        try:
+            with open(os.path.join(dirpath, 'cpulist'), 'r') as fp:
+                cpus = _parse_cpulist(fp.read())
+        except (IOError, OSError):
+            continue
+        if cpus:
+            nodes[node] = cpus
+
+    if not nodes:
+        nodes[0] = set(available_cpus())
+
+    return nodes
+
+class CpuAllocator(object):
+
+    def __init__(self, mode=CORE, cpus=None):
+        """
+        Allocates the CPUs to the WinX-Ray processes.
+        Each process gets the least used core (*mode* ``'core'``) or all the
+        cores of the least used NUMA node (*mode* ``'numa'``).
+
+        :arg cpus: CPUs to allocate (default: all the available CPUs)
+        """
+        if mode not in (CORE, NUMA):
+            raise ValueError('Unknown pinning mode: %s' % mode)
+
+        cpus = set(available_cpus() if cpus is None else cpus)
+
+        if mode == CORE:
+            groups = [frozenset([cpu]) for cpu in sorted(cpus)]
+        else:
+            groups = [frozenset(node_cpus & cpus) \
+                      for _node, node_cpus in sorted(numa_nodes().items())]
+            groups = [group for group in groups if group]
+        if not groups:
+            raise ValueError('No CPU to allocate')
+
+        self._mode = mode
+        self._load = dict((group, 0) for group in groups)
+        self._order = groups
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns the set of CPUs allocated to a new process.
+        Once all CPUs are in use, they are shared evenly.
+        """
+        with self._lock:
+            group = min(self._order, key=self._load.__getitem__)
+            self._load[group] += 1
+            return group
+
+    def release(self, cpus):
+        """
+        Releases CPUs returned by :meth:`acquire`.
+        """
+        with self._lock:
+            self._load[cpus] = max(0, self._load[cpus] - 1)
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def load(self):
+        """
+        Number of processes per group of CPUs.
+        """
+        with self._lock:
+            return dict(self._load)
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+def get_allocator(mode=CORE):
+    """
+    Returns the allocator shared by all the workers of this process.
+    """
+    with _allocators_lock:
+        if mode not in _allocators:
+            _allocators[mode] = CpuAllocator(mode)
+        return _allocators[mode]
+
+def limit_command(args, cpus=None, nice=None, ionice=None):
+    """
+    Prefixes the command *args* with ``taskset``, ``nice`` and ``ionice``,
+    so that WinX-Ray and all the processes it starts (e.g. Wine) are pinned
+    to *cpus* and run with lower priorities from the start.
+    (``preexec_fn`` cannot be used instead, since the workers run in
+    threads.)
+
+    :arg nice: increment of the niceness
+    :arg ionice: I/O scheduling class (1: real-time, 2: best-effort,
+        3: idle)
+    :return: the command and the limits which could not be prefixed, since
+        the program is not found, as keyword arguments of
+        :func:`limit_process`
+    """
+    args = list(args)
+    remaining = {}
+
+    if ionice is not None:
+        if shutil.which('ionice'):
+            args = ['ionice', '-c', str(int(ionice))] + args
+        else:
+            remaining['ionice'] = ionice
+
+    if nice:
+        if shutil.which('nice'):
+            args = ['nice', '-n', str(int(nice))] + args
+        else:
+            remaining['nice'] = nice
+
+    if cpus:
+        if shutil.which('taskset'):
+            args = ['taskset', '-c', ','.join(map(str, sorted(cpus)))] + args
+        else:
+            remaining['cpus'] = cpus
+
+    return args, remaining
+
+def _process_tree(pid):
+    if psutil is None:
+        return [pid]
+    try:
+        children = psutil.Process(pid).children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+    return [pid] + [child.pid for child in children]
+
+def limit_process(pid, cpus=None, nice=None, ionice=None):
+    """
+    Pins process *pid* and its descendants to *cpus* and lowers their
+    priorities.
+    Processes started before the call but already ended are not limited,
+    prefer :func:`limit_command` where possible.
+
+    :arg nice: increment of the niceness
+    :arg ionice: I/O scheduling class (1: real-time, 2: best-effort,
+        3: idle), requires psutil
+    """
+    for other in _process_tree(pid):
+        try:
+            if cpus and hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(other, cpus)
+
+            if nice and hasattr(os, 'setpriority'):
+                niceness = os.getpriority(os.PRIO_PROCESS, other)
+                os.setpriority(os.PRIO_PROCESS, other, niceness + int(nice))
+
+            if ionice is not None and psutil is not None and \
+                    hasattr(psutil.Process, 'ionice'):
+                psutil.Process(other).ionice(int(ionice))
+        except ProcessLookupError:
+            pass # Already ended
+        except Exception as ex:
+            if psutil is not None and isinstance(ex, psutil.NoSuchProcess):
+                continue
+            raise
+
+def wait_exited(pid):
+    """
+    Waits for the child process *pid* to end, without reaping it, so that
+    its CPU time can still be read.
+    Returns immediately where it is not supported.
+    """
+    if not hasattr(os, 'waitid'):
+        return
+    try:
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+    except ChildProcessError:
+        pass # Already reaped
+
+def has_exited(process):
+    """
+    Returns whether *process* (:class:`subprocess.Popen`) has ended, without
+    reaping it where possible (see :func:`wait_exited`).
+    """
+    if process.returncode is None and hasattr(os, 'waitid'):
+        try:
+            return os.waitid(os.P_PID, process.pid,
+                             os.WEXITED | os.WNOWAIT | os.WNOHANG) is not None
+        except ChildProcessError:
+            pass # Already reaped
+    return process.poll() is not None
+
+def _read_proc_times():
+    # (ppid, cpu time in s) of all processes, from /proc
+    processes = {}
+    for dirpath in glob.glob('/proc/[0-9]*'):
+        try:
+            with open(os.path.join(dirpath, 'stat'), 'r') as fp:
+                stat = fp.read()
+        except (IOError, OSError):
+            continue
+
+        # The command may contain spaces and parentheses
+        fields = stat[stat.rfind(')') + 2:].split()
+        pid = int(os.path.basename(dirpath))
+        ppid = int(fields[1])
+        cpu_s = (int(fields[11]) + int(fields[12])) / float(_CLOCK_TICKS)
+        processes[pid] = (ppid, cpu_s)
+
+    return processes
+
+def process_tree_cpu_times(pid):
+    """
+    Returns the CPU time (user and system) in seconds of process *pid* and
+    each of its descendants, as a :class:`dict`.
+    """
+    if psutil is not None:
+        try:
+            parent = psutil.Process(pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return {}
+
+        times = {}
+        for process in processes:
+            try:
+                cputimes = process.cpu_times()
+            except psutil.NoSuchProcess:
+                continue
+            times[process.pid] = cputimes.user + cputimes.system
+        return times
+
+    processes = _read_proc_times()
+    if pid not in processes:
+        return {}
+
+    children = {}
+    for child, (ppid, _cpu_s) in processes.items():
+        children.setdefault(ppid, []).append(child)
+
+    times = {}
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        times[current] = processes[current][1]
+        pids.extend(children.get(current, []))
+
+    return times
+
+class CpuMonitor(threading.Thread):
+
+    def __init__(self, pid, interval_s=1.0):
+        """
+        Measures the CPU utilisation of process *pid* and its descendants.
+        The process tree is sampled every *interval_s*, so the CPU time of
+        short-lived children is also accounted.
+        """
+        threading.Thread.__init__(self, name='WinXRay CPU monitor')
+        self.daemon = True
+
+        self._pid = pid
+        self._interval_s = interval_s
+        self._stopevent = threading.Event()
+        self._lock = threading.Lock()
+
+        self._times = {}
+        self._start_time = None
+        self._stop_time = None
+
+    def sample(self):
+        """
+        Samples the CPU time of the process tree.
+        """
+        times = process_tree_cpu_times(self._pid)
+        with self._lock:
+            for pid, cpu_s in times.items():
+                self._times[pid] = max(self._times.get(pid, 0.0), cpu_s)
+
+    def run(self):
+        self._start_time = time.monotonic()
+        self.sample()
+        while not self._stopevent.wait(self._interval_s):
+            self.sample()
+
+    def stop(self):
+        """
+        Stops measuring.
+        The process must not have been reaped yet (see :func:`wait_exited`),
+        otherwise the CPU time after the last sample is lost.
+        """
+        if self._stopevent.is_set():
+            return
+        self.sample()
+        self._stop_time = time.monotonic()
+        self._stopevent.set()
+        if self.is_alive():
+            self.join()
+
+    @property
+    def cpu_s(self):
+        """
+        CPU time of the process tree in seconds.
+        """
+        with self._lock:
+            return sum(self._times.values())
+
+    @property
+    def wall_s(self):
+        if self._start_time is None:
+            return 0.0
+        return (self._stop_time or time.monotonic()) - self._start_time
+
+    @property
+    def utilisation(self):
+        """
+        Ratio of the CPU time to the wall time (1.0 for a full core).
+        """
+        wall_s = self.wall_s
+        if wall_s <= 0.0:
+            return 0.0
+        return self.cpu_s / wall_s
@@ -0,0 +1,516 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`scheduler` -- Priority scheduling of WinX-Ray simulations
+================================================================================
+
+.. module:: scheduler
+   :synopsis: Priority scheduling of WinX-Ray simulations
+
+The :class:`Scheduler` runs simulations in two priority classes:
+
+  * :data:`INTERACTIVE`: single simulations requested by a user, who waits
+    for the results;
+  * :data:`BATCH`: simulations of long sweeps.
+
+A number of slots is reserved for interactive simulations: batch simulations
+never use all the slots, so an interactive simulation usually starts
+immediately.
+When all slots are busy, an interactive simulation can preempt the most
+recently started batch simulation, either by killing it and putting it back
+in the queue (:data:`KILL`) or by suspending its process until a slot is
+free again (:data:`SUSPEND`, POSIX only).
+
+Identical simulations submitted while one of them is queued or running are
+coalesced (single flight): with a *key* function, such as
+:func:`exported_digest`, a later submission with the same key attaches to
+the job in flight and receives the same results when it completes, without
+starting a second WinX-Ray process.
+An interactive submission attached to a queued batch job raises its
+priority.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import time
+import heapq
+import hashlib
+import shutil
+import logging
+import tempfile
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.program.winxray.resources import max_concurrency
+from pymontecarlo.program.winxray import metrics
+
+# Globals and constants variables.
+INTERACTIVE = 0
+BATCH = 1
+
+KILL = 'kill'
+SUSPEND = 'suspend'
+
+class Job(object):
+
+    def __init__(self, options, priority):
+        """
+        Simulation submitted to the scheduler.
+        Its results are set in :attr:`future`.
+        """
+        self.options = options
+        self.priority = priority
+        self.future = Future()
+
+        # Worker running the simulation and archive of its results, set by
+        # the run function
+        self.worker = None
+        self.archivepath = None
+
+        self.preempted = False
+        self.suspended = False
+        self.npreemptions = 0
+
+        # Single flight: key of the simulation, job running it for this job
+        # and jobs waiting for its results
+        self.key = None
+        self.leader = None
+        self.followers = []
+
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+
+    def __repr__(self):
+        return '<%s(%s, priority=%i)>' % (self.__class__.__name__,
+                                          self.options.name, self.priority)
+
+    @property
+    def latency_s(self):
+        """
+        Time between the submission and the results, or ``None``.
+        """
+        if self.finished is None:
+            return None
+        return self.finished - self.submitted
+
+class WorkerJobRunner(object):
+
+    def __init__(self, program, outputdir):
+        """
+        Runs a :class:`Job` with a worker of *program*, in its own temporary
+        work directory.
+        The workers are kept and reused by the next jobs, so the settings,
+        the journal and the store are only loaded once per slot.
+        """
+        self._program = program
+        self._outputdir = outputdir
+
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._program.worker_class(self._program)
+
+    def _release(self, worker):
+        with self._lock:
+            self._idle.append(worker)
+
+    def __call__(self, job):
+        worker = self._acquire()
+        workdir = tempfile.mkdtemp(prefix='winxray_')
+        try:
+            job.worker = worker
+            results = worker.run(job.options, self._outputdir, workdir)
+            job.archivepath = getattr(worker, 'archivepath', None)
+            return results
+        finally:
+            job.worker = None # Not preempted once released
+            self._release(worker)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def follow(self, job, leader, results):
+        """
+        Imports the results of an identical *leader* again from its archive,
+        with the options of *job* (e.g. other name), so that each job gets
+        results of its own options.
+        See the *follow* argument of :class:`Scheduler`.
+        """
+        if leader.archivepath is None:
+            return results
+
+        worker = self._acquire()
+        try:
+            return worker.load_archive(job.options, leader.archivepath)
+        finally:
+            self._release(worker)
+
+    @property
+    def nworkers(self):
+        """
+        Number of idle workers.
+        """
+        with self._lock:
+            return len(self._idle)
+
+def exported_digest(program):
+    """
+    Returns a function giving the digest of the WinX-Ray options file
+    exported from an options and of the keys and classes of its detectors,
+    to coalesce identical simulations
+    (see :meth:`Exporter.digest <pymontecarlo.program.winxray.exporter.Exporter.digest>`).
+    """
+    def _key(options):
+        # The detectors keys are not part of the options file, but are the
+        # keys of the results
+        detectors = sorted('%s:%s.%s' % (name, detector.__class__.__module__,
+                                         detector.__class__.__name__) \
+                           for name, detector in options.detectors.items())
+        content = program.exporter_class().digest(options) + '\n' + \
+            '\n'.join(detectors)
+        return hashlib.sha1(content.encode('utf8')).hexdigest()
+
+    return _key
+
+class Scheduler(object):
+
+    def __init__(self, run, capacity=None, reserved=1, preemption=None,
+                 key=None, follow=None, history=1000):
+        """
+        Creates a scheduler.
+
+        :arg run: function taking a :class:`Job` and returning its results.
+            To be preemptible, it must set :attr:`Job.worker` to a worker
+            with ``kill()``, ``suspend()`` and ``resume()`` methods
+            (see :class:`WorkerJobRunner`).
+        :arg capacity: number of simulations running at the same time
+            (default: see
+            :func:`max_concurrency <pymontecarlo.program.winxray.resources.max_concurrency>`)
+        :arg reserved: number of slots reserved for interactive simulations
+            (at most *capacity* - 1)
+        :arg preemption: ``None`` (no preemption), :data:`KILL` or
+            :data:`SUSPEND`
+        :arg key: function taking an options and returning a key identical
+            for identical simulations (see :func:`exported_digest`), or
+            ``None`` to never coalesce simulations
+        :arg follow: function taking a job attached to an identical job, the
+            identical job and its results, and returning the results of the
+            attached job (see :meth:`WorkerJobRunner.follow`).
+            By default, the attached job receives the same results.
+        :arg history: number of finished jobs whose latency is kept for
+            :meth:`latencies`
+        """
+        if capacity is None:
+            capacity = max_concurrency()
+        if preemption not in (None, KILL, SUSPEND):
+            raise ValueError('Unknown preemption: %s' % preemption)
+
+        self._run = run
+        self._capacity = capacity
+        self._reserved = min(reserved, capacity - 1)
+        self._preemption = preemption
+        self._key = key
+        self._follow = follow
+
+        self._lock = threading.RLock()
+        self._idle = threading.Condition(self._lock)
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = []
+        self._suspended = []
+        self._latencies = deque(maxlen=history) # (priority, latency_s)
+        self._inflight = {} # Key to leader job
+        self._shutdown = False
+
+    def submit(self, options, priority=BATCH):
+        """
+        Submits a simulation and returns its :class:`Job`.
+        """
+        job = Job(options, priority)
+        if self._key is not None:
+            try:
+                job.key = self._key(options)
+            except Exception as ex:
+                # The simulation fails later, with its own error
+                logging.debug('No key for %s: %s', job, ex)
+
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('Scheduler is shut down')
+
+            leader = self._inflight.get(job.key) if job.key is not None else None
+            if leader is not None:
+                self._attach(job, leader)
+                return job
+
+            if job.key is not None:
+                self._inflight[job.key] = job
+            self._push(job)
+            logging.debug('Submitted %s', job)
+
+            self._schedule()
+            return job
+
+    def _push(self, job):
+        heapq.heappush(self._queue, (job.priority, next(self._counter), job))
+
+    def _remove_queued(self, job):
+        for i, (_priority, _index, other) in enumerate(self._queue):
+            if other is job:
+                self._queue.pop(i)
+                heapq.heapify(self._queue)
+                return True
+        return False
+
+    def _attach(self, job, leader):
+        logging.debug('Attaching %s to identical %s', job, leader)
+        job.leader = leader
+        job.started = leader.started
+        leader.followers.append(job)
+        metrics.COALESCED.inc()
+
+        # Run the leader with the highest priority of its followers
+        if job.priority < leader.priority:
+            leader.priority = job.priority
+            if self._remove_queued(leader):
+                self._push(leader)
+                self._schedule()
+
+    def _schedule(self):
+        # Called with the lock held
+        while True:
+            interactive_waiting = bool(self._queue) and \
+                self._queue[0][0] == INTERACTIVE
+            batch_limit = self._capacity - self._reserved
+
+            # Resume suspended jobs before starting new batch jobs
+            if self._suspended and not interactive_waiting and \
+                    len(self._running) < batch_limit:
+                self._resume(self._suspended.pop())
+                continue
+
+            if not self._queue:
+                return
+
+            job = self._queue[0][2]
+            limit = self._capacity if job.priority == INTERACTIVE else batch_limit
+            if len(self._running) < limit:
+                heapq.heappop(self._queue)
+                self._start(job)
+                continue
+
+            if job.priority == INTERACTIVE and self._preempt():
+                continue
+
+            return
+
+    def _start(self, job):
+        job.started = time.monotonic()
+        self._running.append(job)
+
+        thread = threading.Thread(target=self._execute, args=(job,),
+                                  name='WinXRay job %s' % job.options.name)
+        thread.daemon = True
+        thread.start()
+
+    def _preempt(self):
+        """
+        Preempts the most recently started batch job. Returns ``True`` if a
+        slot is now free.
+        """
+        if self._preemption is None:
+            return False
+
+        victims = [job for job in self._running \
+                   if job.priority != INTERACTIVE and not job.preempted and \
+                   job.worker is not None]
+        for job in sorted(victims, key=lambda job: job.started, reverse=True):
+            if self._preemption == SUSPEND:
+                if job.worker.suspend():
+                    logging.debug('Suspended %s', job)
+                    job.suspended = True
+                    job.npreemptions += 1
+                    self._running.remove(job)
+                    self._suspended.append(job)
+                    return True
+            else:
+                # One killed job per waiting interactive job
+                killing = sum(1 for other in self._running if other.preempted)
+                waiting = sum(1 for priority, _index, _job in self._queue \
+                              if priority == INTERACTIVE)
+                if killing >= waiting:
+                    return False
+
+                job.preempted = True
+                if job.worker.kill():
+                    logging.debug('Killed %s to requeue it', job)
+                    return False # Slot is freed when its thread ends
+                job.preempted = False
+
+        return False
+
+    def _resume(self, job):
+        logging.debug('Resuming %s', job)
+        job.suspended = False
+        self._running.append(job)
+        job.worker.resume()
+
+    def _execute(self, job):
+        try:
+            results = self._run(job)
+        except Exception as ex:
+            results, error = None, ex
+        else:
+            error = None
+
+        with self._lock:
+            requeue = job.preempted and error is not None
+            job.preempted = False
+            followers = []
+            if not requeue:
+                # No more followers once the job is no longer in flight
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+                followers = list(job.followers)
+
+        # Results of the followers, outside of the lock since they may be
+        # imported again
+        outcomes = [(job, results, error)]
+        for other in followers:
+            outcomes.append((other,) + self._follow_results(other, job, results, error))
+
+        with self._lock:
+            if job in self._running:
+                self._running.remove(job)
+            elif job in self._suspended:
+                self._suspended.remove(job)
+
+            if requeue:
+                # Killed by an interactive job, run it again later
+                job.npreemptions += 1
+                job.worker = None
+                job.started = None
+                self._push(job)
+            else:
+                job.finished = time.monotonic()
+                for other, other_results, other_error in outcomes:
+                    if other.future.cancelled():
+                        continue
+                    other.finished = job.finished
+                    self._latencies.append((other.priority, other.latency_s))
+                    if other_error is not None:
+                        other.future.set_exception(other_error)
+                    else:
+                        other.future.set_result(other_results)
+
+                # Finished jobs are only kept by their submitters
+                job.followers = []
+
+            self._schedule()
+            self._idle.notify_all()
+
+    def _follow_results(self, job, leader, results, error):
+        if error is not None or self._follow is None:
+            return results, error
+        try:
+            return self._follow(job, leader, results), None
+        except Exception as ex:
+            return None, ex
+
+    def cancel(self, job):
+        """
+        Cancels a job which has not started yet, or stops waiting for the
+        results of the identical job it is attached to.
+        Returns ``False`` if it is already running or finished, or if other
+        jobs wait for its results.
+        """
+        with self._lock:
+            if job.leader is not None:
+                if job.future.done():
+                    return False
+                job.leader.followers.remove(job)
+                return job.future.cancel()
+
+            if any(not other.future.done() for other in job.followers):
+                return False
+            if not self._remove_queued(job):
+                return False
+
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+            job.future.cancel()
+            self._idle.notify_all()
+            return True
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        Stops accepting new jobs.
+
+        :arg wait: wait for the submitted jobs to finish
+        :arg cancel: cancel the jobs not started yet
+        """
+        with self._lock:
+            self._shutdown = True
+
+            if cancel:
+                for _priority, _index, job in self._queue:
+                    for other in [job] + job.followers:
+                        other.future.cancel()
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+                self._queue = []
+
+            if wait:
+                while self._queue or self._running or self._suspended:
+                    self._idle.wait()
+
+    def latencies(self, priority=INTERACTIVE):
+        """
+        Returns the 50th and 95th percentiles of the latency of the last
+        finished jobs of a priority class, in seconds, or ``None``.
+        """
+        with self._lock:
+            latencies = [latency_s for job_priority, latency_s in self._latencies \
+                         if job_priority == priority]
+        if not latencies:
+            return None
+        return tuple(np.percentile(latencies, [50, 95]))
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def reserved(self):
+        return self._reserved
+
+    @property
+    def running(self):
+        with self._lock:
+            return list(self._running)
+
+    @property
+    def suspended(self):
+        with self._lock:
+            return list(self._suspended)
+
+    @property
+    def queued(self):
+        with self._lock:
+            return [job for _priority, _index, job in sorted(self._queue)]
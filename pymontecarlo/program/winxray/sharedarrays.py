@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`sharedarrays` -- Transfer of NumPy arrays between processes
+================================================================================
+
+.. module:: sharedarrays
+   :synopsis: Transfer of NumPy arrays between processes
+
+When results are imported in a pool of processes, pickling them copies every
+array (spectra, phi-rho-z distributions, ...) through a pipe.
+An :class:`ArrayArena` instead saves the large arrays in files of a shared
+directory (in ``/dev/shm`` when available, i.e. in memory) and pickles only
+a reference to them.
+The parent process maps the files in memory, without copying the arrays.
+
+On POSIX systems, each file is removed as soon as it is mapped: its memory
+is released with the last array using it.
+The directory of the arena, with the files which were not loaded, is
+removed when the arena is closed or garbage collected.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import io
+import uuid
+import shutil
+import pickle
+import tempfile
+import weakref
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+
+# Globals and constants variables.
+DEFAULT_MIN_BYTES = 64 * 1024
+
+_SHM_DIR = '/dev/shm'
+
+def _default_dir():
+    if os.path.isdir(_SHM_DIR) and os.access(_SHM_DIR, os.W_OK):
+        return _SHM_DIR
+    return None
+
+class _ArenaPickler(pickle.Pickler):
+
+    def __init__(self, fp, arena):
+        pickle.Pickler.__init__(self, fp, pickle.HIGHEST_PROTOCOL)
+        self._arena = arena
+
+    def persistent_id(self, obj):
+        if type(obj) is np.ndarray and obj.dtype != object and \
+                obj.nbytes >= self._arena.min_bytes:
+            return self._arena.save(obj)
+        return None
+
+class _ArenaUnpickler(pickle.Unpickler):
+
+    def __init__(self, fp, arena):
+        pickle.Unpickler.__init__(self, fp)
+        self._arena = arena
+
+    def persistent_load(self, pid):
+        return self._arena.load(pid)
+
+class ArrayArena(object):
+
+    def __init__(self, dirpath=None, min_bytes=DEFAULT_MIN_BYTES):
+        """
+        Creates an arena.
+
+        :arg dirpath: directory of an existing arena (e.g. in a child
+            process). If ``None``, a new directory is created and removed
+            when this arena is closed.
+        :arg min_bytes: arrays smaller than this size are pickled as usual
+        """
+        self._owner = dirpath is None
+        if dirpath is None:
+            dirpath = tempfile.mkdtemp(prefix='winxray_arena_', dir=_default_dir())
+        self._dirpath = dirpath
+        self._min_bytes = min_bytes
+
+        self._finalizer = None
+        if self._owner:
+            self._finalizer = weakref.finalize(self, shutil.rmtree, dirpath,
+                                               ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def save(self, array):
+        """
+        Saves *array* in the arena and returns its reference.
+        """
+        filename = uuid.uuid4().hex + '.npy'
+        np.save(os.path.join(self._dirpath, filename), np.ascontiguousarray(array))
+        return filename
+
+    def load(self, filename):
+        """
+        Maps in memory the array saved under the reference *filename*.
+        The array is writable, but changes are not written to the file.
+        """
+        filepath = os.path.join(self._dirpath, filename)
+        array = np.load(filepath, mmap_mode='c')
+
+        if os.name == 'posix': # Mapping remains valid
+            os.remove(filepath)
+
+        return array
+
+    def dumps(self, obj):
+        """
+        Pickles *obj*, saving its large arrays in the arena.
+        """
+        fp = io.BytesIO()
+        _ArenaPickler(fp, self).dump(obj)
+        return fp.getvalue()
+
+    def loads(self, data):
+        """
+        Unpickles *data* created by :meth:`dumps`, mapping its large arrays.
+        """
+        return _ArenaUnpickler(io.BytesIO(data), self).load()
+
+    def close(self):
+        """
+        Removes the directory of the arena, if this arena created it.
+        Arrays already loaded remain valid on POSIX systems.
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+
+    @property
+    def dirpath(self):
+        return self._dirpath
+
+    @property
+    def min_bytes(self):
+        return self._min_bytes
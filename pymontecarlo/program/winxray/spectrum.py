@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`spectrum` -- Post-processing of WinX-Ray spectra
+================================================================================
+
+.. module:: spectrum
+   :synopsis: Post-processing of WinX-Ray spectra
+
+WinX-Ray only supports a few channel widths (5, 10, 20 or 40 eV) and always
+simulates the spectrum from 0 eV to the beam energy.
+The spectra are therefore returned on WinX-Ray's grid rather than on the
+channels requested by the :class:`PhotonSpectrumDetector`.
+
+This module rebins the spectra to the requested channels and optionally
+convolves them with the Gaussian response of an energy dispersive detector.
+Both operations are linear: a :class:`SpectrumProcessor` combines them in a
+single matrix, which is then applied to many spectra at once.
+The matrices are sparse (:class:`SparseMatrix`), since each channel only
+overlaps a few new channels and the Gaussian response is cut off at
+:data:`NSIGMAS` standard deviations: the response of an EDS detector for a
+30 keV spectrum with 5 eV channels (6000 channels) takes about 20 MB instead
+of about 300 MB.
+A spectrum simulated once at a fine resolution can then be served for
+several detector configurations.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import threading
+from collections import OrderedDict
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.results.result import PhotonSpectrumResult
+
+# Globals and constants variables.
+FWHM_TO_SIGMA = 1.0 / (2.0 * np.sqrt(2.0 * np.log(2.0)))
+NSIGMAS = 5.0
+
+_RESPONSE_CACHE_SIZE = 16
+
+class SparseMatrix(object):
+
+    def __init__(self, rows, cols, values, shape):
+        """
+        Sparse matrix in coordinate format, with at most one value per
+        element.
+        """
+        self._rows = np.asarray(rows, dtype=np.intp)
+        self._cols = np.asarray(cols, dtype=np.intp)
+        self._values = np.asarray(values, dtype=float)
+        self._shape = tuple(shape)
+
+    def apply(self, spectra):
+        """
+        Returns the product of one spectrum or a batch of spectra (rows) by
+        the matrix, i.e. ``np.dot(spectra, matrix)``.
+        """
+        spectra = np.asarray(spectra, dtype=float)
+        nrows, ncols = self._shape
+        if spectra.ndim == 1:
+            return np.bincount(self._cols, spectra[self._rows] * self._values,
+                               minlength=ncols)
+
+        nspectra = spectra.shape[0]
+        indexes = (np.arange(nspectra)[:, np.newaxis] * ncols + self._cols).ravel()
+        weights = (spectra[:, self._rows] * self._values).ravel()
+        values = np.bincount(indexes, weights, minlength=nspectra * ncols)
+        return values.reshape(nspectra, ncols)
+
+    def dot(self, other):
+        """
+        Returns the product of this matrix by the :class:`SparseMatrix`
+        *other*.
+        """
+        if self._shape[1] != other.shape[0]:
+            raise ValueError('Incompatible shapes: %s and %s' % \
+                             (self._shape, other.shape))
+
+        # Values of other sorted by row
+        order = np.argsort(other._rows, kind='mergesort')
+        other_cols = other._cols[order]
+        other_values = other._values[order]
+        counts = np.bincount(other._rows, minlength=other.shape[0])
+        starts = np.cumsum(counts) - counts
+
+        # Each value (i, k) of this matrix times each value (k, j) of other
+        repeats = counts[self._cols]
+        firsts = np.cumsum(repeats) - repeats
+        positions = np.arange(np.sum(repeats)) - np.repeat(firsts, repeats) + \
+            np.repeat(starts[self._cols], repeats)
+        rows = np.repeat(self._rows, repeats)
+        cols = other_cols[positions]
+        values = np.repeat(self._values, repeats) * other_values[positions]
+
+        # Sum of the products of the same element
+        ncols = other.shape[1]
+        keys, inverse = np.unique(rows * ncols + cols, return_inverse=True)
+        values = np.bincount(inverse.ravel(), values, minlength=len(keys))
+
+        return SparseMatrix(keys // ncols, keys % ncols, values,
+                            (self._shape[0], ncols))
+
+    def square(self):
+        """
+        Returns the matrix of the squared elements.
+        """
+        return SparseMatrix(self._rows, self._cols, self._values ** 2,
+                            self._shape)
+
+    def toarray(self):
+        """
+        Returns the matrix as a dense array.
+        """
+        array = np.zeros(self._shape)
+        array[self._rows, self._cols] = self._values
+        return array
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def nnz(self):
+        """
+        Number of stored values.
+        """
+        return len(self._values)
+
+def channel_edges(detector):
+    """
+    Returns the edges of the channels requested by a
+    :class:`PhotonSpectrumDetector`.
+    """
+    emin, emax = detector.limits_eV
+    return np.linspace(emin, emax, detector.channels + 1)
+
+def fwhm_eds(energies_eV, fwhm_ref_eV=130.0, energy_ref_eV=5898.7,
+             fano=0.114, epsilon_eV=3.64):
+    """
+    Returns the full width at half maximum of the peaks of an energy
+    dispersive spectrometer at *energies_eV*, from its resolution at a
+    reference energy (by default, 130 eV at Mn Ka).
+
+    :arg fano: Fano factor
+    :arg epsilon_eV: mean energy to create an electron-hole pair
+    """
+    energies_eV = np.asarray(energies_eV, dtype=float)
+    noise2 = fwhm_ref_eV ** 2 - 5.545 * fano * epsilon_eV * energy_ref_eV
+    return np.sqrt(np.maximum(noise2 + 5.545 * fano * epsilon_eV * energies_eV, 0.0))
+
+def rebin_matrix(energies_eV, edges_eV):
+    """
+    Returns the matrix rebinning a spectrum, given as a density
+    (e.g. counts / (sr.electron.eV)), from channels centred on
+    *energies_eV* (uniform width) to channels delimited by *edges_eV*.
+    The integral of the spectrum over each new channel is conserved.
+
+    :return: :class:`SparseMatrix` of shape
+        ``(len(energies_eV), len(edges_eV) - 1)``
+    """
+    energies_eV = np.asarray(energies_eV, dtype=float)
+    edges_eV = np.asarray(edges_eV, dtype=float)
+    nchannels = len(edges_eV) - 1
+
+    width_eV = energies_eV[1] - energies_eV[0]
+    lows = energies_eV - width_eV / 2.0
+    highs = energies_eV + width_eV / 2.0
+
+    # New channels overlapping each source channel
+    firsts = np.clip(np.searchsorted(edges_eV, lows, 'right') - 1, 0, nchannels)
+    lasts = np.clip(np.searchsorted(edges_eV, highs, 'left') - 1, -1, nchannels - 1)
+    counts = np.maximum(lasts - firsts + 1, 0)
+
+    rows = np.repeat(np.arange(len(energies_eV)), counts)
+    cols = np.repeat(firsts, counts) + np.arange(np.sum(counts)) - \
+        np.repeat(np.cumsum(counts) - counts, counts)
+
+    # Overlap in eV of each source channel with each new channel
+    overlaps = np.minimum(highs[rows], edges_eV[cols + 1]) - \
+        np.maximum(lows[rows], edges_eV[cols])
+    keep = overlaps > 0.0
+    rows, cols = rows[keep], cols[keep]
+
+    values = overlaps[keep] / np.diff(edges_eV)[cols]
+    return SparseMatrix(rows, cols, values, (len(energies_eV), nchannels))
+
+def response_matrix(energies_eV, fwhm_eV, nsigmas=NSIGMAS):
+    """
+    Returns the matrix convolving a spectrum with a Gaussian detector
+    response, cut off at *nsigmas* standard deviations.
+    The intensity of each channel is redistributed over the other channels,
+    so the total intensity is conserved.
+    The matrices are cached by channels and widths.
+
+    :arg energies_eV: centres of the channels (uniform width)
+    :arg fwhm_eV: full width at half maximum, either a constant, an array
+        with the width at each channel or a function of the energy
+        (e.g. :func:`fwhm_eds`)
+    :return: :class:`SparseMatrix` of shape
+        ``(len(energies_eV), len(energies_eV))``
+    """
+    energies_eV = np.asarray(energies_eV, dtype=float)
+
+    if callable(fwhm_eV):
+        fwhm_eV = fwhm_eV(energies_eV)
+    sigmas = np.broadcast_to(np.asarray(fwhm_eV, dtype=float) * FWHM_TO_SIGMA,
+                             energies_eV.shape)
+
+    key = (energies_eV.tobytes(), np.ascontiguousarray(sigmas).tobytes(),
+           float(nsigmas))
+    with _response_lock:
+        matrix = _response_cache.get(key)
+        if matrix is not None:
+            _response_cache.move_to_end(key)
+            return matrix
+
+    matrix = _create_response_matrix(energies_eV, sigmas, nsigmas)
+
+    with _response_lock:
+        _response_cache[key] = matrix
+        while len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    return matrix
+
+_response_cache = OrderedDict()
+_response_lock = threading.Lock()
+
+def _create_response_matrix(energies_eV, sigmas, nsigmas):
+    nchannels = len(energies_eV)
+
+    # Band of channels within the cut-off of the widest response
+    halfwidth = 0
+    if nchannels > 1 and np.any(sigmas > 0.0):
+        width_eV = abs(energies_eV[1] - energies_eV[0])
+        halfwidth = int(np.ceil(nsigmas * np.max(sigmas) / width_eV))
+        halfwidth = min(halfwidth, nchannels - 1)
+    offsets = np.arange(-halfwidth, halfwidth + 1)
+
+    rows = np.repeat(np.arange(nchannels), len(offsets))
+    cols = rows + np.tile(offsets, nchannels)
+    keep = (cols >= 0) & (cols < nchannels)
+    rows, cols = rows[keep], cols[keep]
+
+    # Channels with no width are left unchanged
+    distances = energies_eV[cols] - energies_eV[rows]
+    widths = sigmas[rows]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(widths > 0.0,
+                          np.exp(-0.5 * (distances / widths) ** 2),
+                          (rows == cols).astype(float))
+    keep = (values > 0.0) & ((widths <= 0.0) | \
+                             (np.abs(distances) <= nsigmas * widths))
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+
+    values /= np.bincount(rows, values, minlength=nchannels)[rows]
+    return SparseMatrix(rows, cols, values, (nchannels, nchannels))
+
+class SpectrumProcessor(object):
+
+    def __init__(self, energies_eV, edges_eV=None, fwhm_eV=None):
+        """
+        Creates a processor converting spectra simulated on the channels
+        centred on *energies_eV* to the channels delimited by *edges_eV*,
+        optionally convolved with a detector response of width *fwhm_eV*
+        (see :func:`response_matrix`).
+        The convolution is done on the simulated channels, before rebinning.
+        """
+        energies_eV = np.asarray(energies_eV, dtype=float)
+        if edges_eV is None:
+            width_eV = energies_eV[1] - energies_eV[0]
+            edges_eV = np.append(energies_eV - width_eV / 2.0,
+                                 energies_eV[-1] + width_eV / 2.0)
+        edges_eV = np.asarray(edges_eV, dtype=float)
+
+        matrix = rebin_matrix(energies_eV, edges_eV)
+        if fwhm_eV is not None:
+            matrix = response_matrix(energies_eV, fwhm_eV).dot(matrix)
+
+        self._energies_eV = energies_eV
+        self._edges_eV = edges_eV
+        self._matrix = matrix
+        self._matrix2 = matrix.square()
+
+    @classmethod
+    def from_detector(cls, energies_eV, detector, fwhm_eV=None):
+        """
+        Creates a processor to the channels of a
+        :class:`PhotonSpectrumDetector`.
+        """
+        return cls(energies_eV, channel_edges(detector), fwhm_eV)
+
+    def __call__(self, spectra, uncertainties=None):
+        """
+        Processes one spectrum or a batch of spectra.
+
+        :arg spectra: array of shape ``(len(energies_eV),)`` or
+            ``(number of spectra, len(energies_eV))``
+        :arg uncertainties: uncertainties of the spectra, same shape, which
+            are propagated assuming independent channels
+        :return: processed spectra and, if *uncertainties* is specified,
+            their uncertainties
+        """
+        values = self._matrix.apply(spectra)
+
+        if uncertainties is None:
+            return values
+
+        uncertainties = np.asarray(uncertainties, dtype=float)
+        uncertainties = np.sqrt(self._matrix2.apply(uncertainties ** 2))
+
+        return values, uncertainties
+
+    def process_results(self, results):
+        """
+        Processes the total and background spectra of several
+        :class:`PhotonSpectrumResult` simulated on the same channels, in a
+        single batch.
+
+        :return: :class:`list` of :class:`PhotonSpectrumResult`
+        """
+        results = list(results)
+        if not results:
+            return []
+
+        spectra = []
+        for result in results:
+            total = result.get_total()
+            if len(total) != len(self._energies_eV) or \
+                    not np.allclose(total[:, 0], self._energies_eV):
+                raise ValueError('Spectrum is not on the channels of the processor')
+            spectra.append(total)
+            spectra.append(result.get_background())
+        spectra = np.array(spectra)
+
+        values, uncertainties = self(spectra[:, :, 1], spectra[:, :, 2])
+
+        energies_eV = self.energies_eV
+        processed = []
+        for i in range(0, len(spectra), 2):
+            total = np.array([energies_eV, values[i], uncertainties[i]]).T
+            background = np.array([energies_eV, values[i + 1], uncertainties[i + 1]]).T
+            processed.append(PhotonSpectrumResult(total, background))
+
+        return processed
+
+    @property
+    def energies_eV(self):
+        """
+        Centres of the processed channels.
+        """
+        return (self._edges_eV[:-1] + self._edges_eV[1:]) / 2.0
+
+    @property
+    def edges_eV(self):
+        return self._edges_eV
+
+    @property
+    def matrix(self):
+        """
+        Processing matrix (:class:`SparseMatrix`).
+        """
+        return self._matrix
+
+def process_photon_spectrum(result, detector, fwhm_eV=None):
+    """
+    Returns the :class:`PhotonSpectrumResult` imported from WinX-Ray on the
+    channels requested by *detector*, optionally convolved with a detector
+    response of width *fwhm_eV*.
+    """
+    energies_eV = result.get_total()[:, 0]
+    processor = SpectrumProcessor.from_detector(energies_eV, detector, fwhm_eV)
+    return processor.process_results([result])[0]
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`store` -- Content-addressed store of WinX-Ray results
+================================================================================
+
+.. module:: store
+   :synopsis: Content-addressed store of WinX-Ray results
+
+Alternative to the ZIP archive of each simulation.
+Each file of the work directory is stored once, compressed, under the SHA-256
+digest of its content in a store shared by all simulations.
+A JSON manifest per simulation maps the relative paths of the files to their
+digest.
+Identical files (options file, empty distributions, etc.) are therefore only
+stored once.
+Only whole files are deduplicated: two files differing by a single byte are
+stored as two objects.
+The manifest also records the number of bytes its simulation added to the
+store (new compressed objects), as opposed to the size of its files.
+
+Layout of the store::
+
+    <rootdir>/objects/<2 first hex digits>/<remaining hex digits>
+    <rootdir>/manifests/<name>.json
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import io
+import json
+import time
+import zlib
+import hashlib
+import logging
+import tempfile
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+
+class ContentStore(object):
+
+    def __init__(self, rootdir, compresslevel=6):
+        """
+        Creates or opens a content-addressed store in *rootdir*.
+        """
+        self._rootdir = rootdir
+        self._objectsdir = os.path.join(rootdir, 'objects')
+        self._manifestsdir = os.path.join(rootdir, 'manifests')
+        self._compresslevel = compresslevel
+
+        for dirpath in [self._objectsdir, self._manifestsdir]:
+            if not os.path.exists(dirpath):
+                os.makedirs(dirpath)
+
+    def _object_path(self, digest):
+        return os.path.join(self._objectsdir, digest[:2], digest[2:])
+
+    def _write_atomic(self, filepath, data):
+        dirpath = os.path.dirname(filepath)
+        if not os.path.exists(dirpath):
+            try:
+                os.makedirs(dirpath)
+            except OSError: # Created by another process
+                pass
+
+        fd, tmpfilepath = tempfile.mkstemp(dir=dirpath, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmpfilepath, filepath)
+        except:
+            os.remove(tmpfilepath)
+            raise
+
+    def manifest_path(self, name):
+        """
+        Returns the path of the manifest of the simulation *name*.
+        """
+        return os.path.join(self._manifestsdir, name + '.json')
+
+    def _put_object(self, data):
+        # Returns the digest and the number of bytes written
+        digest = hashlib.sha256(data).hexdigest()
+        filepath = self._object_path(digest)
+
+        try:
+            os.utime(filepath, None) # Protect against garbage collection
+        except FileNotFoundError: # Not stored or deleted by a concurrent gc
+            compressed = zlib.compress(data, self._compresslevel)
+            self._write_atomic(filepath, compressed)
+            return digest, len(compressed)
+
+        return digest, 0
+
+    def put_object(self, data):
+        """
+        Stores *data* (:class:`bytes`) and returns its digest.
+        Nothing is written if the same content is already stored.
+        """
+        return self._put_object(data)[0]
+
+    def get_object(self, digest):
+        """
+        Returns the content (:class:`bytes`) stored under *digest*.
+        """
+        with open(self._object_path(digest), 'rb') as fp:
+            return zlib.decompress(fp.read())
+
+    def put(self, name, dirpath):
+        """
+        Stores all files of *dirpath* as the simulation *name* and returns the
+        path of its manifest.
+        """
+        files = {}
+        added = 0
+
+        for subdirpath, _dirnames, filenames in os.walk(dirpath):
+            for filename in filenames:
+                filepath = os.path.join(subdirpath, filename)
+                with open(filepath, 'rb') as fp:
+                    data = fp.read()
+
+                relpath = os.path.relpath(filepath, dirpath).replace(os.sep, '/')
+                digest, size = self._put_object(data)
+                files[relpath] = [digest, len(data)]
+                added += size
+
+        manifestpath = self.manifest_path(name)
+        data = json.dumps({'name': name, 'files': files, 'added': added},
+                          indent=1, sort_keys=True)
+        self._write_atomic(manifestpath, data.encode('utf8'))
+
+        logging.debug('Stored %i files of %s in %s (%i bytes added)',
+                      len(files), name, self._rootdir, added)
+
+        return manifestpath
+
+    def __contains__(self, name):
+        return os.path.exists(self.manifest_path(name))
+
+    def names(self):
+        """
+        Returns the names of the stored simulations.
+        """
+        return sorted(os.path.splitext(filename)[0] \
+                      for filename in os.listdir(self._manifestsdir) \
+                      if filename.endswith('.json'))
+
+    def namelist(self, name):
+        """
+        Returns the relative paths of the files of the simulation *name*.
+        """
+        return sorted(self._read_manifest(name))
+
+    def _read_manifest(self, name):
+        with open(self.manifest_path(name), 'r') as fp:
+            return json.load(fp)['files']
+
+    def open(self, name, relpath):
+        """
+        Returns a binary file object of the file *relpath* of the simulation
+        *name*.
+        """
+        digest, _size = self._read_manifest(name)[relpath]
+        return io.BytesIO(self.get_object(digest))
+
+    def added_size(self, name):
+        """
+        Returns the number of bytes written in the store by the simulation
+        *name*, including its manifest.
+        The files already stored by other simulations are not counted.
+        """
+        manifestpath = self.manifest_path(name)
+        with open(manifestpath, 'r') as fp:
+            added = json.load(fp)['added']
+        return added + os.path.getsize(manifestpath)
+
+    def remove(self, name):
+        """
+        Removes the manifest of the simulation *name*.
+        Its objects are only deleted by :meth:`gc`.
+        """
+        os.remove(self.manifest_path(name))
+
+    def gc(self, grace_s=3600.0):
+        """
+        Deletes the objects which are not referenced by any manifest.
+        Objects written or reused during the last *grace_s* seconds are kept,
+        so that simulations being stored are not affected.
+
+        :return: number of deleted objects and number of bytes freed
+        """
+        referenced = set()
+        for name in self.names():
+            for digest, _size in self._read_manifest(name).values():
+                referenced.add(digest)
+
+        count = 0
+        size = 0
+        now = time.time()
+
+        for prefix in os.listdir(self._objectsdir):
+            dirpath = os.path.join(self._objectsdir, prefix)
+            for filename in os.listdir(dirpath):
+                if prefix + filename in referenced:
+                    continue
+
+                filepath = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(filepath)
+                    if now - stat.st_mtime < grace_s:
+                        continue
+
+                    os.remove(filepath)
+                except FileNotFoundError: # Deleted by a concurrent gc
+                    continue
+                count += 1
+                size += stat.st_size
+
+        logging.debug('Garbage collection of %s: %i objects (%i bytes) deleted',
+                      self._rootdir, count, size)
+
+        return count, size
+
+    @property
+    def rootdir(self):
+        return self._rootdir
@@ -0,0 +1,598 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`stub` -- Stand-in WinX-Ray executable
+================================================================================
+
+.. module:: stub
+   :synopsis: Stand-in WinX-Ray executable
+
+Command line program behaving like WinX-Ray: it reads a WinX-Ray options file
+(``.wxc``), waits for a simulated duration and writes a result folder with
+the same layout and file formats as a real simulation
+(see ``testdata/al_10keV_1ke_001``).
+The number of channels, films, distribution points and the elements are
+taken from the options file.
+The results are synthetic: they have realistic magnitudes and shapes, but
+no physical meaning.
+
+The stub allows the whole pipeline (export, launch, import, archive) to be
+exercised and benchmarked on any computer.
+To use it, set the ``exe`` option of the ``winxray`` settings section to the
+``winxray-stub`` script installed with this package.
+
+The behaviour of the stub is controlled by environment variables:
+
+  * ``WINXRAY_STUB_DURATION_S``: simulated duration (default: 0 s)
+  * ``WINXRAY_STUB_TIME_PER_ELECTRON_S``: additional simulated duration per
+    electron (default: 0 s)
+  * ``WINXRAY_STUB_EXITCODE``: exit code returned after writing the results
+    (default: 0)
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import sys
+import math
+import time
+import shutil
+import logging
+import configparser
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+
+# Globals and constants variables.
+ENV_DURATION = 'WINXRAY_STUB_DURATION_S'
+ENV_TIME_PER_ELECTRON = 'WINXRAY_STUB_TIME_PER_ELECTRON_S'
+ENV_EXITCODE = 'WINXRAY_STUB_EXITCODE'
+
+VERSION = '1.4.1.2'
+
+# Relative intensity of the lines of each family
+LINES = {'K': [('Ka1', 1.0, 1.0), ('Ka2', 0.9995, 0.5), ('Kb1', 1.044, 0.015)],
+         'L': [('La1', 1.0, 1.0), ('Lb1', 1.045, 0.5)]}
+
+def _moseley_energy_eV(z, family):
+    if family == 'K':
+        return 10.2 * (z - 1) ** 2
+    else:
+        return 1.89 * (z - 7.4) ** 2
+
+def _reuter_bse_yield(z):
+    return -0.0254 + 0.016 * z - 1.86e-4 * z ** 2 + 8.3e-7 * z ** 3
+
+def read_wxc(filepath):
+    """
+    Reads a WinX-Ray options file and returns a
+    :class:`ConfigParser <configparser.ConfigParser>`.
+    """
+    config = configparser.ConfigParser(strict=False, interpolation=None)
+    config.optionxform = str # Keep case of options
+    with open(filepath, 'r') as fp:
+        config.read_file(fp)
+    return config
+
+def _format(value):
+    if isinstance(value, str):
+        return value
+    return '%g' % value
+
+class _ResultWriter(object):
+
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+
+    def write_lines(self, filename, lines):
+        filepath = os.path.join(self.dirpath, filename)
+        with open(filepath, 'w', newline='\r\n') as fp:
+            for line in lines:
+                fp.write(line + '\n')
+
+    def write_table(self, filename, header, columns, trailing_blank=False):
+        """
+        Writes a tab separated table with one column per array of *columns*.
+        """
+        lines = ['\t'.join(header) + '\t']
+        data = np.column_stack(columns)
+        for row in data:
+            lines.append('\t'.join(map(_format, row)) + '\t')
+        if trailing_blank:
+            lines.append('')
+        self.write_lines(filename, lines)
+
+class SyntheticSimulation(object):
+
+    def __init__(self, config, seed=None):
+        """
+        Creates a synthetic simulation from the parsed WinX-Ray options
+        (see :func:`read_wxc`).
+        """
+        self._config = config
+
+        if seed is None:
+            seed = abs(self._getint('PhysicsModel', 'Idum', 34628))
+        self._rng = np.random.RandomState(seed)
+
+        # Region 1 defines the specimen
+        self.elements = []
+        for i in range(1, self._getint('Region_1', 'NbElement', 0) + 1):
+            z = self._getint('Region_1', 'Z_%i' % i, 0)
+            symbol = self._get('Region_1', 'Symbol_%i' % i, 'Z%i' % z)
+            wf = self._getfloat('Region_1', 'WeightFraction_%i' % i, 1.0)
+            self.elements.append((z, symbol, wf))
+        if not self.elements:
+            self.elements.append((13, 'Al', 1.0))
+
+        self.density_g_cm3 = self._getfloat('Region_1', 'MeanDensity', 5.0)
+        self.mean_z = sum(z * wf for z, _, wf in self.elements)
+
+    def _get(self, section, option, default):
+        try:
+            return self._config.get(section, option)
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            return default
+
+    def _getint(self, section, option, default):
+        return int(float(self._get(section, option, default)))
+
+    def _getfloat(self, section, option, default):
+        return float(self._get(section, option, default))
+
+    def _getbool(self, section, option, default=False):
+        return bool(self._getint(section, option, int(default)))
+
+    @property
+    def energy_eV(self):
+        return self._getfloat('OptionSimulation', 'IncidentEnergy', 10.0) * 1e3
+
+    @property
+    def nelectron(self):
+        return self._getint('OptionSimulation', 'NbElectron', 1000)
+
+    @property
+    def range_nm(self):
+        """
+        Kanaya-Okayama electron range.
+        """
+        a = 2.0 * self.mean_z
+        r_um = 0.0276 * a * (self.energy_eV / 1e3) ** 1.67 / \
+            (self.mean_z ** 0.889 * self.density_g_cm3)
+        return r_um * 1e3
+
+    def iterlines(self):
+        """
+        Yields the X-ray lines excited by the beam as tuples (z, symbol,
+        weight fraction, family, line, energy in eV, relative intensity,
+        edge energy in eV).
+        """
+        for z, symbol, wf in self.elements:
+            for family in ['K', 'L']:
+                if family == 'L' and z < 20:
+                    continue
+
+                energy_eV = _moseley_energy_eV(z, family)
+                edge_eV = energy_eV * 1.1
+                if energy_eV < 100 or edge_eV >= self.energy_eV:
+                    continue
+
+                for line, factor, weight in LINES[family]:
+                    yield z, symbol, wf, family, line, energy_eV * factor, weight, edge_eV
+                break # Only the most energetic family excited
+
+    def _noise(self, values, errors):
+        return np.clip(values + self._rng.normal(0.0, 1.0, np.shape(values)) * errors / 3.0,
+                       0.0, None)
+
+    def _relative_error(self):
+        return 0.2 / math.sqrt(self.nelectron)
+
+    # Electron distributions
+
+    def _write_bse(self, writer):
+        nelectron = self.nelectron
+        eta = min(max(_reuter_bse_yield(self.mean_z), 0.0), 1.0)
+        eta_error = 3.0 * math.sqrt(eta * (1.0 - eta) / nelectron)
+        nbse = int(round(eta * nelectron))
+        range_nm = self.range_nm
+
+        writer.write_lines('BSEGeneral.txt',
+            ['BSE Result File: General', '',
+             'BackScattered Coeffcient: \t%g' % eta,
+             'Error BSC (3S): \t%g' % eta_error,
+             'BackScattered Coeffcient Theoritical: \t%g' % eta,
+             'Number of BackScattered Electron: \t%i' % nbse,
+             'Number of Electron: \t%i' % nelectron, '',
+             'BackScattered Courant: \t%g' % (eta * 1e-9),
+             'Incident Courant: \t1e-09', '',
+             'Range Depth (nm): \t0', '',
+             'Range Radial (nm): \t%g' % -range_nm, '',
+             'Range Energy (eV): \t0', '',
+             'Range Angular (rad): \t0', ''])
+
+        if self._getbool('ResultDistribution', 'ComputeBSEDepth'):
+            n = self._getint('ResultDistribution', 'NbBSEDepth', 200)
+            z = -np.linspace(0.0, range_nm * 0.5, n + 1)[1:]
+            self._write_distribution(writer, 'BSEDepth.txt',
+                                     ['#Z (nm)', 'n(z)', 'Error n(z) (3S)'],
+                                     z, np.exp(z / (0.1 * range_nm)), eta)
+
+        if self._getbool('ResultDistribution', 'ComputeBSERadial'):
+            n = self._getint('ResultDistribution', 'NbBSERadial', 200)
+            r = np.linspace(0.0, range_nm, n + 1)[1:]
+            self._write_distribution(writer, 'BSERadial.txt',
+                                     ['#R (nm)', 'n(r)', 'Error n(r) (3S)'],
+                                     r, r * np.exp(-r / (0.2 * range_nm)), eta)
+
+        if self._getbool('ResultDistribution', 'ComputeBSELateral'):
+            n = self._getint('ResultDistribution', 'NbBSELateral', 50)
+            x = np.linspace(-range_nm, range_nm, n)
+            for axis in ['X', 'Y']:
+                self._write_distribution(writer, 'BSELat%s.txt' % axis,
+                                         ['#%s (nm)' % axis.lower(),
+                                          'n(%s)' % axis.lower(),
+                                          'Error n(%s) (3S)' % axis.lower()],
+                                         x, np.exp(-(x / (0.3 * range_nm)) ** 2), eta)
+
+        if self._getbool('ResultDistribution', 'ComputeBSEEnergy'):
+            n = self._getint('ResultDistribution', 'NbBSEEnergy', 50)
+            e = (np.arange(n) + 0.5) * self.energy_eV / n
+            x = e / self.energy_eV
+            writer.write_table('BSEEnergy.txt',
+                               ['#E (eV)', 'E/Eo', 'n(E)', 'Error n(E) (3S)',
+                                'cum n(E)', 'Error cum n(E) (3S)'],
+                               [e, x] + self._distribution(x ** 2 * (1.0 - x) ** 0.5, eta))
+
+        if self._getbool('ResultDistribution', 'ComputeBSEAngular'):
+            n = self._getint('ResultDistribution', 'NbBSEAngular', 200)
+            theta_rad = np.linspace(-math.pi / 2, math.pi / 2, n + 2)[1:-1]
+            theta_deg = np.degrees(theta_rad)
+            theoretical = np.cos(theta_rad) * eta / n
+            writer.write_table('BSEAngular.txt',
+                               ['#Exit Angle (deg)', 'Exit Angle (deg) Ori',
+                                'Exit Angle (rad)', 'n(o)', 'Error n(o) (3S)',
+                                'cumul n(o)', 'Error cumul n(o) (3S)',
+                                'n(o) theoritical', 'cumul n(o) theoritical'],
+                               [theta_deg, (theta_deg + 360.0) % 360.0, theta_rad] + \
+                               self._distribution(np.cos(theta_rad), eta) + \
+                               [theoretical, np.cumsum(theoretical)])
+
+        if self._getbool('ResultDistribution', 'ComputeBSESpatial'):
+            n = self._getint('ResultDistribution', 'NbBSESpatial', 50)
+            self._write_spatial(writer, 'BSESpatial.txt',
+                                ['#X (nm)', 'Y (nm)', 'n(x,y)', 'Error n(x,y) (3S)'],
+                                n, range_nm, 0.3 * range_nm, eta)
+
+    def _write_electron(self, writer, prefix):
+        range_nm = self.range_nm
+        total = self.nelectron if prefix == 'EnergyLoss' else \
+            int(self.nelectron * (1.0 - _reuter_bse_yield(self.mean_z)))
+
+        if prefix == 'EnergyLoss':
+            writer.write_lines('EnergyLossGeneral.txt',
+                               ['Nb Electron: \t%i' % self.nelectron, '',
+                                'EnergyLoss Result File: General',
+                                'Path: \t%s' % writer.dirpath, ''])
+            keys = {'Depth': 'NbEnergyLossDepth', 'Radial': 'NbEnergyLossRadial',
+                    'Lateral': 'NbEnergyLossSpatial', 'Spatial': 'NbEnergyLossSpatial'}
+        else:
+            writer.write_lines('ElectronGeneral.txt',
+                               ['Nb Electron Total\t%i' % total, '',
+                                'Nb Electron Depth\t%i' % total, '',
+                                'Nb Electron Radial\t%i' % total, '',
+                                'Nb Electron Spatial\t%i' % total, '',
+                                'Nb Electron Lat X\t%i' % total,
+                                'Nb Electron Lat Y\t%i' % total, ''])
+            keys = {'Depth': 'NbElectronDepth', 'Radial': 'NbElectronRadial',
+                    'Lateral': 'NbElectronLateral', 'Spatial': 'NbElectronSpatial'}
+
+        if self._getbool('ResultDistribution', 'Compute%sDepth' % prefix):
+            n = self._getint('ResultDistribution', keys['Depth'], 200)
+            z = np.linspace(-range_nm, 0.0, n)
+            x = -z / range_nm
+            values = x * np.exp(-(2.0 * x) ** 2) * total / n
+            writer.write_table('%sDepth.txt' % prefix,
+                               ['Z (nm)', 'gD(Z) (#e/nm)', 'Var gD(Z) (#e/nm)'],
+                               [z, values, values * self._relative_error() * 10])
+
+        if self._getbool('ResultDistribution', 'Compute%sRadial' % prefix):
+            n = self._getint('ResultDistribution', keys['Radial'], 200)
+            r = np.linspace(0.0, range_nm, n)
+            values = r * np.exp(-r / (0.2 * range_nm)) * total / n
+            writer.write_table('%sRadial.txt' % prefix,
+                               ['R (nm)', 'gR(R) (#e/nm)', 'Var gR(R) (#e/nm)'],
+                               [r, values, values * self._relative_error() * 10])
+
+        if self._getbool('ResultDistribution', 'Compute%sLateral' % prefix):
+            n = self._getint('ResultDistribution', keys['Lateral'], 50)
+            x = np.linspace(-range_nm, range_nm, n)
+            values = np.exp(-(x / (0.3 * range_nm)) ** 2) * total / n
+            for axis in ['X', 'Y']:
+                writer.write_table('%sLat%s.txt' % (prefix, axis),
+                                   ['%s (nm)' % axis, 'g%s (#e/nm)' % axis,
+                                    'Var g%s (#e/nm)' % axis],
+                                   [x, values, values * self._relative_error() * 10])
+
+        if self._getbool('ResultDistribution', 'Compute%sSpatial' % prefix):
+            n = self._getint('ResultDistribution', keys['Spatial'], 50)
+            self._write_spatial(writer, '%sSpatial.txt' % prefix,
+                                ['X (nm)', 'Z (nm)', 'g(x,z)', 'Var g(x,z)'],
+                                n, range_nm, 0.3 * range_nm, total / float(n * n))
+
+    def _distribution(self, shape, total):
+        shape = np.asarray(shape, dtype=float)
+        values = shape / shape.sum() * total
+        errors = 3.0 * np.sqrt(values * (1.0 - values / max(total, 1e-12)) / self.nelectron)
+        values = self._noise(values, errors)
+        cumulative = np.cumsum(values)
+        cumulative_errors = 3.0 * np.sqrt(np.clip(cumulative * (1.0 - cumulative), 0.0, None) / self.nelectron)
+        return [values, errors, cumulative, cumulative_errors]
+
+    def _write_distribution(self, writer, filename, header, xs, shape, total):
+        header = header + ['cum ' + header[1], 'Error cum ' + header[1] + ' (3S)']
+        writer.write_table(filename, header, [xs] + self._distribution(shape, total))
+
+    def _write_spatial(self, writer, filename, header, n, extent_nm, width_nm, total):
+        x = np.linspace(-extent_nm, extent_nm, n)
+        xx, yy = np.meshgrid(x, x, indexing='ij')
+        shape = np.exp(-(xx ** 2 + yy ** 2) / width_nm ** 2).ravel()
+        values, errors = self._distribution(shape, total)[:2]
+        writer.write_table(filename, header, [xx.ravel(), yy.ravel(), values, errors],
+                           trailing_blank=True)
+
+    # X-ray results
+
+    def _phirhoz(self, z_nm, edge_eV, chi_cm2_g):
+        """
+        Returns the generated and emitted phi-rho-z of a line at depths
+        *z_nm* (negative values).
+        """
+        u = self.energy_eV / edge_eV
+        range_nm = self.range_nm * max(1.0 - u ** -1.67, 0.05)
+        x = -z_nm / range_nm
+
+        phi0 = 1.0 + 2.8 * _reuter_bse_yield(self.mean_z) * (1.0 - 0.9 / u)
+        generated = 1.8 * np.exp(-(2.2 * x) ** 2) - (1.8 - phi0) * np.exp(-15.0 * x)
+        generated = np.clip(generated, 0.0, None)
+
+        rhoz_g_cm2 = -z_nm * 1e-7 * self.density_g_cm3
+        emitted = generated * np.exp(-chi_cm2_g * rhoz_g_cm2)
+
+        return generated, emitted
+
+    def _write_xray(self, writer):
+        nelectron = self.nelectron
+        nfilm = self._getint('OptionAdvanced', 'NbFilm', 100)
+        toa_rad = math.radians(self._getfloat('OptionSimulation', 'TOA', 40.0))
+        relerror = self._relative_error()
+
+        thickness_nm = self.range_nm / nfilm
+        z_nm = -self.range_nm + (np.arange(nfilm) + 0.5) * thickness_nm
+
+        intensity_rows = []
+        gen_header, gen_columns = ['Z (nm)'], [z_nm]
+        em_header, em_columns = ['Z (nm)'], [z_nm]
+        families = set()
+        lines = []
+
+        for z, symbol, wf, family, line, energy_eV, weight, edge_eV in self.iterlines():
+            mac_cm2_g = 400.0 * (1487.0 / energy_eV) ** 2.7
+            chi_cm2_g = mac_cm2_g / math.sin(toa_rad)
+            generated, emitted = self._phirhoz(z_nm, edge_eV, chi_cm2_g)
+
+            u = self.energy_eV / edge_eV
+            igen = 18.0 * nelectron * wf * weight * (u - 1.0) ** 1.67
+            iem = igen * emitted.sum() / max(generated.sum(), 1e-12)
+            idet = iem * 5.3
+            lines.append((energy_eV, idet))
+
+            intensity_rows.append([line, '%i' % z, energy_eV,
+                                   igen, igen * relerror, iem, iem * relerror,
+                                   idet, 0.0, 1.47098e-05, mac_cm2_g])
+
+            errors = np.sqrt(generated * generated.max() / (nelectron * 0.05))
+            em_header += ['%s%iPRZ' % (line, z), '%s%iError PRZ' % (line, z)]
+            em_columns += [self._noise(emitted, errors), errors]
+
+            if (z, family) not in families:
+                families.add((z, family))
+                gen_header += ['%s%iPRZ' % (family, z), '%s%iError PRZ' % (family, z)]
+                gen_columns += [self._noise(generated, errors), errors]
+
+        writer.write_lines('XCharIntensity_Reg1.txt',
+            ['Line\tZ\tEnergy Line\tI Generated\tError I Generated\t'
+             'I Emitted\tError I Emitted\tI Detected\tError I Detected\t'
+             'Film Intensity\tMAC (cm2/g)\t'] + \
+            ['\t'.join(map(_format, row)) + '\t' for row in intensity_rows])
+
+        writer.write_table('XCharPRZGen_Reg1.txt', gen_header, gen_columns)
+        writer.write_table('XCharPRZEm_Reg1.txt', em_header, em_columns)
+
+        if self._getbool('OptionSimulation', 'XRayComputeBackground'):
+            self._write_spectrum(writer, lines)
+            self._write_bremsstrahlung(writer, z_nm)
+
+    def _write_spectrum(self, writer, lines):
+        nchannel = max(self._getint('XRayDetector', 'NbChannel', 1000), 1)
+        width_eV = self.energy_eV / nchannel
+        energies = (np.arange(nchannel) + 0.5) * width_eV
+
+        # Kramers' law with a low energy absorption cut-off
+        background = 2.6e-3 * self.nelectron * (width_eV / 10.0) * self.mean_z * \
+            (self.energy_eV - energies) / energies * np.exp(-(1000.0 / energies) ** 3)
+
+        characteristic = np.zeros(nchannel)
+        for energy_eV, intensity in lines:
+            sigma_eV = math.sqrt(3.5 * energy_eV + 3000.0) / 2.3548
+            characteristic += intensity * 0.1 * width_eV / (sigma_eV * math.sqrt(2 * math.pi)) * \
+                np.exp(-0.5 * ((energies - energy_eV) / sigma_eV) ** 2)
+
+        total = background + characteristic
+        header = ['#E Channel (eV)', 'Total', 'Background', 'Characteristic']
+        writer.write_table('XSEmi_Spectrum.txt', header,
+                           [energies, total, background, characteristic],
+                           trailing_blank=True)
+
+        factor = 5.21e-11 * 1000.0 / self.nelectron
+        writer.write_table('XSEmi_Spectrum_N.txt', header,
+                           [energies, total * factor, background * factor,
+                            characteristic * factor],
+                           trailing_blank=True)
+
+        sums = [total.sum(), background.sum(), characteristic.sum()]
+        writer.write_lines('XSIntensity.txt',
+            ['Type\tTotal Intensity\tBackground Intensity\tCharacteristic Intensity\t',
+             'Emi Spectrum\t' + '\t'.join(map(_format, sums)) + '\t',
+             'Emi Spectrum_N\t' + '\t'.join(_format(v * factor) for v in sums) + '\t'])
+
+    def _write_bremsstrahlung(self, writer, z_nm):
+        energies = np.arange(50.0, self.energy_eV, 100.0)
+        generated = {}
+        emitted = {}
+        for energy_eV in energies:
+            chi_cm2_g = 400.0 * (1487.0 / energy_eV) ** 2.7 / math.sin(math.radians(40.0))
+            generated[energy_eV], emitted[energy_eV] = \
+                self._phirhoz(z_nm, max(energy_eV, 100.0), chi_cm2_g)
+
+        film = 1e-6 / energies
+        writer.write_table('XBremPRZFilm_Reg1.txt', ['E(ev)', 'I film'],
+                           [energies, film])
+
+        for suffix, data in [('Gen', generated), ('Em', emitted)]:
+            header = ['E(ev)->, Z(nm)|']
+            columns = [z_nm]
+            for energy_eV in energies:
+                header += [_format(energy_eV), 'Error']
+                columns += [data[energy_eV], data[energy_eV] * 0.1]
+            writer.write_table('XBremPRZ%s_Reg1.txt' % suffix, header, columns)
+
+            ee, zz = np.meshgrid(energies, z_nm, indexing='ij')
+            values = np.concatenate([data[energy_eV] for energy_eV in energies])
+            writer.write_table('XBremPRZ3D%s_Reg1.txt' % suffix,
+                               ['E (ev)', 'Z (nm)', 'PRZ', 'Error'],
+                               [ee.ravel(), zz.ravel(), values, values * 0.1],
+                               trailing_blank=True)
+
+    def _write_general(self, writer, time_s):
+        seconds = int(time_s)
+        milliseconds = int(round((time_s - seconds) * 1000))
+        hours, remainder = divmod(seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+
+        def _line(label, value):
+            return '%-36s%s' % (label, value)
+
+        lines = [_line('General results files', ''), '',
+                 _line('Version:', '\t' + VERSION),
+                 _line('Temps de Calcul : %i:%i:%i:%i' % \
+                       (hours, minutes, seconds, milliseconds), ''),
+                 _line('Temps de Calcul (sec): %g' % time_s, ''), '',
+                 _line('Efficiency:', '%g' % (self.nelectron / max(time_s, 1e-3))), '',
+                 _line('Simulation parameter', ''),
+                 _line('Incident energy (eV):', '\t%g' % self.energy_eV),
+                 _line('Diameter (nm):', '\t%g' % \
+                       self._getfloat('OptionSimulation', 'BeamDiameter', 0.0)),
+                 _line('Init position X (nm):', '\t0'),
+                 _line('Init position Y (nm):', '\t0'),
+                 _line('Number of electron:', '\t%i' % self.nelectron),
+                 _line('Incident angle (deg):', '\t%g' % \
+                       self._getfloat('OptionSimulation', 'BeamTheta', 0.0)),
+                 _line('Incident phi angle  (deg):', '\t%g' % \
+                       self._getfloat('OptionSimulation', 'BeamPhi', 0.0)), '',
+                 _line('Mean density (g/cm^3):', '\t%g' % self.density_g_cm3),
+                 _line('Mean Z:', '\t%g' % self.mean_z),
+                 _line('Mean MA:', '\t%g' % (2.0 * self.mean_z)), '',
+                 _line('Specimen property', ''),
+                 _line('Number of element:', '\t%i' % len(self.elements)), '',
+                 '%-8s%-20s%-20s' % ('Element', 'Mass fraction', 'Atomic fraction')]
+        for z, _symbol, wf in self.elements:
+            lines.append('%-8i%-20s%-20s' % (z, _format(wf), _format(wf)))
+
+        writer.write_lines('GenResult.txt', lines)
+
+    def run(self, dirpath, duration_s=0.0):
+        """
+        Writes the results in *dirpath*, as WinX-Ray would after a simulation
+        of *duration_s* seconds.
+        The electron distributions are written halfway through the
+        simulation, the X-ray results and general results at the end.
+        """
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath)
+        writer = _ResultWriter(dirpath)
+
+        start = time.time()
+        time.sleep(duration_s / 2.0)
+
+        if self._getbool('ResultDistribution', 'ComputeBSEDistribution'):
+            self._write_bse(writer)
+        if self._getbool('ResultDistribution', 'ComputeElectronDistribution'):
+            self._write_electron(writer, 'Electron')
+        if self._getbool('ResultDistribution', 'ComputeEnergyLossDistribution'):
+            self._write_electron(writer, 'EnergyLoss')
+
+        time.sleep(max(duration_s - (time.time() - start), 0.0))
+
+        if self._getbool('OptionSimulation', 'XRayCompute'):
+            self._write_xray(writer)
+        self._write_general(writer, time.time() - start)
+
+def _find_results_path(config, wxcfilepath):
+    for section in config.sections():
+        for option, value in config.items(section):
+            if option.lower() in ('resultspath', 'resultpath') and value:
+                return value.replace('\\', os.sep)
+    return os.path.dirname(os.path.abspath(wxcfilepath))
+
+def _create_result_dirpath(basedir, name):
+    index = 1
+    while True:
+        dirpath = os.path.join(basedir, '%s_%03i' % (name, index))
+        if not os.path.exists(dirpath):
+            return dirpath
+        index += 1
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) != 1:
+        sys.stderr.write('Usage: winxray-stub <options.wxc>\n')
+        return 2
+
+    # The worker converts the path to a Windows path
+    wxcfilepath = argv[0]
+    if os.sep != '\\':
+        wxcfilepath = wxcfilepath.replace('\\', os.sep)
+
+    config = read_wxc(wxcfilepath)
+    simulation = SyntheticSimulation(config)
+
+    duration_s = float(os.environ.get(ENV_DURATION, 0.0))
+    duration_s += float(os.environ.get(ENV_TIME_PER_ELECTRON, 0.0)) * \
+        simulation.nelectron
+
+    name = os.path.splitext(os.path.basename(wxcfilepath))[0]
+    basedir = _find_results_path(config, wxcfilepath)
+    dirpath = _create_result_dirpath(basedir, name)
+    logging.debug('Writing synthetic results in %s', dirpath)
+
+    sys.stdout.write('WinXRay stub: %s (%g s)\n' % (wxcfilepath, duration_s))
+    sys.stdout.flush()
+
+    simulation.run(dirpath, duration_s)
+    shutil.copy(wxcfilepath, os.path.join(dirpath, 'Option.wxc'))
+
+    return int(os.environ.get(ENV_EXITCODE, 0))
+
+if __name__ == '__main__': #pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`surrogate` -- Interpolating surrogate of WinX-Ray simulations
+================================================================================
+
+.. module:: surrogate
+   :synopsis: Interpolating surrogate of WinX-Ray simulations
+
+The surrogates interpolate the results of existing simulations over the beam
+energy and the composition, to answer queries (e.g. the emitted intensity at
+12.5 keV when simulations exist at 12 and 13 keV) without running WinX-Ray.
+
+The results are arranged on a grid (see :mod:`cube`) and interpolated
+multilinearly between the nodes surrounding the query.
+Each estimate comes with:
+
+  * the statistical uncertainty, propagated from the uncertainties of the
+    nodes;
+  * the interpolation error, estimated from the second divided difference
+    along each axis (i.e. the curvature of the results).
+    Along an axis with only two nodes, the curvature is unknown and the
+    slope is assumed to possibly change by its own value over the interval,
+    i.e. the error is the difference between the two nodes times
+    ``t (1 - t)`` (a quarter of the difference in the middle).
+
+An estimate is trusted when the query is inside the grid, all the nodes
+surrounding it were simulated and the interpolation error is below a relative
+tolerance.
+The :class:`SurrogateEngine` only runs WinX-Ray for the queries that are not
+trusted and adds the new results to its surrogate.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import logging
+import threading
+import itertools
+from bisect import bisect_right
+from collections import namedtuple, OrderedDict
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.program.winxray.cube import \
+    PhotonIntensityCube, make_axes, default_parameters as cube_default_parameters
+from pymontecarlo.program.winxray.phiz import resample
+
+# Globals and constants variables.
+Estimate = namedtuple('Estimate', ['value', 'uncertainty', 'error', 'trusted'])
+
+def default_parameters(optionss):
+    """
+    Returns the default interpolation parameters: the beam energy and the
+    weight fraction of each element found in *optionss*, except the last
+    one, which is not independent since the weight fractions sum to 1.
+    """
+    parameters = cube_default_parameters(optionss)
+    parameters = [(name, func) for name, func in parameters if name != 'showers']
+
+    wfs = [name for name, _func in parameters if name.startswith('wf_')]
+    if wfs:
+        parameters = [(name, func) for name, func in parameters if name != wfs[-1]]
+
+    return parameters
+
+class GridInterpolant(object):
+
+    def __init__(self, axes, values, uncertainties):
+        """
+        Creates a multilinear interpolant over a grid.
+
+        :arg axes: :class:`OrderedDict` of parameter name to the sorted array
+            of its values
+        :arg values: array of shape ``(len(axis1), len(axis2), ...) + shape``
+            where ``shape`` is the shape of the interpolated quantity (e.g.
+            number of lines or depths).
+            Missing nodes are NaN.
+        :arg uncertainties: uncertainties of the values, same shape
+        """
+        self._axes = OrderedDict((name, np.asarray(axis, dtype=float)) \
+                                 for name, axis in axes.items())
+        self._values = np.asarray(values, dtype=float)
+        self._uncertainties = np.asarray(uncertainties, dtype=float)
+
+        # Python lists for fast bisection
+        self._lists = [axis.tolist() for axis in self._axes.values()]
+
+    def _locate(self, params):
+        """
+        Returns, for each axis, the index of the lower node of the cell
+        containing the query and the fractional position in the cell,
+        or ``None`` if the query is outside the grid.
+        """
+        cells = []
+
+        for name, axis in zip(self._axes, self._lists):
+            try:
+                x = params[name]
+            except KeyError:
+                raise ValueError('Missing parameter: %s' % name)
+
+            n = len(axis)
+            tolerance = 1e-9 * max(1.0, abs(x))
+
+            if x < axis[0] - tolerance or x > axis[-1] + tolerance:
+                return None
+
+            if n == 1:
+                cells.append((0, 0.0))
+                continue
+
+            i = min(max(bisect_right(axis, x) - 1, 0), n - 2)
+            t = (x - axis[i]) / (axis[i + 1] - axis[i])
+            if abs(t) < 1e-9:
+                t = 0.0
+            elif abs(1.0 - t) < 1e-9:
+                t = 1.0
+            cells.append((i, min(max(t, 0.0), 1.0)))
+
+        return cells
+
+    def _curvature_error(self, k, cells):
+        """
+        Estimates the interpolation error along axis *k* from the second
+        divided difference of the nodes nearest to the query, or from the
+        difference between the two nodes of an axis without a third one.
+        """
+        i, t = cells[k]
+        if t == 0.0 or t == 1.0:
+            return 0.0
+
+        axis = self._lists[k]
+        if len(axis) < 3:
+            index = [j + int(round(s)) for j, s in cells]
+            index[k] = i
+            fa = self._values[tuple(index)]
+            index[k] = i + 1
+            fb = self._values[tuple(index)]
+            return np.abs(fb - fa) * t * (1.0 - t)
+
+        # Three consecutive nodes around the cell
+        m = i if i + 2 < len(axis) else i - 1
+        x0, x1, x2 = axis[m:m + 3]
+
+        # Other axes at their nearest node
+        index = [j + int(round(s)) for j, s in cells]
+        f = []
+        for j in range(m, m + 3):
+            index[k] = j
+            f.append(self._values[tuple(index)])
+        f0, f1, f2 = f
+
+        d2 = ((f2 - f1) / (x2 - x1) - (f1 - f0) / (x1 - x0)) / (x2 - x0)
+
+        xa, xb = axis[i], axis[i + 1]
+        x = xa + t * (xb - xa)
+        return np.abs(d2) * (x - xa) * (xb - x)
+
+    def __call__(self, **params):
+        """
+        Returns the interpolated value, its statistical uncertainty and the
+        estimated interpolation error at the parameter values, or ``None``
+        if the query is outside the grid.
+        The values are NaN where one of the surrounding nodes is missing.
+        """
+        cells = self._locate(params)
+        if cells is None:
+            return None
+
+        shape = self._values.shape[len(self._axes):]
+        value = np.zeros(shape)
+        variance = np.zeros(shape)
+        corners = [[(i, 1.0 - t), (i + 1, t)] if t > 0.0 else [(i, 1.0)]
+                   for i, t in cells]
+
+        for corner in itertools.product(*corners):
+            index = tuple(i for i, _w in corner)
+            weight = 1.0
+            for _i, w in corner:
+                weight *= w
+            if weight == 0.0:
+                continue
+
+            value = value + weight * self._values[index]
+            variance = variance + (weight * self._uncertainties[index]) ** 2
+
+        error = np.zeros(shape)
+        for k in range(len(cells)):
+            error = error + self._curvature_error(k, cells)
+
+        return value, np.sqrt(variance), error
+
+    @property
+    def axes(self):
+        return self._axes
+
+class IntensitySurrogate(object):
+
+    def __init__(self, cube, parameters, tolerance=0.02):
+        """
+        Creates a surrogate of the photon intensities.
+
+        :arg cube: :class:`PhotonIntensityCube` of the simulated intensities
+        :arg parameters: list of (name, function) of the axes of the cube
+        :arg tolerance: maximum relative interpolation error of a trusted
+            estimate
+        """
+        self._cube = cube
+        self._parameters = list(parameters)
+        self._tolerance = tolerance
+        self._interpolant = GridInterpolant(cube.axes, cube.values,
+                                            cube.uncertainties)
+
+    @classmethod
+    def from_results(cls, items, key, lines, parameters=None,
+                     absorption=True, tolerance=0.02):
+        """
+        Creates a surrogate from the results of simulations.
+
+        :arg items: iterable of (options, results)
+        :arg key: key of the :class:`PhotonIntensityDetector` in the results
+        :arg lines: X-ray lines (e.g. ``['Al Ka1', 'Cu La1']``)
+        :arg parameters: list of (name, function) where the function returns
+            the value of the parameter for an options.
+            By default, see :func:`default_parameters`.
+        """
+        items = list(items)
+        if parameters is None:
+            parameters = default_parameters([options for options, _ in items])
+
+        cube = PhotonIntensityCube.from_results(items, key, lines, parameters,
+                                                absorption)
+        return cls(cube, parameters, tolerance)
+
+    def _params(self, options, params):
+        if options is not None:
+            params = dict((name, func(options)) for name, func in self._parameters)
+        return params
+
+    def query(self, line, options=None, **params):
+        """
+        Returns the :class:`Estimate` of the intensity of *line*, either for
+        *options* or for the specified parameter values
+        (e.g. ``energy_eV=12.5e3, wf_13=0.4``).
+        """
+        params = self._params(options, params)
+        j = self._cube.lines.index(line)
+
+        result = self._interpolant(**params)
+        if result is None:
+            return Estimate(np.nan, np.nan, np.nan, False)
+
+        value, uncertainty, error = result
+        value, uncertainty, error = value[j], uncertainty[j], error[j]
+        trusted = bool(np.isfinite(value) and np.isfinite(error) and \
+                       error <= self._tolerance * abs(value))
+
+        return Estimate(value, uncertainty, error, trusted)
+
+    @property
+    def cube(self):
+        return self._cube
+
+    @property
+    def tolerance(self):
+        return self._tolerance
+
+class PhiZSurrogate(object):
+
+    def __init__(self, axes, lines, depths_m, values, uncertainties,
+                 parameters, tolerance=0.02):
+        """
+        Creates a surrogate of the phi-rho-z distributions.
+        The distributions are resampled on a common depth grid
+        *depths_m*, and *values* has the shape
+        ``(len(axis1), len(axis2), ..., len(lines), len(depths_m))``.
+        """
+        self._lines = list(lines)
+        self._depths_m = np.asarray(depths_m, dtype=float)
+        self._parameters = list(parameters)
+        self._tolerance = tolerance
+        self._interpolant = GridInterpolant(axes, values, uncertainties)
+
+    @classmethod
+    def from_results(cls, items, key, lines, parameters=None,
+                     absorption=True, tolerance=0.02, ndepth=100):
+        """
+        Creates a surrogate from the :class:`PhiZResult` of simulations.
+        Arguments are the same as :meth:`IntensitySurrogate.from_results`.
+
+        :arg ndepth: number of points of the common depth grid, which extends
+            to the deepest point of all the distributions
+        """
+        items = list(items)
+        if parameters is None:
+            parameters = default_parameters([options for options, _ in items])
+
+        # Distributions of each run, as (depth, value, uncertainty)
+        distributions = []
+        max_depth_m = 0.0
+        for _options, results in items:
+            dists = []
+            for line in lines:
+                try:
+                    dist = np.asarray(results[key].get(line, absorption=absorption))
+                except (ValueError, KeyError):
+                    dist = None
+                else:
+                    max_depth_m = max(max_depth_m, np.abs(dist[:, 0]).max())
+                dists.append(dist)
+            distributions.append(dists)
+
+        depths_m = np.linspace(0.0, max_depth_m, ndepth)
+
+        coordinates = np.array([[func(options) for _, func in parameters]
+                                for options, _ in items]).reshape(len(items), -1)
+        axes, indexes = make_axes(parameters, coordinates)
+
+        shape = tuple(len(axis) for axis in axes.values()) + (len(lines), ndepth)
+        values = np.full(shape, np.nan)
+        uncertainties = np.full(shape, np.nan)
+
+        for i, dists in enumerate(distributions):
+            node = tuple(index[i] for index in indexes)
+            for j, dist in enumerate(dists):
+                if dist is None:
+                    continue
+                values[node + (j,)], uncertainties[node + (j,)] = \
+                    resample(dist, depths_m)
+
+        return cls(axes, lines, depths_m, values, uncertainties,
+                   parameters, tolerance)
+
+    def query(self, line, options=None, **params):
+        """
+        Returns the :class:`Estimate` of the phi-rho-z distribution of
+        *line*, with arrays over :attr:`depths_m`.
+        The estimate is trusted if the interpolation error is below the
+        tolerance relative to the maximum of the distribution.
+        """
+        if options is not None:
+            params = dict((name, func(options)) for name, func in self._parameters)
+        j = self._lines.index(line)
+
+        result = self._interpolant(**params)
+        if result is None:
+            nan = np.full(len(self._depths_m), np.nan)
+            return Estimate(nan, nan, nan, False)
+
+        value, uncertainty, error = [x[j] for x in result]
+        trusted = bool(np.all(np.isfinite(value)) and \
+                       np.all(np.isfinite(error)) and \
+                       error.max() <= self._tolerance * np.abs(value).max())
+
+        return Estimate(value, uncertainty, error, trusted)
+
+    @property
+    def depths_m(self):
+        return self._depths_m
+
+class SurrogateEngine(object):
+
+    def __init__(self, key, lines, run=None, items=(), parameters=None,
+                 absorption=True, tolerance=0.02):
+        """
+        Creates an engine answering intensity queries from a surrogate and
+        falling back to simulations outside its trusted region.
+
+        :arg key: key of the :class:`PhotonIntensityDetector` in the results
+        :arg lines: X-ray lines of the queries
+        :arg run: function taking an options and returning its results
+            (e.g. running a :class:`Worker`), called for the queries that
+            cannot be trusted. If ``None``, untrusted estimates are returned.
+        :arg items: (options, results) of the existing simulations
+        """
+        self._key = key
+        self._lines = list(lines)
+        self._run = run
+        self._parameters = parameters
+        self._absorption = absorption
+        self._tolerance = tolerance
+
+        self._items = list(items)
+        self._surrogate = None
+        self._lock = threading.RLock()
+
+        self.nsimulations = 0
+
+    def add(self, options, results):
+        """
+        Adds the results of a simulation to the surrogate.
+        """
+        with self._lock:
+            self._items.append((options, results))
+            self._surrogate = None
+
+    def _get_surrogate(self):
+        with self._lock:
+            if self._surrogate is None and self._items:
+                self._surrogate = \
+                    IntensitySurrogate.from_results(self._items, self._key,
+                                                    self._lines, self._parameters,
+                                                    self._absorption,
+                                                    self._tolerance)
+            return self._surrogate
+
+    def intensity(self, options, line):
+        """
+        Returns the :class:`Estimate` of the intensity of *line* for
+        *options*.
+        If the surrogate cannot be trusted for *options*, the simulation is
+        run and its result is returned (with no interpolation error).
+        """
+        surrogate = self._get_surrogate()
+
+        if surrogate is not None:
+            try:
+                estimate = surrogate.query(line, options)
+            except ValueError: # New parameter (e.g. element)
+                estimate = Estimate(np.nan, np.nan, np.nan, False)
+            if estimate.trusted or self._run is None:
+                return estimate
+        elif self._run is None:
+            return Estimate(np.nan, np.nan, np.nan, False)
+
+        logging.debug('Surrogate not trusted for %s, running simulation',
+                      options.name)
+        results = self._run(options)
+        self.add(options, results)
+        self.nsimulations += 1
+
+        value, uncertainty = \
+            results[self._key].intensity(line, absorption=self._absorption)
+        return Estimate(value, uncertainty, 0.0, True)
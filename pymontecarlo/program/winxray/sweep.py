@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`sweep` -- Streaming results of a sweep of WinX-Ray simulations
+================================================================================
+
+.. module:: sweep
+   :synopsis: Streaming results of a sweep of WinX-Ray simulations
+
+The simulations of a sweep are run concurrently and their results are
+yielded as soon as each simulation completes, instead of being accumulated
+in a list.
+At most *max_inflight* simulations are running or waiting to be consumed at
+any time, so the memory used by the results does not grow with the size of
+the sweep.
+The results can also be spilled to disk and loaded back only when needed.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import pickle
+import shutil
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.program.winxray.resources import max_concurrency
+import pymontecarlo.program.winxray.metrics as metrics
+import pymontecarlo.program.winxray.precision as precision
+
+# Globals and constants variables.
+
+class SpilledResults(object):
+
+    def __init__(self, filepath):
+        """
+        Results of a simulation saved in *filepath*, loaded on demand.
+        """
+        self._filepath = filepath
+
+    def __repr__(self):
+        return '<%s(%s)>' % (self.__class__.__name__, self._filepath)
+
+    @classmethod
+    def dump(cls, results, filepath, compresslevel=None):
+        """
+        Saves *results* in *filepath* and returns the spilled results.
+
+        :arg compresslevel: if not ``None``, the arrays of the results are
+            compressed losslessly with this zlib level
+            (see :func:`dumps <pymontecarlo.program.winxray.precision.dumps>`)
+        """
+        with open(filepath, 'wb') as fp:
+            if compresslevel is None:
+                pickle.dump(results, fp, pickle.HIGHEST_PROTOCOL)
+            else:
+                fp.write(precision.dumps(results, compresslevel))
+        return cls(filepath)
+
+    def load(self):
+        """
+        Loads and returns the results.
+        """
+        with open(self._filepath, 'rb') as fp:
+            return precision.loads(fp.read())
+
+    def remove(self):
+        """
+        Removes the saved results.
+        """
+        if os.path.exists(self._filepath):
+            os.remove(self._filepath)
+
+    @property
+    def filepath(self):
+        return self._filepath
+
+def worker_runner(program, outputdir):
+    """
+    Returns a function running the simulation of an options with a new
+    worker of *program* in its own temporary work directory, which is
+    removed once the results are imported.
+    """
+    def _run(options):
+        workdir = tempfile.mkdtemp(prefix='winxray_')
+        try:
+            worker = program.worker_class(program)
+            return worker.run(options, outputdir, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return _run
+
+def iter_results(optionss, run, max_inflight=None, spill_dir=None,
+                 spill_compresslevel=None):
+    """
+    Runs the simulations of *optionss* and yields (options, results) in the
+    order the simulations complete.
+
+    :arg optionss: iterable of options, consumed as simulations are started
+    :arg run: function taking an options and returning its results
+        (see :func:`worker_runner`)
+    :arg max_inflight: maximum number of simulations running or completed
+        but not yet consumed (default: see
+        :func:`max_concurrency <pymontecarlo.program.winxray.resources.max_concurrency>`)
+    :arg spill_dir: if not ``None``, the results are saved in this directory
+        and yielded as :class:`SpilledResults`
+    :arg spill_compresslevel: compression of the spilled results (see
+        :meth:`SpilledResults.dump`)
+
+    A new simulation is only started when the results of a previous one
+    are consumed.
+    If a simulation fails, its exception is raised when its results would
+    have been yielded and the simulations not yet started are cancelled.
+    """
+    if max_inflight is None:
+        max_inflight = max_concurrency()
+    if max_inflight < 1:
+        raise ValueError('At least one simulation must be in flight')
+
+    if spill_dir is not None and not os.path.exists(spill_dir):
+        os.makedirs(spill_dir)
+
+    def _run(index, options):
+        metrics.QUEUED.dec()
+        results = run(options)
+        if spill_dir is None:
+            return results
+
+        filename = '%05i_%s.pickle' % (index, options.name.replace(os.sep, '_'))
+        return SpilledResults.dump(results, os.path.join(spill_dir, filename),
+                                   spill_compresslevel)
+
+    optionss = iter(enumerate(optionss))
+    inflight = {}
+
+    def _submit(executor):
+        for index, options in optionss:
+            metrics.QUEUED.inc()
+            inflight[executor.submit(_run, index, options)] = options
+            return True
+        return False
+
+    with ThreadPoolExecutor(max_inflight) as executor:
+        try:
+            while len(inflight) < max_inflight and _submit(executor):
+                pass
+
+            while inflight:
+                done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    options = inflight.pop(future)
+                    results = future.result()
+                    logging.debug('Results of %s available (%i in flight)',
+                                  options.name, len(inflight))
+
+                    yield options, results
+                    del results # Release before starting the next one
+
+                    _submit(executor)
+        finally:
+            for future in inflight:
+                if future.cancel():
+                    metrics.QUEUED.dec()
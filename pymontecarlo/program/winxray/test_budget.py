@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import math
+
+# Third party modules.
+import numpy as np
+
+from pyxray.transition import from_string
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.budget import \
+    ElectronBudgetPlanner, allocate, get_showers, with_showers
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.results.result import PhotonKey, PhotonIntensityResult
+
+# Globals and constants variables.
+
+def _simulate(ops):
+    # Relative uncertainty of 1, 2 and 4 / sqrt(showers)
+    factor = ops.beam.energy_eV / 1e3
+    relunc = factor / math.sqrt(get_showers(ops))
+
+    key = PhotonKey(from_string('Al Ka1'), True, PhotonKey.P)
+    return {'xray': PhotonIntensityResult({key: [10.0, 10.0 * relunc]})}
+
+class TestElectronBudgetPlanner(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.optionss = []
+        for i, energy_eV in enumerate([1e3, 2e3, 4e3]):
+            ops = Options('sim%i' % i)
+            ops.beam.energy_eV = energy_eV
+            ops.limits.add(ShowersLimit(5000))
+            self.optionss.append(ops)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def _create_planner(self, total_electrons, target_relunc=None):
+        return ElectronBudgetPlanner('xray', ['Al Ka1'], _simulate,
+                                     total_electrons, 100, target_relunc)
+
+    def testskeleton(self):
+        planner = self._create_planner(21300)
+        allocations = planner.plan(planner.pilot(self.optionss))
+
+        self.assertEqual([1000, 4000, 16000],
+                         [allocation.showers for allocation in allocations])
+        for allocation in allocations:
+            self.assertAlmostEqual(math.sqrt(1e-3), allocation.relunc, 6)
+
+    def testplan_target(self):
+        planner = self._create_planner(1e6, 0.05)
+        allocations = planner.plan(planner.pilot(self.optionss))
+        self.assertEqual([400, 1600, 6400],
+                         [allocation.showers for allocation in allocations])
+
+        planner = self._create_planner(1e6, 0.2)
+        allocations = planner.plan(planner.pilot(self.optionss))
+        self.assertEqual([0, 0, 400],
+                         [allocation.showers for allocation in allocations])
+        self.assertAlmostEqual(0.1, allocations[0].relunc, 6)
+
+    def testplan_budget_too_small(self):
+        planner = self._create_planner(200)
+        items = planner.pilot(self.optionss)
+        self.assertRaises(ValueError, planner.plan, items)
+
+    def testrun(self):
+        planner = self._create_planner(1e6, 0.2)
+        items = list(planner.run(self.optionss))
+
+        self.assertEqual(['sim0', 'sim1', 'sim2'], [ops.name for ops, _ in items])
+        self.assertEqual([100, 100, 400], [get_showers(ops) for ops, _ in items])
+        self.assertEqual(5000, get_showers(self.optionss[0]))
+
+    def testplan_no_counts(self):
+        planner = ElectronBudgetPlanner('xray', ['Al Ka1', 'Al Kb1'], _simulate,
+                                        1e6, 100, 0.2)
+        items = planner.pilot(self.optionss)
+
+        # No counts of Al Kb1 in the pilot simulations
+        allocations = planner.plan(items)
+        self.assertEqual([2500, 2500, 2500],
+                         [allocation.showers for allocation in allocations])
+
+        key = PhotonKey(from_string('Al Ka1'), True, PhotonKey.P)
+        items[0][1]['xray'] = PhotonIntensityResult({key: [0.0, 0.0]})
+        allocations = planner.plan(items)
+        self.assertEqual(2500, allocations[0].showers)
+
+    def testallocate(self):
+        showers, reluncs = allocate([1.0, 4.0, np.nan], 600, 100)
+        self.assertEqual([120, 480, 0], list(showers))
+        self.assertTrue(np.allclose([1.0 / 120 ** 0.5] * 2 + [0.0], reluncs))
+
+        showers, _ = allocate([1.0, 100.0], 1000, 100)
+        self.assertEqual([0, 1000], list(showers))
+
+    def testwith_showers(self):
+        ops = with_showers(self.optionss[0], 100)
+        self.assertEqual(100, get_showers(ops))
+        self.assertEqual(5000, get_showers(self.optionss[0]))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import sys
+import subprocess
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.config import program
+
+# Globals and constants variables.
+
+class TestWinXRayProgram(TestCase):
+
+    def testskeleton(self):
+        self.assertEqual('WinXRay', program.name)
+        self.assertEqual('winxray', program.alias)
+
+    def testlazy_import(self):
+        code = "import sys; import pymontecarlo.program.winxray.config; " + \
+            "print(any(name.startswith('winxraytools') or " + \
+            "name == 'pymontecarlo.program.winxray.importer' " + \
+            "for name in sys.modules))"
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(b'False', output.strip())
+
+    def testclasses(self):
+        from pymontecarlo.program.winxray.converter import Converter
+        from pymontecarlo.program.winxray.exporter import Exporter
+        from pymontecarlo.program.winxray.importer import Importer
+        from pymontecarlo.program.winxray.worker import Worker
+
+        self.assertIs(Converter, program.converter_class)
+        self.assertIs(Exporter, program.exporter_class)
+        self.assertIs(Importer, program.importer_class)
+        self.assertIs(Worker, program.worker_class)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
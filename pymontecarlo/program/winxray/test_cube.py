@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+import numpy as np
+
+from pyxray.transition import from_string
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.cube import PhotonIntensityCube
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.material import Material
+from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.results.result import PhotonKey, PhotonIntensityResult
+
+# Globals and constants variables.
+
+def _create_item(energy_eV, wf_al, value):
+    ops = Options()
+    ops.beam.energy_eV = energy_eV
+    ops.geometry.body.material = Material({13: wf_al, 29: 1.0 - wf_al}, 'AlCu')
+    ops.limits.add(ShowersLimit(1000))
+
+    intensities = {}
+    for line, factor in [('Al Ka1', 1.0), ('Cu La1', 2.0)]:
+        transition = from_string(line)
+        intensities[PhotonKey(transition, True, PhotonKey.P)] = \
+            [value * factor, value * factor * 0.01]
+        intensities[PhotonKey(transition, False, PhotonKey.P)] = \
+            [value * factor * 1.1, value * factor * 0.01]
+
+    return ops, {'xray': PhotonIntensityResult(intensities)}
+
+class TestPhotonIntensityCube(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        items = [_create_item(10e3, 0.5, 1.0),
+                 _create_item(10e3, 0.25, 2.0),
+                 _create_item(15e3, 0.5, 3.0)]
+        self.cube = PhotonIntensityCube.from_results(items, 'xray',
+                                                     ['Al Ka1', 'Cu La1'])
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertEqual(['energy_eV', 'showers', 'wf_13', 'wf_29'],
+                         list(self.cube.axes.keys()))
+        self.assertEqual((2, 1, 2, 2, 2), self.cube.shape)
+        self.assertEqual(['Al Ka1', 'Cu La1'], self.cube.lines)
+
+    def testget(self):
+        value, unc = self.cube.get('Al Ka1', energy_eV=10e3, wf_13=0.5,
+                                   wf_29=0.5, showers=1000)
+        self.assertAlmostEqual(1.0, value, 4)
+        self.assertAlmostEqual(0.01, unc, 4)
+
+        values, _uncs = self.cube.get('Cu La1', energy_eV=15e3, showers=1000,
+                                      wf_29=0.5)
+        self.assertEqual((2,), values.shape)
+        self.assertTrue(np.isnan(values[0]))
+        self.assertAlmostEqual(6.0, values[1], 4)
+
+        self.assertRaises(ValueError, self.cube.get, 'Al Ka1', energy_eV=20e3)
+        self.assertRaises(ValueError, self.cube.get, 'Al Ka1', unknown=1.0)
+
+    def testdivide(self):
+        axes = {'energy_eV': self.cube.axes['energy_eV']}
+        values = np.array([[2.0, 4.0], [3.0, 6.0]])
+        standards = PhotonIntensityCube(axes, self.cube.lines,
+                                        values, values * 0.01)
+
+        kratios = self.cube.divide(standards)
+        self.assertEqual(self.cube.shape, kratios.shape)
+
+        value, unc = kratios.get('Al Ka1', energy_eV=10e3, wf_13=0.5,
+                                 wf_29=0.5, showers=1000)
+        self.assertAlmostEqual(0.5, value, 4)
+        self.assertAlmostEqual(0.5 * np.sqrt(2) * 0.01, unc, 6)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
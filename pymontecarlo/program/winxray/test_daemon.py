@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+import threading
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.daemon import \
+    (SimulationDaemon, DaemonClient, write_token, read_token, is_loopback,
+     DONE, FAILED, QUEUED, CANCELLED)
+from pymontecarlo.options.options import Options
+
+# Globals and constants variables.
+
+class _Converter(object):
+
+    def convert(self, options):
+        return [options]
+
+class _Exporter(object):
+
+    def digest(self, options):
+        return options.name
+
+class _Program(object):
+
+    name = 'WinXRay'
+    converter_class = _Converter
+    exporter_class = _Exporter
+
+class _Runner(object):
+    """
+    Simulation returning the name of the options and an array, released by
+    an event.
+    """
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.nsimulations = 0
+
+    def __call__(self, job):
+        self.nsimulations += 1
+        self.released.wait(10.0)
+        if job.options.name == 'error':
+            raise RuntimeError('Simulation failed')
+        return {'name': job.options.name, 'values': np.arange(5.0)}
+
+class TestSimulationDaemon(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.runner = _Runner()
+        self.daemon = SimulationDaemon(_Program(), self.tmpdir, capacity=2,
+                                       run=self.runner)
+        self.daemon.serve(0)
+        self.client = DaemonClient(self.daemon.url, self.daemon.token,
+                                   poll_interval_s=0.1)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        self.runner.released.set()
+        self.daemon.shutdown()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testskeleton(self):
+        identifiers = self.client.submit(Options('sim'), 'interactive')
+        self.assertEqual(1, len(identifiers))
+
+        self.runner.released.set()
+        results = self.client.results(identifiers[0], timeout=10.0)
+        self.assertEqual('sim', results['name'])
+        np.testing.assert_allclose(np.arange(5.0), results['values'])
+        self.assertEqual(DONE, self.client.status(identifiers[0])['status'])
+
+    def testcoalesce(self):
+        identifier0, = self.client.submit(Options('sim'))
+        identifier1, = self.client.submit(Options('sim'), 'interactive')
+        self.assertTrue(self.client.status(identifier1)['coalesced'])
+
+        self.runner.released.set()
+        results0 = self.client.results(identifier0, timeout=10.0)
+        results1 = self.client.results(identifier1, timeout=10.0)
+        self.assertEqual('sim', results1['name'])
+        np.testing.assert_allclose(results0['values'], results1['values'])
+        self.assertEqual(1, self.runner.nsimulations)
+
+    def testfailed(self):
+        identifier, = self.client.submit(Options('error'))
+        self.runner.released.set()
+
+        self.assertRaises(RuntimeError, self.client.results, identifier, 10.0)
+        self.assertEqual(FAILED, self.client.status(identifier)['status'])
+
+    def testtimeout(self):
+        identifier, = self.client.submit(Options('sim'))
+        self.assertRaises(TimeoutError, self.client.results, identifier, 0.2)
+
+    def testcancel(self):
+        # Capacity of 2 with 1 reserved slot: one batch simulation at a time
+        self.client.submit(Options('sim0'))
+        identifier, = self.client.submit(Options('sim1'))
+
+        self.assertEqual(QUEUED, self.client.status(identifier)['status'])
+        self.assertTrue(self.client.cancel(identifier))
+        self.assertEqual(CANCELLED, self.client.status(identifier)['status'])
+
+    def testunknown(self):
+        self.assertRaises(KeyError, self.client.status, 'abcdef')
+
+    def testtoken(self):
+        client = DaemonClient(self.daemon.url, 'wrong')
+        self.assertRaises(RuntimeError, client.submit, Options('sim'))
+
+        filepath = os.path.join(self.tmpdir, 'daemon.token')
+        write_token(filepath, self.daemon.token)
+        self.assertEqual(self.daemon.token, read_token(filepath))
+        if os.name == 'posix':
+            self.assertEqual(0o600, os.stat(filepath).st_mode & 0o777)
+
+    def testloopback(self):
+        self.assertTrue(is_loopback('127.0.0.1'))
+        self.assertTrue(is_loopback('::1'))
+        self.assertTrue(is_loopback('localhost'))
+        self.assertFalse(is_loopback('0.0.0.0'))
+        self.assertFalse(is_loopback('example.com'))
+
+        daemon = SimulationDaemon(_Program(), self.tmpdir, run=self.runner)
+        self.assertRaises(ValueError, daemon.serve, 0, '0.0.0.0')
+        daemon.shutdown()
+
+    def testmetrics(self):
+        self.client.submit(Options('sim'))
+        self.assertIn('winxray_daemon_jobs_total', self.client.metrics())
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
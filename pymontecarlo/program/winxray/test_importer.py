@@ -12,13 +12,18 @@ __license__ = "GPL v3"
 import unittest
 import logging
 import os
+import tempfile
+import shutil
+from zipfile import ZipFile
 
 # Third party modules.
+import numpy as np
 
 # Local modules.
 from pymontecarlo.testcase import TestCase
 
 from pymontecarlo.program.winxray.importer import Importer
+from pymontecarlo.program.winxray.store import ContentStore
 from pymontecarlo.options.options import Options
 from pymontecarlo.options.detector import \
     (PhotonIntensityDetector, PhiZDetector, ElectronFractionDetector,
@@ -27,6 +32,9 @@ from pymontecarlo.options.limit import ShowersLimit
 
 # Globals and constants variables.
 
+class _UnknownDetector(TimeDetector):
+    pass
+
 class TestImporter(TestCase):
 
     def setUp(self):
@@ -44,9 +52,9 @@ class TestImporter(TestCase):
 
         self.ops.limits.add(ShowersLimit(1000))
 
-        dirpath = os.path.join(os.path.dirname(__file__),
-                               'testdata', 'al_10keV_1ke_001')
-        self.results = Importer().import_(self.ops, dirpath)
+        self.dirpath = os.path.join(os.path.dirname(__file__),
+                                    'testdata', 'al_10keV_1ke_001')
+        self.results = Importer().import_(self.ops, self.dirpath)
 
     def tearDown(self):
         TestCase.tearDown(self)
@@ -89,6 +97,26 @@ class TestImporter(TestCase):
         self.assertAlmostEqual(1.3379, prz[0, 1], 4)
         self.assertAlmostEqual(0.03524, prz[0, 2], 4)
 
+    def test_detector_phi_z_float32(self):
+        importer = Importer('float32')
+        results = importer.import_(self.ops, self.dirpath)
+        self.assertAlmostEqual(1.3379, results['prz'].get('Al Ka1')[0, 1], 4)
+
+        # Arrays given to the results
+        expected = Importer().read_phi_z(self.dirpath)
+        distributions = importer.read_phi_z(self.dirpath)
+        self.assertEqual(set(expected), set(distributions))
+        for key, distribution in distributions.items():
+            self.assertEqual(np.float32, distribution.dtype)
+            self.assertTrue(np.allclose(expected[key], distribution, rtol=1e-6))
+
+        detector = self.ops.detectors['spectrum']
+        total, background = \
+            importer.read_photon_spectrum(self.ops, detector, self.dirpath)
+        self.assertEqual(np.float32, total.dtype)
+        self.assertEqual(np.float32, background.dtype)
+        self.assertAlmostEqual(1485, total[148, 0], 4)
+
     def test_detector_photon_spectrum(self):
         result = self.results['spectrum']
         factor = 1000 * 0.459697694132 * 10.0 # Normalization
@@ -110,6 +138,70 @@ class TestImporter(TestCase):
         self.assertAlmostEqual(194.188 / factor, background[148, 1], 4)
         self.assertAlmostEqual(0.0, background[148, 2], 4)
 
+class TestImporterArchive(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.ops = Options()
+        self.ops.detectors['time'] = TimeDetector()
+        self.ops.detectors['showers'] = ShowersStatisticsDetector()
+        self.ops.limits.add(ShowersLimit(1000))
+
+        dirpath = os.path.join(os.path.dirname(__file__),
+                               'testdata', 'al_10keV_1ke_001')
+        self.zipfilepath = os.path.join(self.tmpdir, 'test.zip')
+        with ZipFile(self.zipfilepath, 'w') as zipfile:
+            zipfile.write(os.path.join(dirpath, 'Option.wxc'), 'test.wxc')
+            for filename in os.listdir(dirpath):
+                zipfile.write(os.path.join(dirpath, filename),
+                              'al_10keV_1ke_001/' + filename)
+
+        self.importer = Importer()
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testimport_unknown_detector(self):
+        self.ops.detectors['unknown'] = _UnknownDetector()
+        with self.assertLogs(level=logging.WARNING):
+            results = Importer().import_(self.ops, self.dirpath)
+        self.assertNotIn('unknown', results)
+        self.assertIn('xray', results)
+
+    def testimport_archive(self):
+        results = self.importer.import_archive(self.ops, self.zipfilepath)
+        self.assertAlmostEqual(64.486, results['time'].simulation_time_s, 3)
+        self.assertEqual(1000, results['showers'].showers)
+
+    def testimport_store(self):
+        dirpath = os.path.join(os.path.dirname(__file__), 'testdata')
+        store = ContentStore(os.path.join(self.tmpdir, 'store'))
+        store.put('test', dirpath)
+
+        results = self.importer.import_store(self.ops, store, 'test')
+        self.assertAlmostEqual(64.486, results['time'].simulation_time_s, 3)
+        self.assertEqual(1000, results['showers'].showers)
+
+    def testimport_archives(self):
+        items = [(self.ops, self.zipfilepath)] * 3
+        resultss = self.importer.import_archives(items, max_workers=2)
+        self.assertEqual(3, len(resultss))
+        for results in resultss:
+            self.assertEqual(1000, results['showers'].showers)
+
+    def testimport_archives_processes(self):
+        items = [(self.ops, self.zipfilepath)] * 3
+        resultss = self.importer.import_archives(items, max_workers=2,
+                                                 processes=True)
+        self.assertEqual(3, len(resultss))
+        for results in resultss:
+            self.assertEqual(1000, results['showers'].showers)
+            self.assertAlmostEqual(64.486, results['time'].simulation_time_s, 3)
+
 if __name__ == '__main__': #pragma: no cover
     logging.getLogger().setLevel(logging.DEBUG)
     unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.index import ResultIndex
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.material import Material
+from pymontecarlo.options.detector import PhotonIntensityDetector
+from pymontecarlo.options.limit import ShowersLimit
+
+# Globals and constants variables.
+
+class TestResultIndex(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = ResultIndex(os.path.join(self.tmpdir, 'index.sqlite'))
+
+        dirpath = os.path.join(os.path.dirname(__file__),
+                               'testdata', 'al_10keV_1ke_001')
+
+        for name, energy_eV in [('sim1', 10e3), ('sim2', 15e3)]:
+            ops = Options(name)
+            ops.beam.energy_eV = energy_eV
+            ops.geometry.body.material = Material.pure(13)
+            ops.detectors['xray'] = PhotonIntensityDetector((0, 1), (2, 3))
+            ops.limits.add(ShowersLimit(1000))
+            self.index.add(ops, dirpath, archive=name + '.zip')
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testskeleton(self):
+        self.assertEqual(2, len(self.index))
+        self.assertIn('sim1', self.index)
+        self.assertNotIn('sim3', self.index)
+
+    def testget(self):
+        data = self.index.get('sim1')
+        factor = 1000 * 0.459697694132 # Normalization
+
+        self.assertEqual('sim1.zip', data['archive'])
+        self.assertAlmostEqual(10e3, data['energy_eV'], 4)
+        self.assertEqual(1000, data['nelectron'])
+        self.assertAlmostEqual(64.486, data['time_s'], 3)
+        self.assertAlmostEqual(0.152, data['bse_yield'], 3)
+        self.assertEqual({13: 1.0}, data['composition'])
+
+        val, unc = data['intensities'][('Al Ka1', True)]
+        self.assertAlmostEqual(276142 / factor, val, 3)
+        self.assertAlmostEqual(1668.34 / factor, unc, 3)
+
+        self.assertIsNone(self.index.get('sim3'))
+
+    def testadd_replace(self):
+        ops = Options('sim1')
+        ops.geometry.body.material = Material.pure(13)
+        ops.limits.add(ShowersLimit(1000))
+        dirpath = os.path.join(os.path.dirname(__file__),
+                               'testdata', 'al_10keV_1ke_001')
+        self.index.add(ops, dirpath)
+
+        self.assertEqual(2, len(self.index))
+        self.assertEqual({}, self.index.get('sim1')['intensities'])
+
+    def testquery(self):
+        self.assertEqual(2, len(self.index.query()))
+
+        rows = self.index.query('Al Ka1', energy_eV=(12e3, 20e3),
+                                nelectron=(500, None))
+        self.assertEqual(1, len(rows))
+        self.assertEqual('sim2', rows[0]['name'])
+        self.assertGreater(rows[0]['value'], 0.0)
+
+        self.assertEqual(0, len(self.index.query('Cu Ka1')))
+        self.assertEqual(0, len(self.index.query(nelectron=(100000, None))))
+        self.assertEqual(2, len(self.index.query(elements={13: (0.9, 1.0)})))
+        self.assertEqual(0, len(self.index.query(elements={29: None})))
+        self.assertEqual(0, len(self.index.query('Al Ka1', intensity=(1e6, None))))
+        self.assertRaises(ValueError, self.index.query, intensity=(0, 1))
+
+    def testremove(self):
+        self.index.remove('sim1')
+        self.assertEqual(1, len(self.index))
+        self.assertEqual(1, len(self.index.query('Al Ka1')))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.journal import \
+    SweepJournal, SIMULATED, IMPORTED
+
+# Globals and constants variables.
+
+class TestSweepJournal(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, 'journal.jsonl')
+
+        self.archive = os.path.join(self.tmpdir, 'sim1.zip')
+        open(self.archive, 'w').close()
+
+        self.journal = SweepJournal(self.filepath)
+        self.journal.record('sim1', 'abc', SIMULATED, self.archive)
+        self.journal.record('sim1', 'abc', IMPORTED, self.archive)
+        self.journal.record('sim2', 'def', SIMULATED, self.archive)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testskeleton(self):
+        self.assertEqual(2, len(self.journal))
+        self.assertIn('sim1', self.journal)
+        self.assertEqual(IMPORTED, self.journal.get('sim1').state)
+
+    def testreload(self):
+        journal = SweepJournal(self.filepath)
+        self.assertEqual(2, len(journal))
+        self.assertEqual(IMPORTED, journal.get('sim1').state)
+        self.assertEqual(SIMULATED, journal.get('sim2').state)
+        self.assertEqual(self.archive, journal.get('sim2').archive)
+
+    def testreload_truncated(self):
+        with open(self.filepath, 'a') as fp:
+            fp.write('{"name": "sim3", "dig')
+
+        journal = SweepJournal(self.filepath)
+        self.assertEqual(2, len(journal))
+        self.assertNotIn('sim3', journal)
+
+    def testlookup(self):
+        self.assertIsNotNone(self.journal.lookup('sim1', 'abc'))
+        self.assertIsNone(self.journal.lookup('sim1', 'xyz'))
+        self.assertIsNone(self.journal.lookup('sim3', 'abc'))
+
+        os.remove(self.archive)
+        self.assertIsNone(self.journal.lookup('sim1', 'abc'))
+
+    def testpending(self):
+        items = [('sim1', 'abc'), ('sim2', 'def'), ('sim3', 'ghi')]
+        pending = self.journal.pending(items)
+        self.assertEqual([('sim2', 'def'), ('sim3', 'ghi')], pending)
+
+    def testrecord_invalid_state(self):
+        self.assertRaises(ValueError, self.journal.record,
+                          'sim1', 'abc', 'unknown')
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+import numpy as np
+
+from pyxray.transition import from_string
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.kratio import \
+    KRatioEngine, StandardsCache, standard_key, ABSENT
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.material import Material
+from pymontecarlo.options.detector import PhotonIntensityDetector
+from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.results.result import PhotonKey, PhotonIntensityResult
+
+# Globals and constants variables.
+
+def _create_options(name, energy_eV, wf_al):
+    ops = Options(name)
+    ops.beam.energy_eV = energy_eV
+    ops.geometry.body.material = Material({13: wf_al, 29: 1.0 - wf_al}, 'AlCu')
+    ops.detectors['xray'] = PhotonIntensityDetector((0, 1), (2, 3))
+    ops.limits.add(ShowersLimit(1000))
+    return ops
+
+class _Runner(object):
+
+    def __init__(self, failed=False):
+        self.names = []
+        self.failed = failed
+
+    def __call__(self, ops):
+        self.names.append(ops.name)
+        return _simulate(ops, self.failed)
+
+def _simulate(ops, failed=False):
+    composition = ops.geometry.body.material.composition
+    energy_keV = ops.beam.energy_eV / 1e3
+
+    intensities = {}
+    for line, z in [('Al Ka1', 13), ('Cu La1', 29)]:
+        value = np.nan if failed else energy_keV * composition.get(z, 0.0)
+        if value:
+            key = PhotonKey(from_string(line), True, PhotonKey.P)
+            intensities[key] = [value, value * 0.01]
+    return {'xray': PhotonIntensityResult(intensities)}
+
+class TestStandardsCache(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, 'standards.jsonl')
+
+        self.key = standard_key(_create_options('sim1', 10e3, 0.5), 'Al Ka1')
+        self.cache = StandardsCache(self.filepath)
+        self.cache.put(self.key, 10.0, 0.1)
+
+        self.key_absent = standard_key(_create_options('sim1', 10e3, 0.5), 'Al Kb1')
+        self.cache.put_absent(self.key_absent)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testskeleton(self):
+        self.assertEqual(2, len(self.cache))
+        self.assertEqual((10.0, 0.1), self.cache.get(self.key))
+        self.assertIs(ABSENT, self.cache.get(self.key_absent))
+
+    def testreload(self):
+        cache = StandardsCache(self.filepath)
+        self.assertEqual(2, len(cache))
+        self.assertEqual((10.0, 0.1), cache.get(self.key))
+        self.assertIs(ABSENT, cache.get(self.key_absent))
+
+class TestKRatioEngine(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.items = []
+        for i, (energy_eV, wf_al) in enumerate([(10e3, 0.25), (10e3, 0.5),
+                                                (15e3, 0.5)]):
+            ops = _create_options('sim%i' % i, energy_eV, wf_al)
+            self.items.append((ops, _simulate(ops)))
+
+        self.runner = _Runner()
+        self.engine = KRatioEngine('xray', ['Al Ka1', 'Cu La1'], self.runner,
+                                   max_inflight=2)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertEqual(['Al Ka1', 'Cu La1'], self.engine.lines)
+        self.assertEqual(0, len(self.engine.cache))
+
+    def testmissing_standards(self):
+        standards = self.engine.missing_standards([ops for ops, _ in self.items])
+
+        # Two elements at two energies
+        self.assertEqual(4, len(standards))
+        for ops, keys in standards:
+            self.assertEqual(1, len(ops.geometry.body.material.composition))
+            self.assertEqual(1, len(keys))
+
+    def testkratios(self):
+        kratios, uncs = self.engine.kratios(self.items)
+
+        self.assertEqual((3, 2), kratios.shape)
+        self.assertTrue(np.allclose([[0.25, 0.75], [0.5, 0.5], [0.5, 0.5]], kratios))
+        self.assertTrue(np.allclose(kratios * 0.01 * np.sqrt(2), uncs))
+
+        self.assertEqual(4, self.engine.nsimulations)
+        self.assertEqual(4, len(self.runner.names))
+
+    def testkratios_memoized(self):
+        self.engine.kratios(self.items[:2])
+        self.assertEqual(2, self.engine.nsimulations)
+
+        self.engine.kratios(self.items)
+        self.assertEqual(4, self.engine.nsimulations)
+
+        self.engine.kratios(self.items)
+        self.assertEqual(4, self.engine.nsimulations)
+
+    def testkratios_absent_element(self):
+        ops = _create_options('sim3', 20e3, 1.0)
+        ops.geometry.body.material = Material.pure(13)
+        kratios, _uncs = self.engine.kratios([(ops, _simulate(ops))])
+
+        # No standard of Cu
+        self.assertEqual(1, self.engine.nsimulations)
+        self.assertAlmostEqual(1.0, kratios[0, 0], 6)
+        self.assertTrue(np.isnan(kratios[0, 1]))
+
+    def testkratios_absent_line(self):
+        engine = KRatioEngine('xray', ['Al Ka1', 'Al Kb1'], self.runner)
+        kratios, _uncs = engine.kratios(self.items[:1])
+        self.assertEqual(2, len(engine.cache))
+        self.assertTrue(np.isnan(kratios[0, 1]))
+
+        # Al Kb1 is absent from the standard: cached, not simulated again
+        engine.kratios(self.items[:1])
+        self.assertEqual(1, engine.nsimulations)
+
+    def testkratios_failed_standard(self):
+        engine = KRatioEngine('xray', ['Al Ka1'], _Runner(failed=True))
+        kratios, _uncs = engine.kratios(self.items[:1])
+        self.assertEqual(0, len(engine.cache))
+        self.assertTrue(np.isnan(kratios[0, 0]))
+
+        # Not cached, simulated again
+        engine.kratios(self.items[:1])
+        self.assertEqual(2, engine.nsimulations)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+from urllib.request import urlopen
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.metrics import MetricsRegistry, REGISTRY
+
+# Globals and constants variables.
+
+class TestMetricsRegistry(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.registry = MetricsRegistry()
+        self.runs = self.registry.counter('runs_total', 'Completed runs')
+        self.active = self.registry.gauge('active', 'Active processes')
+
+        self.runs.inc()
+        self.runs.inc(2)
+        self.active.inc()
+        self.active.inc()
+        self.active.dec()
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testskeleton(self):
+        self.assertAlmostEqual(3.0, self.runs.value, 4)
+        self.assertAlmostEqual(1.0, self.active.value, 4)
+        self.assertIs(self.runs, self.registry.counter('runs_total'))
+        self.assertIn('winxray_runs_total', REGISTRY)
+
+    def testinvalid(self):
+        self.assertRaises(ValueError, self.runs.inc, -1)
+        self.assertRaises(ValueError, self.registry.gauge, 'runs_total')
+
+    def testrender(self):
+        text = self.registry.render()
+        self.assertIn('# HELP runs_total Completed runs\n', text)
+        self.assertIn('# TYPE runs_total counter\n', text)
+        self.assertIn('runs_total 3.0\n', text)
+        self.assertIn('# TYPE active gauge\n', text)
+        self.assertIn('active 1.0\n', text)
+
+    def testwrite(self):
+        filepath = os.path.join(self.tmpdir, 'winxray.prom')
+        self.registry.write(filepath)
+
+        with open(filepath, 'r') as fp:
+            self.assertEqual(self.registry.render(), fp.read())
+        self.assertEqual(['winxray.prom'], os.listdir(self.tmpdir))
+        if os.name == 'posix':
+            self.assertEqual(0o644, os.stat(filepath).st_mode & 0o777)
+
+    def testserve(self):
+        server = self.registry.serve(0)
+        try:
+            url = 'http://127.0.0.1:%i/metrics' % server.server_port
+            text = urlopen(url).read().decode('utf8')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(self.registry.render(), text)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+
+# Third party modules.
+import numpy as np
+
+from pyxray.transition import from_string
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.phiz import PhiZStack, get_stack, line_family
+from pymontecarlo.program.winxray.importer import Importer
+from pymontecarlo.results.result import PhotonKey, PhiZResult
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.detector import PhiZDetector
+
+# Globals and constants variables.
+
+def _create_result(depth_m, npoint, fchi=0.5):
+    # Uniform distribution of Al Ka1 down to depth_m, with z negative
+    z = -np.linspace(0.0, depth_m, npoint)
+    transition = from_string('Al Ka1')
+
+    distributions = {}
+    for absorption, value in [(False, 1.0), (True, fchi)]:
+        dist = np.array([z, np.full(npoint, value), np.full(npoint, 0.1)]).T
+        distributions[PhotonKey(transition, absorption, PhotonKey.P)] = dist
+
+    return PhiZResult(distributions)
+
+class TestPhiZStack(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.result = _create_result(1e-6, 11)
+        self.stack = PhiZStack.from_result(self.result, ['Al Ka1', 'Cu La1'])
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertEqual((2, 11), self.stack.shape)
+        self.assertEqual(0, self.stack.index('Al Ka1'))
+        self.assertAlmostEqual(1e-6, self.stack.depths_m[0, -1], 12)
+
+    def testintegral(self):
+        values, uncs = self.stack.integral(absorption=False)
+        self.assertEqual((2,), values.shape)
+        self.assertAlmostEqual(1e-6, values[0], 12)
+        self.assertAlmostEqual(0.0, values[1], 12)
+        self.assertGreater(uncs[0], 0.0)
+
+    def testmean_depth_m(self):
+        depths = self.stack.mean_depth_m()
+        self.assertAlmostEqual(0.5e-6, depths[0], 12)
+        self.assertTrue(np.isnan(depths[1]))
+
+    def testfchi(self):
+        fchi, unc = self.stack.fchi()
+        self.assertAlmostEqual(0.5, fchi[0], 6)
+        self.assertGreater(unc[0], 0.0)
+        self.assertTrue(np.isnan(fchi[1]))
+
+    def testdepth_percentile_m(self):
+        self.assertAlmostEqual(0.5e-6, self.stack.depth_percentile_m(0.5)[0], 12)
+        self.assertAlmostEqual(0.95e-6, self.stack.depth_percentile_m(0.95)[0], 12)
+        self.assertAlmostEqual(0.0, self.stack.depth_percentile_m(0.0)[0], 12)
+        self.assertTrue(np.isnan(self.stack.depth_percentile_m(0.5)[1]))
+        self.assertRaises(ValueError, self.stack.depth_percentile_m, 1.5)
+
+    def testfrom_results(self):
+        items = [(None, {'prz': _create_result(1e-6, 11, 0.5)}),
+                 (None, {'prz': _create_result(2e-6, 21, 0.25)})]
+        stack = PhiZStack.from_results(items, 'prz', ['Al Ka1'])
+
+        self.assertEqual((2, 1, 21), stack.shape)
+        self.assertTrue(np.allclose([[0.5], [0.25]], stack.fchi()[0]))
+        self.assertTrue(np.allclose([[0.5e-6], [1e-6]], stack.mean_depth_m(),
+                                    atol=5e-8))
+
+    def testfamily(self):
+        # Generated distribution of the K family only, three times larger.
+        # Emitted distribution decreasing linearly, equal at the surface.
+        z = -np.linspace(0.0, 1e-6, 11)
+        distributions = {}
+        for line, absorption, values in \
+                [('Al Ka1', True, np.linspace(1.0, 0.0, 11)),
+                 ('Al K', False, np.full(11, 3.0))]:
+            key = PhotonKey(from_string(line), absorption, PhotonKey.P)
+            distributions[key] = np.array([z, values, np.full(11, 0.1)]).T
+
+        stack = PhiZStack.from_result(PhiZResult(distributions), ['Al Ka1'])
+        self.assertAlmostEqual(0.5, stack.fchi()[0][0], 6)
+        self.assertAlmostEqual(0.5e-6, stack.mean_depth_m(False)[0], 12)
+
+    def testget_stack(self):
+        stack = get_stack(self.result, ['Al Ka1'])
+        self.assertIs(stack, get_stack(self.result, ['Al Ka1']))
+        self.assertIsNot(stack, get_stack(self.result, ['Al Ka1', 'Cu La1']))
+
+class TestPhiZStackImported(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        ops = Options()
+        ops.detectors['prz'] = PhiZDetector((0, 1), (2, 3), 100)
+
+        dirpath = os.path.join(os.path.dirname(__file__),
+                               'testdata', 'al_10keV_1ke_001')
+        self.result = Importer().import_(ops, dirpath)['prz']
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertEqual('Al K', line_family('Al Ka1'))
+        self.assertEqual('Cu L', line_family('Cu La1'))
+
+    def testfchi(self):
+        # Generated distribution of the K family, emitted of Ka1
+        stack = PhiZStack.from_result(self.result, ['Al Ka1', 'Al Kb1'])
+        fchi, unc = stack.fchi()
+        self.assertTrue(np.all(np.isfinite(fchi)))
+        self.assertTrue(np.all(np.isfinite(unc)))
+        self.assertTrue(np.all(fchi > 0.0))
+        self.assertTrue(np.all(fchi <= 1.0))
+
+        # Ratio of the emitted to the generated intensities of WinX-Ray
+        self.assertAlmostEqual(276142.0 / 294642.0, fchi[0], 2)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
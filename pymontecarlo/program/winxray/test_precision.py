@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import pickle
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.precision import \
+    (get_dtype, compact, compress_array, decompress_array, dumps, loads,
+     FLOAT32)
+
+# Globals and constants variables.
+
+class TestPrecision(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        energies = np.linspace(0.0, 10e3, 1000)
+        counts = 1e-3 * np.exp(-energies / 2e3)
+        self.spectrum = np.array([energies, counts]).T
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertEqual(np.float64, get_dtype())
+        self.assertEqual(np.float32, get_dtype(FLOAT32))
+        self.assertRaises(ValueError, get_dtype, 'float16')
+
+    def testcompact(self):
+        array = compact(self.spectrum, get_dtype(FLOAT32))
+        self.assertEqual(np.float32, array.dtype)
+        self.assertEqual(self.spectrum.nbytes // 2, array.nbytes)
+        self.assertTrue(np.allclose(self.spectrum, array, rtol=1e-6))
+
+        self.assertIs(self.spectrum, compact(self.spectrum))
+
+    def testcompress_array(self):
+        for array in [self.spectrum, self.spectrum.astype(np.float32),
+                      np.arange(10)]:
+            data = compress_array(array)
+            self.assertLess(len(data), array.nbytes)
+
+            other = decompress_array(data, array.dtype, array.shape)
+            self.assertEqual(array.dtype, other.dtype)
+            self.assertTrue(np.array_equal(array, other))
+
+    def testdumps(self):
+        results = {'spectrum': self.spectrum, 'name': 'sim1',
+                   'empty': np.array([])}
+        data = dumps(results)
+        self.assertLess(len(data), len(pickle.dumps(results)))
+
+        other = loads(data)
+        self.assertTrue(np.array_equal(self.spectrum, other['spectrum']))
+        self.assertEqual('sim1', other['name'])
+        self.assertEqual(0, len(other['empty']))
+
+    def testloads_pickle(self):
+        other = loads(pickle.dumps({'spectrum': self.spectrum}))
+        self.assertTrue(np.array_equal(self.spectrum, other['spectrum']))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.preflight import \
+    preflight, estimate_output_bytes, ERROR, WARNING, XRAY_BYTES
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.material import Material
+from pymontecarlo.options.detector import \
+    PhotonIntensityDetector, PhotonSpectrumDetector
+from pymontecarlo.options.limit import ShowersLimit
+
+# Globals and constants variables.
+
+def _create_options(name, showers=True):
+    ops = Options(name)
+    ops.beam.energy_eV = 10e3
+    ops.geometry.body.material = Material.pure(13)
+    ops.detectors['xray'] = PhotonIntensityDetector((0, 1), (2, 3))
+    if showers:
+        ops.limits.add(ShowersLimit(1000))
+    return ops
+
+class TestPreflight(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.optionss = [_create_options('sim1'),
+                         _create_options('sim2', showers=False),
+                         _create_options('sim3'),
+                         _create_options('sim3')]
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def _issues(self, report, name, severity):
+        return [issue.message for issue in report.issues \
+                if issue.name == name and issue.severity == severity]
+
+    def testskeleton(self):
+        report = preflight(self.optionss, processes=False)
+
+        self.assertEqual(4, report.noptions)
+        self.assertFalse(report.ok)
+        self.assertEqual([], self._issues(report, 'sim1', ERROR))
+        self.assertEqual(1, len(self._issues(report, 'sim2', ERROR)))
+        self.assertEqual(1, len(self._issues(report, 'sim2', WARNING)))
+        self.assertEqual(['Name used by 2 options'],
+                         self._issues(report, 'sim3', ERROR))
+        self.assertGreaterEqual(report.output_bytes, 3 * XRAY_BYTES)
+        self.assertIn('ERROR', str(report))
+
+    def testpreflight_processes(self):
+        report = preflight(self.optionss, max_workers=2, processes=True)
+        self.assertEqual(1, len(self._issues(report, 'sim2', ERROR)))
+        self.assertEqual(
+            preflight(self.optionss, processes=False).output_bytes,
+            report.output_bytes)
+
+    def testestimate_output_bytes(self):
+        ops = _create_options('sim1')
+        size = estimate_output_bytes(ops)
+
+        ops.detectors['spectrum'] = \
+            PhotonSpectrumDetector((0, 1), (2, 3), 1000, (0, 10e3))
+        self.assertEqual(size + 58 * 1000, estimate_output_bytes(ops))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+import numpy as np
+
+from pyxray.transition import from_string
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.refine import \
+    AdaptiveSweep, substrate_factory, interval_errors
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.material import Material
+from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.results.result import PhotonKey, PhotonIntensityResult
+
+# Globals and constants variables.
+
+def _kink(energy_eV, wf_al):
+    # Intensity rising above a threshold at 10 keV
+    return wf_al * (1.0 + max(0.0, energy_eV - 10e3) / 1e3)
+
+def _create_runner(func):
+    def _run(ops):
+        wf_al = ops.geometry.body.material.composition.get(13, 0.0)
+        value = func(ops.beam.energy_eV, wf_al)
+        key = PhotonKey(from_string('Al Ka1'), True, PhotonKey.P)
+        return {'xray': PhotonIntensityResult({key: [value, value * 1e-4]})}
+    return _run
+
+class TestAdaptiveSweep(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        ops = Options('base')
+        ops.geometry.body.material = Material({13: 0.5, 29: 0.5}, 'AlCu')
+        ops.limits.add(ShowersLimit(1000))
+        self.factory = substrate_factory(ops, balance=29)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        ops = self.factory(energy_eV=15e3, wf_13=0.2)
+        self.assertAlmostEqual(15e3, ops.beam.energy_eV, 4)
+        composition = ops.geometry.body.material.composition
+        self.assertAlmostEqual(0.2, composition[13], 4)
+        self.assertAlmostEqual(0.8, composition[29], 4)
+
+        # No balance left
+        ops = self.factory(wf_13=1.0)
+        self.assertEqual({13: 1.0}, ops.geometry.body.material.composition)
+
+        self.assertRaises(ValueError, self.factory, wf_13=0.8, wf_26=0.3)
+
+    def testrun_linear(self):
+        sweep = AdaptiveSweep(self.factory,
+                              {'energy_eV': [5e3, 10e3, 15e3, 20e3],
+                               'wf_13': [0.25, 0.5, 0.75]},
+                              _create_runner(lambda e, wf: wf * e / 1e3),
+                              'xray', ['Al Ka1'])
+        items = sweep.run()
+
+        self.assertEqual(12, len(items))
+        self.assertEqual(0, sweep.niterations)
+
+    def testrun_kink(self):
+        sweep = AdaptiveSweep(self.factory,
+                              {'energy_eV': np.linspace(5e3, 25e3, 5),
+                               'wf_13': [0.5]},
+                              _create_runner(_kink), 'xray', ['Al Ka1'],
+                              tolerance=0.01, min_steps={'energy_eV': 300.0})
+        sweep.run()
+
+        self.assertGreater(sweep.niterations, 0)
+        energies = sweep.axes['energy_eV']
+        new = sorted(set(energies) - set(np.linspace(5e3, 25e3, 5)))
+        self.assertTrue(all(5e3 < e < 20e3 for e in new))
+        self.assertIn(10e3, energies)
+        self.assertLess(sweep.nsimulations, 67)
+
+        surrogate = sweep.surrogate()
+        estimate = surrogate.query('Al Ka1', energy_eV=7.5e3, wf_13=0.5)
+        self.assertAlmostEqual(0.5, estimate.value, 4)
+
+    def testrun_two_values(self):
+        sweep = AdaptiveSweep(self.factory,
+                              {'energy_eV': [5e3, 25e3], 'wf_13': [0.5]},
+                              _create_runner(_kink), 'xray', ['Al Ka1'],
+                              tolerance=0.01, min_steps={'energy_eV': 300.0})
+        sweep.run()
+
+        self.assertGreater(sweep.niterations, 0)
+        self.assertGreater(len(sweep.axes['energy_eV']), 2)
+
+    def testrun_max_runs(self):
+        sweep = AdaptiveSweep(self.factory,
+                              {'energy_eV': np.linspace(5e3, 25e3, 5),
+                               'wf_13': [0.5]},
+                              _create_runner(_kink), 'xray', ['Al Ka1'],
+                              tolerance=1e-6, max_runs=8)
+        sweep.run()
+        self.assertEqual(8, sweep.nsimulations)
+
+    def testinterval_errors(self):
+        axis = np.array([0.0, 1.0, 2.0, 3.0])
+        values = (axis ** 2)[:, np.newaxis]
+
+        errors = interval_errors(axis, values, np.zeros(values.shape), 0)
+        self.assertTrue(np.allclose([0.25, 0.25 / 4, 0.25 / 9], errors))
+
+        errors = interval_errors(axis, values, np.ones(values.shape), 0)
+        self.assertTrue(np.allclose([0.0, 0.0, 0.0], errors))
+
+        # Two nodes: quarter of the difference, relative to the largest node
+        errors = interval_errors(axis[:2], values[:2], np.zeros((2, 1)), 0)
+        self.assertTrue(np.allclose([0.25], errors))
+
+        errors = interval_errors(axis[:2], values[:2], values[:2], 0)
+        self.assertTrue(np.allclose([0.0], errors))
+
+        errors = interval_errors(axis[:1], values[:1], values[:1], 0)
+        self.assertEqual(0, len(errors))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.resources import \
+    (available_cpus, max_concurrency, numa_nodes, CpuAllocator, CpuMonitor,
+     limit_command, limit_process, wait_exited, has_exited, _parse_cpulist,
+     CORE, NUMA)
+
+# Globals and constants variables.
+BUSY = 'import time\n' \
+       't0 = time.time()\n' \
+       'while time.time() - t0 < 1.0: pass\n'
+
+class TestResources(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertGreater(len(available_cpus()), 0)
+        self.assertGreater(len(numa_nodes()), 0)
+
+    def testmax_concurrency(self):
+        self.assertLessEqual(max_concurrency(), len(available_cpus()))
+        self.assertEqual(1, max_concurrency(reserved_cpus=10000))
+        self.assertEqual(1, max_concurrency(memory_per_process_bytes=2 ** 60))
+
+    def test_parse_cpulist(self):
+        self.assertEqual(set([0, 1, 2, 3, 8, 10, 11]),
+                         _parse_cpulist('0-3,8,10-11\n'))
+
+    def testcpu_allocator(self):
+        allocator = CpuAllocator(CORE, [0, 1])
+
+        cpus1 = allocator.acquire()
+        cpus2 = allocator.acquire()
+        self.assertEqual(set([0, 1]), cpus1 | cpus2)
+
+        cpus3 = allocator.acquire() # Shared
+        self.assertEqual(2, allocator.load[cpus3])
+
+        allocator.release(cpus3)
+        allocator.release(cpus1)
+        self.assertEqual(0, allocator.load[cpus1])
+
+        self.assertRaises(ValueError, CpuAllocator, 'unknown')
+
+    def testcpu_allocator_numa(self):
+        allocator = CpuAllocator(NUMA)
+        cpus = allocator.acquire()
+        self.assertTrue(cpus.issubset(available_cpus()))
+
+    def testcpu_monitor(self):
+        process = subprocess.Popen([sys.executable, '-c', BUSY])
+        monitor = CpuMonitor(process.pid, interval_s=0.1)
+        monitor.start()
+        while process.poll() is None:
+            time.sleep(0.05)
+        monitor.stop()
+
+        self.assertGreater(monitor.cpu_s, 0.5)
+        self.assertGreater(monitor.utilisation, 0.5)
+        self.assertLess(monitor.utilisation, 1.5)
+
+    @unittest.skipUnless(hasattr(os, 'waitid'), 'Requires os.waitid')
+    def testcpu_monitor_final_sample(self):
+        # No sample while the process runs, only the final one
+        process = subprocess.Popen([sys.executable, '-c', BUSY])
+        monitor = CpuMonitor(process.pid, interval_s=60.0)
+        monitor.start()
+        wait_exited(process.pid)
+        monitor.stop()
+        self.assertEqual(0, process.wait())
+
+        self.assertGreater(monitor.cpu_s, 0.5)
+        self.assertGreater(monitor.utilisation, 0.5)
+        self.assertLess(monitor.utilisation, 1.5)
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'),
+                         'Requires os.sched_setaffinity')
+    def testlimit_process(self):
+        process = subprocess.Popen([sys.executable, '-c',
+                                    'import time; time.sleep(5)'])
+        try:
+            cpu = sorted(os.sched_getaffinity(0))[0]
+            niceness = os.getpriority(os.PRIO_PROCESS, process.pid)
+            limit_process(process.pid, [cpu], nice=1)
+
+            self.assertEqual(set([cpu]), os.sched_getaffinity(process.pid))
+            self.assertEqual(niceness + 1,
+                             os.getpriority(os.PRIO_PROCESS, process.pid))
+        finally:
+            process.kill()
+            process.wait()
+
+        limit_process(process.pid, [cpu], nice=1) # Ended, no error
+
+    def testlimit_command(self):
+        args, remaining = limit_command(['wine', 'winxray.exe'], [2, 0],
+                                        nice=5, ionice=3)
+        self.assertEqual(['wine', 'winxray.exe'], args[-2:])
+
+        expected = {}
+        if shutil.which('taskset'):
+            self.assertEqual(['taskset', '-c', '0,2'], args[:3])
+        else:
+            expected['cpus'] = [2, 0]
+        if shutil.which('nice'):
+            self.assertIn('nice', args)
+        else:
+            expected['nice'] = 5
+        if shutil.which('ionice'):
+            self.assertIn('ionice', args)
+        else:
+            expected['ionice'] = 3
+        self.assertEqual(expected, remaining)
+
+        self.assertEqual((['winxray.exe'], {}), limit_command(['winxray.exe']))
+
+    @unittest.skipUnless(shutil.which('taskset') and shutil.which('nice'),
+                         'Requires taskset and nice')
+    def testlimit_command_children(self):
+        # Limits of a child started before any call from the parent
+        cpu = sorted(os.sched_getaffinity(0))[0]
+        code = 'import os, subprocess, sys\n' \
+               'print(subprocess.check_output([sys.executable, "-c", ' \
+               '"import os; print(sorted(os.sched_getaffinity(0)), ' \
+               'os.nice(0))"]).decode().strip())'
+        args, _remaining = limit_command([sys.executable, '-c', code], [cpu],
+                                         nice=1)
+        output = subprocess.check_output(args).decode().strip()
+        self.assertEqual('[%i] %i' % (cpu, os.nice(0) + 1), output)
+
+    @unittest.skipUnless(hasattr(os, 'waitid'), 'Requires os.waitid')
+    def testhas_exited(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        wait_exited(process.pid)
+        self.assertTrue(has_exited(process))
+        self.assertIsNone(process.returncode) # Not reaped
+        self.assertEqual(0, process.wait())
+        self.assertTrue(has_exited(process))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
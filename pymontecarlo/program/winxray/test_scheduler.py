@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import threading
+import weakref
+import gc
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.scheduler import \
+    (Scheduler, WorkerJobRunner, exported_digest,
+     INTERACTIVE, BATCH, KILL, SUSPEND)
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.detector import \
+    PhotonIntensityDetector, TimeDetector
+
+# Globals and constants variables.
+
+class _Worker(object):
+    """
+    Simulation lasting until it is released.
+    """
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.killed = False
+        self.suspended = False
+
+    def run(self, options):
+        self.released.wait(10.0)
+        if self.killed:
+            raise RuntimeError('Killed')
+        return options.name
+
+    def kill(self):
+        self.killed = True
+        self.released.set()
+        return True
+
+    def suspend(self):
+        self.suspended = True
+        return True
+
+    def resume(self):
+        self.suspended = False
+        return True
+
+class _Runner(object):
+
+    def __init__(self):
+        self.workers = {}
+        self._lock = threading.Lock()
+        self._started = threading.Condition(self._lock)
+
+    def __call__(self, job):
+        with self._lock:
+            job.worker = _Worker()
+            self.workers.setdefault(job.options.name, []).append(job.worker)
+            self._started.notify_all()
+        return job.worker.run(job.options)
+
+    def wait_started(self, name, count=1):
+        with self._lock:
+            while len(self.workers.get(name, [])) < count:
+                self._started.wait(10.0)
+            return self.workers[name][-1]
+
+class _ProgramWorker(object):
+
+    def __init__(self, program):
+        program.nworkers += 1
+
+    def run(self, options, outputdir, workdir):
+        return options.name
+
+class _Exporter(object):
+
+    def digest(self, options):
+        return 'wxc'
+
+class _Program(object):
+
+    worker_class = _ProgramWorker
+    exporter_class = _Exporter
+
+    def __init__(self):
+        self.nworkers = 0
+
+class TestWorkerJobRunner(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.program = _Program()
+        self.runner = WorkerJobRunner(self.program, None)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=0)
+        jobs = [scheduler.submit(Options('batch%i' % i)) for i in range(6)]
+        scheduler.shutdown()
+
+        self.assertEqual(['batch%i' % i for i in range(6)],
+                         [job.future.result() for job in jobs])
+        self.assertLessEqual(self.program.nworkers, 2)
+        self.assertEqual(self.program.nworkers, self.runner.nworkers)
+        self.assertTrue(all(job.worker is None for job in jobs))
+
+    def testhistory(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=0,
+                              key=lambda options: options.name, history=4)
+        jobs = [scheduler.submit(Options('batch%i' % (i % 3))) for i in range(9)]
+        for job in jobs:
+            job.future.result(10.0)
+        scheduler.shutdown()
+
+        self.assertEqual(4, len(scheduler._latencies))
+        self.assertIsNotNone(scheduler.latencies(BATCH))
+        self.assertIsNone(scheduler.latencies(INTERACTIVE))
+
+        # Finished jobs are not kept by the scheduler
+        refs = [weakref.ref(job) for job in jobs]
+        del jobs, job
+        gc.collect()
+        self.assertTrue(all(ref() is None for ref in refs))
+
+class TestExportedDigest(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.key = exported_digest(_Program())
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def _create_options(self, name, key):
+        options = Options(name)
+        options.detectors[key] = PhotonIntensityDetector((0, 1), (2, 3))
+        return options
+
+    def testskeleton(self):
+        key = self.key(self._create_options('a', 'xray'))
+        self.assertEqual(key, self.key(self._create_options('b', 'xray')))
+        self.assertNotEqual(key, self.key(self._create_options('a', 'intensity')))
+
+        options = self._create_options('a', 'xray')
+        options.detectors['xray'] = TimeDetector()
+        self.assertNotEqual(key, self.key(options))
+
+class TestScheduler(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.runner = _Runner()
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def _release_all(self, scheduler):
+        while scheduler.running or scheduler.queued or scheduler.suspended:
+            for job in scheduler.running:
+                if job.worker is not None:
+                    job.worker.released.set()
+            with scheduler._lock:
+                scheduler._idle.wait(0.1)
+
+    def testskeleton(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=1)
+
+        batch = [scheduler.submit(Options('batch%i' % i), BATCH) for i in range(3)]
+        self.runner.wait_started('batch0')
+        self.assertEqual(1, len(scheduler.running))
+        self.assertEqual(2, len(scheduler.queued))
+
+        job = scheduler.submit(Options('interactive'), INTERACTIVE)
+        self.runner.wait_started('interactive').released.set()
+        self.assertEqual('interactive', job.future.result(10.0))
+
+        self._release_all(scheduler)
+        scheduler.shutdown()
+
+        self.assertEqual(['batch0', 'batch1', 'batch2'],
+                         [job.future.result() for job in batch])
+        self.assertIsNotNone(scheduler.latencies(INTERACTIVE))
+
+    def testcancel(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=1)
+
+        running = scheduler.submit(Options('batch0'), BATCH)
+        self.runner.wait_started('batch0')
+        queued = scheduler.submit(Options('batch1'), BATCH)
+
+        self.assertFalse(scheduler.cancel(running))
+        self.assertTrue(scheduler.cancel(queued))
+        self.assertTrue(queued.future.cancelled())
+        self.assertEqual(0, len(scheduler.queued))
+
+        self._release_all(scheduler)
+        scheduler.shutdown()
+
+    def testcoalesce(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=1,
+                              key=lambda options: options.name)
+
+        running = scheduler.submit(Options('batch0'), BATCH)
+        self.runner.wait_started('batch0')
+        queued = scheduler.submit(Options('batch1'), BATCH)
+
+        # Attached to the running and the queued jobs
+        same_running = scheduler.submit(Options('batch0'), BATCH)
+        same_queued = scheduler.submit(Options('batch1'), INTERACTIVE)
+        self.assertIs(running, same_running.leader)
+        self.assertIs(queued, same_queued.leader)
+
+        # Interactive follower starts the queued job in the reserved slot
+        self.runner.wait_started('batch1')
+        self.assertEqual(INTERACTIVE, queued.priority)
+
+        self.assertFalse(scheduler.cancel(running))
+        self._release_all(scheduler)
+        scheduler.shutdown()
+
+        self.assertEqual('batch0', same_running.future.result())
+        self.assertIs(running.future.result(), same_running.future.result())
+        self.assertEqual('batch1', same_queued.future.result())
+        self.assertEqual(1, len(self.runner.workers['batch0']))
+        self.assertEqual(1, len(self.runner.workers['batch1']))
+
+        # Finished jobs are no longer in flight
+        self.assertNotIn('batch0', scheduler._inflight)
+
+    def testcoalesce_follow(self):
+        follow = lambda job, leader, results: (job.options.name, results)
+        scheduler = Scheduler(self.runner, capacity=2, reserved=0,
+                              key=lambda options: options.name.split('-')[0],
+                              follow=follow)
+
+        leader = scheduler.submit(Options('batch-0'), BATCH)
+        self.runner.wait_started('batch-0')
+        follower = scheduler.submit(Options('batch-1'), BATCH)
+        self.assertIs(leader, follower.leader)
+
+        self._release_all(scheduler)
+        scheduler.shutdown()
+
+        self.assertEqual('batch-0', leader.future.result())
+        self.assertEqual(('batch-1', 'batch-0'), follower.future.result())
+
+    def testcancel_follower(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=1,
+                              key=lambda options: options.name)
+
+        scheduler.submit(Options('batch0'), BATCH)
+        self.runner.wait_started('batch0')
+        leader = scheduler.submit(Options('batch1'), BATCH)
+        follower = scheduler.submit(Options('batch1'), BATCH)
+
+        self.assertFalse(scheduler.cancel(leader))
+        self.assertTrue(scheduler.cancel(follower))
+        self.assertTrue(scheduler.cancel(leader))
+
+        self._release_all(scheduler)
+        scheduler.shutdown()
+
+    def testpreemption_kill(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=1,
+                              preemption=KILL)
+
+        batch = scheduler.submit(Options('batch'), BATCH)
+        self.runner.wait_started('batch')
+
+        job1 = scheduler.submit(Options('interactive1'), INTERACTIVE)
+        job2 = scheduler.submit(Options('interactive2'), INTERACTIVE)
+        self.runner.wait_started('interactive1')
+        worker2 = self.runner.wait_started('interactive2')
+        self.assertTrue(self.runner.workers['batch'][0].killed)
+
+        worker2.released.set()
+        self.assertEqual('interactive2', job2.future.result(10.0))
+
+        self._release_all(scheduler)
+        scheduler.shutdown()
+
+        self.assertEqual('interactive1', job1.future.result())
+        self.assertEqual('batch', batch.future.result())
+        self.assertEqual(1, batch.npreemptions)
+        self.assertEqual(2, len(self.runner.workers['batch']))
+
+    def testpreemption_kill_finished(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=1,
+                              preemption=KILL)
+
+        batch = scheduler.submit(Options('batch'), BATCH)
+        worker = self.runner.wait_started('batch')
+        worker.kill = lambda: True # Process ends before the kill
+
+        scheduler.submit(Options('interactive1'), INTERACTIVE)
+        scheduler.submit(Options('interactive2'), INTERACTIVE)
+        self.runner.wait_started('interactive1')
+        self.assertTrue(batch.preempted)
+
+        worker.released.set()
+        self.assertEqual('batch', batch.future.result(10.0))
+        self.runner.wait_started('interactive2')
+
+        self._release_all(scheduler)
+        scheduler.shutdown()
+
+        self.assertEqual(0, batch.npreemptions)
+        self.assertEqual(1, len(self.runner.workers['batch']))
+
+    def testpreemption_suspend(self):
+        scheduler = Scheduler(self.runner, capacity=2, reserved=1,
+                              preemption=SUSPEND)
+
+        batch = scheduler.submit(Options('batch'), BATCH)
+        worker = self.runner.wait_started('batch')
+
+        scheduler.submit(Options('interactive1'), INTERACTIVE)
+        job2 = scheduler.submit(Options('interactive2'), INTERACTIVE)
+        self.runner.wait_started('interactive2').released.set()
+        self.assertTrue(worker.suspended)
+        self.assertEqual(1, len(scheduler.suspended))
+
+        job2.future.result(10.0)
+        self._release_all(scheduler)
+        scheduler.shutdown()
+
+        self.assertFalse(worker.suspended)
+        self.assertEqual('batch', batch.future.result())
+        self.assertEqual(1, len(self.runner.workers['batch']))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
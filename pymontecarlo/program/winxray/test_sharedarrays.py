@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.sharedarrays import ArrayArena
+
+# Globals and constants variables.
+
+class TestArrayArena(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.arena = ArrayArena(min_bytes=1024)
+        self.obj = {'large': np.arange(1000.0),
+                    'small': np.arange(10.0),
+                    'other': [1, 'a']}
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        self.arena.close()
+
+    def testskeleton(self):
+        self.assertTrue(os.path.isdir(self.arena.dirpath))
+        self.assertEqual(1024, self.arena.min_bytes)
+
+    def testdumps_loads(self):
+        data = self.arena.dumps(self.obj)
+        self.assertLess(len(data), 8000) # Large array not pickled
+        self.assertEqual(1, len(os.listdir(self.arena.dirpath)))
+
+        obj = self.arena.loads(data)
+        self.assertIsInstance(obj['large'], np.memmap)
+        self.assertTrue(np.array_equal(self.obj['large'], obj['large']))
+        self.assertTrue(np.array_equal(self.obj['small'], obj['small']))
+        self.assertEqual([1, 'a'], obj['other'])
+
+        obj['large'][0] = 5.0 # Copy-on-write
+
+    def testloads_child(self):
+        child = ArrayArena(self.arena.dirpath, self.arena.min_bytes)
+        data = child.dumps(self.obj)
+        child.close() # Not the owner
+        self.assertTrue(os.path.isdir(self.arena.dirpath))
+
+        obj = self.arena.loads(data)
+        self.assertTrue(np.array_equal(self.obj['large'], obj['large']))
+
+    def testclose(self):
+        data = self.arena.dumps(self.obj)
+        obj = self.arena.loads(data)
+        self.arena.close()
+
+        self.assertFalse(os.path.exists(self.arena.dirpath))
+        self.assertAlmostEqual(999.0, obj['large'][-1], 4)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
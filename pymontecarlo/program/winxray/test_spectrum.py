@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.spectrum import \
+    (SpectrumProcessor, SparseMatrix, rebin_matrix, response_matrix, fwhm_eds,
+     process_photon_spectrum)
+from pymontecarlo.program.winxray.importer import Importer
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.detector import PhotonSpectrumDetector
+from pymontecarlo.options.limit import ShowersLimit
+
+# Globals and constants variables.
+
+class TestSpectrum(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.energies_eV = np.arange(5.0, 1000.0, 10.0) # 100 channels
+        self.spectrum = np.zeros(100)
+        self.spectrum[50] = 1.0 # 505 eV
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        matrix = rebin_matrix(self.energies_eV, np.linspace(0, 1000, 51))
+        self.assertEqual((100, 50), matrix.shape)
+        self.assertEqual(100, matrix.nnz)
+
+    def testrebin_matrix(self):
+        # Coarser channels
+        matrix = rebin_matrix(self.energies_eV, np.linspace(0, 1000, 51))
+        values = matrix.apply(self.spectrum)
+        self.assertAlmostEqual(0.5, values[25], 4)
+        self.assertAlmostEqual(10.0, np.sum(values * 20.0), 4)
+
+        # Finer channels, with an offset
+        matrix = rebin_matrix(self.energies_eV, np.linspace(495, 525, 16))
+        values = matrix.apply(self.spectrum)
+        self.assertAlmostEqual(0.0, values[0], 4)
+        self.assertAlmostEqual(1.0, values[5], 4)
+        self.assertAlmostEqual(10.0, np.sum(values * 2.0), 4)
+
+    def testresponse_matrix(self):
+        matrix = response_matrix(self.energies_eV, 50.0)
+        values = matrix.apply(self.spectrum)
+        self.assertAlmostEqual(1.0, np.sum(values), 4)
+        self.assertEqual(50, np.argmax(values))
+        self.assertAlmostEqual(values[49], values[51], 6)
+
+        # Cut off at 5 sigmas (21.2 eV) and cached
+        self.assertEqual(0.0, values[39])
+        self.assertGreater(values[40], 0.0)
+        self.assertIs(matrix, response_matrix(self.energies_eV, 50.0))
+
+        matrix = response_matrix(self.energies_eV, 0.0)
+        self.assertTrue(np.allclose(np.eye(100), matrix.toarray()))
+        self.assertEqual(100, matrix.nnz)
+
+    def testsparse_matrix(self):
+        a = np.array([[1.0, 0.0, 2.0], [0.0, 3.0, 0.0]])
+        b = np.array([[0.0, 1.0], [4.0, 0.0], [5.0, 6.0]])
+        sa = SparseMatrix([0, 0, 1], [0, 2, 1], [1.0, 2.0, 3.0], (2, 3))
+        sb = SparseMatrix([0, 1, 2, 2], [1, 0, 0, 1], [1.0, 4.0, 5.0, 6.0], (3, 2))
+
+        self.assertTrue(np.allclose(a, sa.toarray()))
+        self.assertTrue(np.allclose(np.dot(a, b), sa.dot(sb).toarray()))
+        self.assertTrue(np.allclose(a ** 2, sa.square().toarray()))
+
+        spectra = np.array([[1.0, 2.0], [3.0, 4.0]])
+        self.assertTrue(np.allclose(np.dot(spectra, a), sa.apply(spectra)))
+        self.assertTrue(np.allclose(np.dot(spectra[0], a), sa.apply(spectra[0])))
+        self.assertRaises(ValueError, sa.dot, sa)
+
+    def testfwhm_eds(self):
+        self.assertAlmostEqual(130.0, fwhm_eds(5898.7), 4)
+        self.assertLess(fwhm_eds(1486.0), 130.0)
+
+    def testprocessor(self):
+        processor = SpectrumProcessor(self.energies_eV,
+                                      np.linspace(0, 1000, 51), 30.0)
+        self.assertEqual(50, len(processor.energies_eV))
+        self.assertAlmostEqual(10.0, processor.energies_eV[0], 4)
+
+        spectra = np.array([self.spectrum, self.spectrum * 2.0])
+        values, uncertainties = processor(spectra, spectra * 0.1)
+        self.assertEqual((2, 50), values.shape)
+        self.assertAlmostEqual(10.0, np.sum(values[0] * 20.0), 4)
+        self.assertAlmostEqual(20.0, np.sum(values[1] * 20.0), 4)
+        self.assertTrue(np.all(uncertainties >= 0.0))
+
+class TestProcessPhotonSpectrum(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.ops = Options()
+        self.ops.detectors['spectrum'] = \
+            PhotonSpectrumDetector((0, 1), (2, 3), 500, (0, 1000))
+        self.ops.limits.add(ShowersLimit(1000))
+
+        dirpath = os.path.join(os.path.dirname(__file__),
+                               'testdata', 'al_10keV_1ke_001')
+        self.result = Importer().import_(self.ops, dirpath)['spectrum']
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testprocess_photon_spectrum(self):
+        detector = self.ops.detectors['spectrum']
+        result = process_photon_spectrum(self.result, detector)
+
+        self.assertAlmostEqual(2.0, result.energy_channel_width_eV, 4)
+        self.assertAlmostEqual(1.0, result.energy_offset_eV, 4)
+
+        total = result.get_total()
+        self.assertEqual(500, len(total))
+
+        # Same integral over the limits of the detector
+        expected = np.sum(self.result.get_total()[:100, 1]) * 10.0
+        self.assertAlmostEqual(expected, np.sum(total[:, 1]) * 2.0, 4)
+
+        self.assertEqual(500, len(result.get_background()))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.store import ContentStore
+
+# Globals and constants variables.
+
+class TestContentStore(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = ContentStore(os.path.join(self.tmpdir, 'store'))
+
+        self.workdir = os.path.join(self.tmpdir, 'work')
+        os.makedirs(os.path.join(self.workdir, 'sim_001'))
+        self._write('sim.wxc', b'[OptionSimulation]\n')
+        self._write('sim_001/GenResult.txt', b'General results\n')
+        self._write('sim_001/BSEDepth.txt', b'0\t0\n' * 100)
+
+        self.store.put('sim1', self.workdir)
+
+        self._write('sim_001/GenResult.txt', b'Other general results\n')
+        self.store.put('sim2', self.workdir)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _write(self, relpath, data):
+        with open(os.path.join(self.workdir, relpath), 'wb') as fp:
+            fp.write(data)
+
+    def _count_objects(self):
+        objectsdir = os.path.join(self.store.rootdir, 'objects')
+        return sum(len(filenames) for _, _, filenames in os.walk(objectsdir))
+
+    def testskeleton(self):
+        self.assertEqual(['sim1', 'sim2'], self.store.names())
+        self.assertIn('sim1', self.store)
+        self.assertNotIn('sim3', self.store)
+
+    def testdeduplication(self):
+        self.assertEqual(4, self._count_objects())
+
+    def testadded_size(self):
+        objectsdir = os.path.join(self.store.rootdir, 'objects')
+        size = sum(os.path.getsize(os.path.join(dirpath, filename)) \
+                   for dirpath, _, filenames in os.walk(objectsdir) \
+                   for filename in filenames)
+        manifests = [self.store.manifest_path(name) for name in ['sim1', 'sim2']]
+        size += sum(os.path.getsize(path) for path in manifests)
+
+        self.assertEqual(size, self.store.added_size('sim1') + \
+                               self.store.added_size('sim2'))
+
+        # Only the manifest is added
+        self.store.put('sim3', self.workdir)
+        self.assertEqual(os.path.getsize(self.store.manifest_path('sim3')),
+                         self.store.added_size('sim3'))
+
+    def testnamelist(self):
+        expected = ['sim.wxc', 'sim_001/BSEDepth.txt', 'sim_001/GenResult.txt']
+        self.assertEqual(expected, self.store.namelist('sim1'))
+
+    def testopen(self):
+        with self.store.open('sim1', 'sim_001/GenResult.txt') as fp:
+            self.assertEqual(b'General results\n', fp.read())
+        with self.store.open('sim2', 'sim_001/GenResult.txt') as fp:
+            self.assertEqual(b'Other general results\n', fp.read())
+
+    def testgc(self):
+        self.assertEqual((0, 0), self.store.gc())
+
+        self.store.remove('sim1')
+        self.assertEqual(0, self.store.gc()[0]) # Grace period
+        self.assertEqual(1, self.store.gc(grace_s=0.0)[0])
+        self.assertEqual(3, self._count_objects())
+
+        with self.store.open('sim2', 'sim.wxc') as fp:
+            self.assertEqual(b'[OptionSimulation]\n', fp.read())
+
+    def testput_object_deleted(self):
+        digest = self.store.put_object(b'data')
+        os.remove(self.store._object_path(digest))
+
+        # Deleted between two puts, e.g. by a concurrent gc
+        self.assertEqual(digest, self.store.put_object(b'data'))
+        self.assertEqual(b'data', self.store.get_object(digest))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.stub import main, read_wxc, SyntheticSimulation
+from pymontecarlo.program.winxray.importer import Importer
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.detector import \
+    (PhotonIntensityDetector, PhiZDetector, ElectronFractionDetector,
+     TimeDetector, PhotonSpectrumDetector, ShowersStatisticsDetector)
+from pymontecarlo.options.limit import ShowersLimit
+
+# Globals and constants variables.
+
+class TestStub(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        srcfilepath = os.path.join(os.path.dirname(__file__), 'testdata',
+                                   'al_10keV_1ke_001', 'Option.wxc')
+        self.wxcfilepath = os.path.join(self.tmpdir, 'sim.wxc')
+        shutil.copy(srcfilepath, self.wxcfilepath)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testsimulation(self):
+        simulation = SyntheticSimulation(read_wxc(self.wxcfilepath))
+        self.assertAlmostEqual(10000.0, simulation.energy_eV, 4)
+        self.assertEqual(1000, simulation.nelectron)
+        self.assertEqual([(13, 'Al', 1.0)], simulation.elements)
+
+        lines = [line[4] for line in simulation.iterlines()]
+        self.assertEqual(['Ka1', 'Ka2', 'Kb1'], lines)
+
+    def testmain(self):
+        self.assertEqual(0, main([self.wxcfilepath]))
+
+        dirpath = os.path.join(self.tmpdir, 'sim_001')
+        self.assertTrue(os.path.isdir(dirpath))
+        self.assertTrue(os.path.exists(os.path.join(dirpath, 'Option.wxc')))
+
+        ops = Options()
+        ops.detectors['xray'] = PhotonIntensityDetector((0, 1), (2, 3))
+        ops.detectors['fraction'] = ElectronFractionDetector()
+        ops.detectors['time'] = TimeDetector()
+        ops.detectors['showers'] = ShowersStatisticsDetector()
+        ops.detectors['prz'] = PhiZDetector((0, 1), (2, 3), 100)
+        ops.detectors['spectrum'] = \
+            PhotonSpectrumDetector((0, 1), (2, 3), 500, (0, 1000))
+        ops.limits.add(ShowersLimit(1000))
+
+        results = Importer().import_(ops, dirpath)
+
+        self.assertEqual(1000, results['showers'].showers)
+        self.assertGreater(results['xray'].intensity('Al Ka1')[0], 0.0)
+        self.assertAlmostEqual(0.153, results['fraction'].backscattered[0], 2)
+        self.assertEqual(1000, len(results['spectrum'].get_total()))
+        self.assertEqual(100, len(results['prz'].get('Al Ka1')))
+
+        # Second run creates a new result folder
+        self.assertEqual(0, main([self.wxcfilepath]))
+        self.assertTrue(os.path.isdir(os.path.join(self.tmpdir, 'sim_002')))
+
+    def testmain_usage(self):
+        self.assertEqual(2, main([]))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
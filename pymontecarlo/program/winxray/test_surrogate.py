@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+from collections import OrderedDict
+
+# Third party modules.
+import numpy as np
+
+from pyxray.transition import from_string
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.surrogate import \
+    GridInterpolant, IntensitySurrogate, SurrogateEngine
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.material import Material
+from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.results.result import PhotonKey, PhotonIntensityResult
+
+# Globals and constants variables.
+
+def _intensity(energy_eV, wf_al):
+    return (energy_eV / 1e3) ** 2 * wf_al
+
+def _create_options(energy_eV, wf_al):
+    ops = Options()
+    ops.beam.energy_eV = energy_eV
+    ops.geometry.body.material = Material({13: wf_al, 29: 1.0 - wf_al}, 'AlCu')
+    ops.limits.add(ShowersLimit(1000))
+    return ops
+
+def _simulate(ops):
+    wf_al = ops.geometry.body.material.composition[13]
+    value = _intensity(ops.beam.energy_eV, wf_al)
+
+    transition = from_string('Al Ka1')
+    intensities = {PhotonKey(transition, True, PhotonKey.P): [value, value * 0.01]}
+    return {'xray': PhotonIntensityResult(intensities)}
+
+def _create_items():
+    items = []
+    for energy_eV in [10e3, 12e3, 14e3, 16e3]:
+        for wf_al in [0.25, 0.5, 0.75]:
+            ops = _create_options(energy_eV, wf_al)
+            items.append((ops, _simulate(ops)))
+    return items
+
+class TestGridInterpolant(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        energies = np.array([10e3, 12e3, 14e3, 16e3])
+        wfs = np.array([0.25, 0.5, 0.75])
+        values = _intensity(energies[:, np.newaxis], wfs[np.newaxis, :])
+
+        axes = OrderedDict([('energy_eV', energies), ('wf_13', wfs)])
+        self.interpolant = \
+            GridInterpolant(axes, values[..., np.newaxis],
+                            values[..., np.newaxis] * 0.01)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertEqual(['energy_eV', 'wf_13'], list(self.interpolant.axes))
+
+    def testcall(self):
+        value, unc, error = self.interpolant(energy_eV=13e3, wf_13=0.5)
+        self.assertAlmostEqual(85.0, value[0], 4)
+        self.assertAlmostEqual(0.5, error[0], 4) # Exact for a quadratic
+        self.assertGreater(unc[0], 0.0)
+
+    def testcall_node(self):
+        value, unc, error = self.interpolant(energy_eV=12e3, wf_13=0.5)
+        self.assertAlmostEqual(72.0, value[0], 4)
+        self.assertAlmostEqual(0.72, unc[0], 4)
+        self.assertAlmostEqual(0.0, error[0], 4)
+
+    def testcall_two_nodes(self):
+        energies = np.array([12e3, 13e3])
+        wfs = np.array([0.25, 0.5, 0.75])
+        values = _intensity(energies[:, np.newaxis], wfs[np.newaxis, :])
+        axes = OrderedDict([('energy_eV', energies), ('wf_13', wfs)])
+        interpolant = GridInterpolant(axes, values[..., np.newaxis],
+                                      values[..., np.newaxis] * 0.01)
+
+        # Quarter of the difference between the nodes
+        value, _unc, error = interpolant(energy_eV=12.5e3, wf_13=0.5)
+        self.assertAlmostEqual(78.25, value[0], 4)
+        self.assertAlmostEqual((84.5 - 72.0) / 4.0, error[0], 4)
+
+    def testcall_outside(self):
+        self.assertIsNone(self.interpolant(energy_eV=17e3, wf_13=0.5))
+        self.assertRaises(ValueError, self.interpolant, energy_eV=12e3)
+
+class TestIntensitySurrogate(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.surrogate = \
+            IntensitySurrogate.from_results(_create_items(), 'xray',
+                                            ['Al Ka1'], tolerance=0.01)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertEqual(['energy_eV', 'wf_13'], list(self.surrogate.cube.axes))
+
+    def testquery(self):
+        estimate = self.surrogate.query('Al Ka1', energy_eV=13e3, wf_13=0.5)
+        self.assertAlmostEqual(85.0, estimate.value, 4)
+        self.assertAlmostEqual(0.5, estimate.error, 4)
+        self.assertTrue(estimate.trusted)
+
+        estimate = self.surrogate.query('Al Ka1', _create_options(15e3, 0.6))
+        self.assertAlmostEqual(_intensity(15e3, 0.6), estimate.value, delta=1.0)
+        self.assertTrue(estimate.trusted)
+
+    def testquery_untrusted(self):
+        estimate = self.surrogate.query('Al Ka1', energy_eV=20e3, wf_13=0.5)
+        self.assertFalse(estimate.trusted)
+
+        surrogate = \
+            IntensitySurrogate.from_results(_create_items(), 'xray',
+                                            ['Al Ka1'], tolerance=0.001)
+        estimate = surrogate.query('Al Ka1', energy_eV=11e3, wf_13=0.5)
+        self.assertFalse(estimate.trusted)
+
+    def testquery_two_nodes(self):
+        items = [item for item in _create_items() \
+                 if item[0].beam.energy_eV in (12e3, 14e3)]
+
+        surrogate = IntensitySurrogate.from_results(items, 'xray', ['Al Ka1'],
+                                                    tolerance=0.1)
+        estimate = surrogate.query('Al Ka1', energy_eV=13e3, wf_13=0.5)
+        self.assertAlmostEqual(85.0, estimate.value, 4)
+        self.assertTrue(estimate.trusted)
+
+        surrogate = IntensitySurrogate.from_results(items, 'xray', ['Al Ka1'],
+                                                    tolerance=0.01)
+        estimate = surrogate.query('Al Ka1', energy_eV=13e3, wf_13=0.5)
+        self.assertFalse(estimate.trusted)
+
+class TestSurrogateEngine(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.engine = SurrogateEngine('xray', ['Al Ka1'], _simulate,
+                                      _create_items(), tolerance=0.01)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+    def testskeleton(self):
+        self.assertEqual(0, self.engine.nsimulations)
+
+    def testintensity(self):
+        estimate = self.engine.intensity(_create_options(13e3, 0.5), 'Al Ka1')
+        self.assertTrue(estimate.trusted)
+        self.assertEqual(0, self.engine.nsimulations)
+
+    def testintensity_fallback(self):
+        ops = _create_options(20e3, 0.5)
+
+        estimate = self.engine.intensity(ops, 'Al Ka1')
+        self.assertAlmostEqual(_intensity(20e3, 0.5), estimate.value, 4)
+        self.assertAlmostEqual(0.0, estimate.error, 4)
+        self.assertEqual(1, self.engine.nsimulations)
+
+        # Now a node of the surrogate
+        estimate = self.engine.intensity(ops, 'Al Ka1')
+        self.assertTrue(estimate.trusted)
+        self.assertEqual(1, self.engine.nsimulations)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+import threading
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.sweep import iter_results, SpilledResults
+from pymontecarlo.options.options import Options
+
+# Globals and constants variables.
+
+class _Runner(object):
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, options):
+        with self._lock:
+            self.running += 1
+            self.count += 1
+            self.max_running = max(self.max_running, self.running)
+
+        if options.name == 'fail':
+            raise RuntimeError('Simulation failed')
+
+        with self._lock:
+            self.running -= 1
+
+        return {'energy': options.beam.energy_eV}
+
+class TestSweep(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.runner = _Runner()
+
+        self.optionss = []
+        for i in range(10):
+            ops = Options('sim%i' % i)
+            ops.beam.energy_eV = 1e3 * (i + 1)
+            self.optionss.append(ops)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testskeleton(self):
+        items = list(iter_results(self.optionss, self.runner, max_inflight=3))
+        self.assertEqual(10, len(items))
+        self.assertLessEqual(self.runner.max_running, 3)
+
+        for options, results in items:
+            self.assertAlmostEqual(options.beam.energy_eV, results['energy'], 4)
+
+    def testiter_results_lazy(self):
+        iterator = iter_results(self.optionss, self.runner, max_inflight=2)
+        next(iterator)
+        self.assertLessEqual(self.runner.count, 3)
+        iterator.close()
+        self.assertLessEqual(self.runner.count, 3)
+
+    def testiter_results_spill(self):
+        spill_dir = os.path.join(self.tmpdir, 'spill')
+        items = list(iter_results(self.optionss, self.runner, spill_dir=spill_dir))
+
+        self.assertEqual(10, len(os.listdir(spill_dir)))
+        for options, results in items:
+            self.assertIsInstance(results, SpilledResults)
+            self.assertAlmostEqual(options.beam.energy_eV,
+                                   results.load()['energy'], 4)
+            results.remove()
+
+        self.assertEqual(0, len(os.listdir(spill_dir)))
+
+    def testiter_results_spill_compressed(self):
+        spill_dir = os.path.join(self.tmpdir, 'spill')
+        items = list(iter_results(self.optionss, self.runner, spill_dir=spill_dir,
+                                  spill_compresslevel=6))
+
+        for options, results in items:
+            self.assertAlmostEqual(options.beam.energy_eV,
+                                   results.load()['energy'], 4)
+
+    def testiter_results_error(self):
+        self.optionss.insert(0, Options('fail'))
+        iterator = iter_results(self.optionss, self.runner, max_inflight=1)
+        self.assertRaises(RuntimeError, list, iterator)
+        self.assertEqual(1, self.runner.count)
+
+        self.assertRaises(ValueError, list,
+                          iter_results(self.optionss, self.runner, 0))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
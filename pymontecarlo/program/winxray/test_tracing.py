@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import json
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.tracing import \
+    Tracer, activate, current, span, write_chrome_trace
+
+# Globals and constants variables.
+
+class TestTracer(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.tracer = Tracer('sim1')
+        with activate(self.tracer):
+            with span('simulate'):
+                pass
+            with span('import xray', detector='PhotonIntensityDetector'):
+                pass
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testskeleton(self):
+        self.assertIsNone(current())
+        self.assertEqual(2, len(self.tracer.spans))
+        self.assertEqual('simulate', self.tracer.spans[0].name)
+        self.assertEqual({'detector': 'PhotonIntensityDetector'},
+                         self.tracer.spans[1].args)
+
+    def testspan_inactive(self):
+        with span('simulate'):
+            pass
+        self.assertEqual(2, len(self.tracer.spans))
+
+    def testdurations(self):
+        durations = self.tracer.durations()
+        self.assertEqual(2, len(durations))
+        self.assertGreaterEqual(durations['simulate'], 0.0)
+
+    def testwrite_chrome_trace(self):
+        filepath = os.path.join(self.tmpdir, 'trace.json')
+        write_chrome_trace(filepath, [self.tracer, Tracer('sim2')])
+
+        with open(filepath, 'r') as fp:
+            events = json.load(fp)['traceEvents']
+
+        self.assertEqual(4, len(events))
+        self.assertEqual('M', events[0]['ph'])
+        self.assertEqual('sim1', events[0]['args']['name'])
+        self.assertEqual('X', events[1]['ph'])
+        self.assertEqual('simulate', events[1]['name'])
+        self.assertEqual(1, events[3]['pid'])
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
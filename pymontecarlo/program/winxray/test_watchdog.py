@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import sys
+import tempfile
+import shutil
+import subprocess
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.watchdog import \
+    Watchdog, WatchdogStats, HungProcessError, INACTIVITY, WALL
+
+# Globals and constants variables.
+SLEEP = 'import time; time.sleep(30)'
+PRINT = 'import sys, time\n' \
+        'for i in range(10):\n' \
+        '    print(i); sys.stdout.flush(); time.sleep(0.1)\n'
+
+class TestWatchdog(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.stats = WatchdogStats()
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _run(self, code, **kwargs):
+        process = subprocess.Popen([sys.executable, '-c', code],
+                                   stdout=subprocess.PIPE,
+                                   start_new_session=True)
+        watchdog = Watchdog(process, self.tmpdir, interval_s=0.05,
+                            stats=self.stats, **kwargs)
+        watchdog.start()
+        process.wait()
+        watchdog.stop()
+        process.stdout.close()
+        return watchdog
+
+    def testskeleton(self):
+        watchdog = self._run(PRINT, inactivity_s=0.5, wall_s=10.0)
+        self.assertIsNone(watchdog.reason)
+        self.assertIsNone(watchdog.error())
+        self.assertIn('9', watchdog.output)
+
+        stats = self.stats.as_dict()
+        self.assertEqual(1, stats['runs'])
+        self.assertEqual(0, stats['kills'])
+
+    def testinactivity(self):
+        watchdog = self._run(SLEEP, inactivity_s=0.3)
+        self.assertEqual(INACTIVITY, watchdog.reason)
+        self.assertIsInstance(watchdog.error(), HungProcessError)
+
+        stats = self.stats.as_dict()
+        self.assertEqual(1, stats['hangs_inactivity'])
+        self.assertEqual(1, stats['kills'])
+        self.assertGreater(stats['lost_s'], 0.0)
+
+    def testwall(self):
+        watchdog = self._run(PRINT, inactivity_s=0.5, wall_s=0.3)
+        self.assertEqual(WALL, watchdog.reason)
+        self.assertEqual(1, self.stats.as_dict()['hangs_wall'])
+
+    @unittest.skipUnless(hasattr(os, 'waitid'), 'Requires os.waitid')
+    def testnot_reaped(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        watchdog = Watchdog(process, interval_s=0.05, wall_s=10.0,
+                            stats=self.stats)
+        watchdog.start()
+        watchdog.join(10.0)
+
+        # Ended, but its CPU time can still be read
+        self.assertFalse(watchdog.is_alive())
+        self.assertIsNone(process.returncode)
+        self.assertEqual(0, process.wait())
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+""" """
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.testcase import TestCase
+
+from pymontecarlo.program.winxray.watcher import ResultWatcher
+from pymontecarlo.options.options import Options
+from pymontecarlo.options.detector import \
+    PhotonIntensityDetector, TimeDetector, ShowersStatisticsDetector
+from pymontecarlo.options.limit import ShowersLimit
+
+# Globals and constants variables.
+
+class TestResultWatcher(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.workdir = tempfile.mkdtemp()
+        self.resultdir = os.path.join(self.workdir, 'al_10keV_1ke_001')
+        os.mkdir(self.resultdir)
+
+        self.ops = Options()
+        self.ops.detectors['xray'] = PhotonIntensityDetector((0, 1), (2, 3))
+        self.ops.detectors['time'] = TimeDetector()
+        self.ops.detectors['showers'] = ShowersStatisticsDetector()
+        self.ops.limits.add(ShowersLimit(1000))
+
+        self.watcher = ResultWatcher(self.ops, self.workdir)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _copy(self, filename):
+        srcdir = os.path.join(os.path.dirname(__file__),
+                              'testdata', 'al_10keV_1ke_001')
+        shutil.copy(os.path.join(srcdir, filename), self.resultdir)
+
+    def testpoll(self):
+        self.watcher.poll()
+        self.assertEqual(0, len(self.watcher.results))
+
+        # File must be stable during two polls
+        self._copy('GenResult.txt')
+        self.watcher.poll()
+        self.assertEqual(0, len(self.watcher.results))
+
+        self.watcher.poll()
+        results = self.watcher.results
+        self.assertEqual(2, len(results))
+        self.assertIn('time', results)
+        self.assertIn('showers', results)
+
+        self._copy('XCharIntensity_Reg1.txt')
+        self.watcher.poll()
+        self.watcher.poll()
+        self.assertEqual(3, len(self.watcher.results))
+
+    def testresults_modified(self):
+        self._copy('GenResult.txt')
+        self.watcher.poll()
+        self.watcher.poll()
+        self.assertEqual(2, len(self.watcher.results))
+
+        with open(os.path.join(self.resultdir, 'GenResult.txt'), 'a') as fp:
+            fp.write('\n')
+        self.assertEqual(0, len(self.watcher.results))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
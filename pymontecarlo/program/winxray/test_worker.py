@@ -11,22 +11,35 @@ __license__ = "GPL v3"
 # Standard library modules.
 import unittest
 import logging
+import os
+import copy
+import sys
+import stat
 import tempfile
 import shutil
+import threading
+import time
 
 # Third party modules.
+import numpy as np
 
 # Local modules.
 from pymontecarlo.testcase import TestCase
 
 from pymontecarlo.options.options import Options
 from pymontecarlo.options.material import Material
-from pymontecarlo.options.detector import TimeDetector
+from pymontecarlo.options.detector import \
+    (TimeDetector, PhotonIntensityDetector, PhiZDetector,
+     PhotonSpectrumDetector)
 from pymontecarlo.options.limit import ShowersLimit
+from pymontecarlo.settings import get_settings
 
 from pymontecarlo.program.winxray.config import program
 from pymontecarlo.program.winxray.worker import Worker
 from pymontecarlo.program.winxray.converter import Converter
+from pymontecarlo.program.winxray import stub
+import pymontecarlo.program.winxray.metrics as metrics
+from pymontecarlo.program.winxray.watchdog import HungProcessError
 
 # Globals and constants variables.
 
@@ -55,6 +68,209 @@ class TestWorker(TestCase):
         results = self.worker.run(self.ops, self.outputdir, self.workdir)
         self.assertIn('time', results)
 
+def _create_stub_executable(dirpath):
+    # Shell script running the stub with this interpreter
+    filepath = os.path.join(dirpath, 'winxray-stub')
+    with open(filepath, 'w') as fp:
+        fp.write('#!/bin/sh\n')
+        fp.write('exec "%s" "%s" "$@"\n' % \
+                 (sys.executable, os.path.splitext(stub.__file__)[0] + '.py'))
+    os.chmod(filepath, os.stat(filepath).st_mode | stat.S_IXUSR)
+    return filepath
+
+@unittest.skipIf(sys.platform in ('win32', 'darwin'),
+                 'Stub executable requires a POSIX shell')
+class TestWorkerStub(TestCase):
+    """
+    Runs the whole pipeline (export, launch, import, archive) with the
+    stand-in WinX-Ray executable.
+    """
+
+    def setUp(self):
+        TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.outputdir = os.path.join(self.tmpdir, 'output')
+        os.makedirs(self.outputdir)
+
+        self._settings = {}
+        self._environ = {}
+        self._set_settings(exe=_create_stub_executable(self.tmpdir))
+
+        ops = Options('stub')
+        ops.geometry.body.material = Material.pure(13)
+        ops.detectors['xray'] = PhotonIntensityDetector((0, 1), (2, 3))
+        ops.detectors['prz'] = PhiZDetector((0, 1), (2, 3), 100)
+        ops.detectors['spectrum'] = \
+            PhotonSpectrumDetector((0, 1), (2, 3), 500, (0, 1000))
+        ops.detectors['time'] = TimeDetector()
+        ops.limits.add(ShowersLimit(100))
+        self.ops = Converter().convert(ops)[0]
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+
+        section = get_settings().winxray
+        for name, value in self._settings.items():
+            setattr(section, name, value)
+
+        for name, value in self._environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _set_settings(self, **kwargs):
+        section = get_settings().winxray
+        for name, value in kwargs.items():
+            self._settings.setdefault(name, getattr(section, name, None))
+            setattr(section, name, value)
+
+    def _set_environ(self, name, value):
+        self._environ.setdefault(name, os.environ.get(name))
+        os.environ[name] = value
+
+    def _run(self, worker=None, workdir=None):
+        if worker is None:
+            worker = Worker(program)
+        if workdir is None:
+            workdir = tempfile.mkdtemp(dir=self.tmpdir)
+        return worker.run(self.ops, self.outputdir, workdir)
+
+    def testrun(self):
+        worker = Worker(program)
+        results = self._run(worker)
+
+        for key in ['xray', 'prz', 'spectrum', 'time']:
+            self.assertIn(key, results)
+        val, _unc = results['xray'].intensity('Al Ka1')
+        self.assertGreater(val, 0.0)
+
+        self.assertTrue(os.path.exists(os.path.join(self.outputdir, 'stub.zip')))
+        self.assertIsNotNone(worker.cpu_utilisation)
+
+    def testload_archive(self):
+        self._set_settings(store=os.path.join(self.tmpdir, 'store'))
+
+        worker = Worker(program)
+        self._run(worker)
+
+        # Identical simulation with another name, as coalesced by the scheduler
+        ops = copy.deepcopy(self.ops)
+        ops.name = 'other'
+        results = worker.load_archive(ops, worker.archivepath)
+        self.assertIn('xray', results)
+
+    def testprecision(self):
+        self._set_settings(precision='float32')
+
+        worker = Worker(program)
+        workdir = tempfile.mkdtemp(dir=self.tmpdir)
+        results = self._run(worker, workdir)
+        self.assertIn('prz', results)
+
+        # Arrays as read by the importer of the worker
+        path = worker._find_resultdir(workdir)
+        for distribution in worker.importer.read_phi_z(path).values():
+            self.assertEqual(np.float32, distribution.dtype)
+
+        detector = self.ops.detectors['spectrum']
+        total, background = \
+            worker.importer.read_photon_spectrum(self.ops, detector, path)
+        self.assertEqual(np.float32, total.dtype)
+        self.assertEqual(np.float32, background.dtype)
+
+    def testjournal(self):
+        filepath = os.path.join(self.tmpdir, 'journal.jsonl')
+        self._set_settings(journal=filepath)
+
+        results = self._run()
+        self.assertTrue(os.path.exists(filepath))
+
+        # Second run is imported from the archive
+        self._set_environ(stub.ENV_EXITCODE, '1')
+        self._set_environ(stub.ENV_DURATION, '60')
+        start = time.monotonic()
+        cached = self._run()
+        self.assertLess(time.monotonic() - start, 30.0)
+        self.assertAlmostEqual(results['xray'].intensity('Al Ka1')[0],
+                               cached['xray'].intensity('Al Ka1')[0], 6)
+
+    def testwatch(self):
+        self._set_settings(watch_interval_s=0.05)
+        self._set_environ(stub.ENV_DURATION, '0.5')
+
+        results = self._run()
+        self.assertIn('prz', results)
+
+    def teststore(self):
+        dirpath = os.path.join(self.tmpdir, 'store')
+        self._set_settings(store=dirpath)
+
+        results = self._run()
+        self.assertIn('xray', results)
+        self.assertFalse(os.path.exists(os.path.join(self.outputdir, 'stub.zip')))
+        self.assertTrue(os.listdir(dirpath))
+
+    def testtrace(self):
+        trace_dir = os.path.join(self.tmpdir, 'traces')
+        os.makedirs(trace_dir)
+        self._set_settings(trace_dir=trace_dir)
+
+        self._run()
+
+        self.assertTrue(os.path.exists(os.path.join(trace_dir, 'stub.trace.json')))
+
+    def testhung(self):
+        self._set_settings(wall_timeout_s=0.5, retries=1, retry_backoff_s=0.0)
+        self._set_environ(stub.ENV_DURATION, '60')
+
+        self.assertRaises(HungProcessError, self._run)
+
+    def testpriority(self):
+        self._set_settings(nice=5)
+
+        worker = Worker(program)
+        results = self._run(worker)
+        self.assertIn('time', results)
+
+    def testmetrics(self):
+        metrics_file = os.path.join(self.tmpdir, 'winxray.prom')
+        self._set_settings(metrics_file=metrics_file)
+
+        self._run()
+
+        with open(metrics_file, 'r') as fp:
+            self.assertIn('winxray_runs_total', fp.read())
+
+    def testkill(self):
+        self._set_environ(stub.ENV_DURATION, '60')
+
+        worker = Worker(program)
+        errors = []
+        failed = metrics.FAILED_RUNS.value
+
+        def _target():
+            try:
+                self._run(worker)
+            except Exception as ex:
+                errors.append(ex)
+
+        thread = threading.Thread(target=_target)
+        thread.start()
+
+        deadline = time.monotonic() + 10.0
+        while worker.process is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(worker.kill())
+
+        thread.join(30.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(1, len(errors))
+        self.assertAlmostEqual(failed, metrics.FAILED_RUNS.value, 4)
+
 if __name__ == '__main__': #pragma: no cover
     logging.getLogger().setLevel(logging.DEBUG)
     unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`tracing` -- Timing spans of the WinX-Ray pipeline
+================================================================================
+
+.. module:: tracing
+   :synopsis: Timing spans of the WinX-Ray pipeline
+
+A :class:`Tracer` collects the timing spans of one simulation (export,
+launch, simulation, import of each detector, archive).
+The tracer is activated for the current thread with :func:`activate`, so that
+code deeper in the pipeline records its spans with :func:`span` without
+having to pass the tracer around.
+When no tracer is active, :func:`span` does nothing.
+
+The spans can be saved in the Chrome trace event format, which is displayed
+as a timeline by ``chrome://tracing`` or Perfetto.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+Span = namedtuple('Span', ['name', 'start_s', 'duration_s', 'thread', 'args'])
+
+_local = threading.local()
+
+class Tracer(object):
+
+    def __init__(self, name=''):
+        """
+        Creates a tracer collecting the spans of the run *name*.
+        """
+        self._name = name
+        self._spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Records the duration of the ``with`` block as a span.
+        Keyword arguments are saved with the span.
+        """
+        start_s = time.time()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration_s = time.perf_counter() - t0
+            span = Span(name, start_s, duration_s,
+                        threading.current_thread().name, args)
+            with self._lock:
+                self._spans.append(span)
+
+    def durations(self):
+        """
+        Returns the total duration in seconds of the spans, per span name.
+        """
+        durations = {}
+        for span in self.spans:
+            durations[span.name] = durations.get(span.name, 0.0) + span.duration_s
+        return durations
+
+    def to_chrome_trace(self, pid=0):
+        """
+        Returns the spans as a list of Chrome trace complete events.
+        """
+        threads = {}
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                   'args': {'name': self._name}}]
+
+        for span in self.spans:
+            tid = threads.setdefault(span.thread, len(threads))
+            events.append({'name': span.name, 'cat': 'winxray', 'ph': 'X',
+                           'ts': span.start_s * 1e6,
+                           'dur': span.duration_s * 1e6,
+                           'pid': pid, 'tid': tid,
+                           'args': dict(span.args)})
+
+        return events
+
+    def write(self, filepath):
+        """
+        Saves the spans in the Chrome trace format.
+        """
+        write_chrome_trace(filepath, [self])
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+def write_chrome_trace(filepath, tracers):
+    """
+    Saves the spans of several tracers (e.g. all the runs of a sweep) in one
+    Chrome trace file.
+    Each tracer appears as a separate process in the timeline.
+    """
+    events = []
+    for pid, tracer in enumerate(tracers):
+        events.extend(tracer.to_chrome_trace(pid))
+
+    dirpath = os.path.dirname(filepath)
+    if dirpath and not os.path.exists(dirpath):
+        os.makedirs(dirpath)
+
+    with open(filepath, 'w') as fp:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
+
+def current():
+    """
+    Returns the tracer active in the current thread or ``None``.
+    """
+    return getattr(_local, 'tracer', None)
+
+@contextmanager
+def activate(tracer):
+    """
+    Activates *tracer* in the current thread for the duration of the ``with``
+    block.
+    """
+    previous = current()
+    _local.tracer = tracer
+    try:
+        yield tracer
+    finally:
+        _local.tracer = previous
+
+@contextmanager
+def span(name, **args):
+    """
+    Records a span with the tracer active in the current thread, if any.
+    """
+    tracer = current()
+    if tracer is None:
+        yield
+        return
+
+    with tracer.span(name, **args):
+        yield
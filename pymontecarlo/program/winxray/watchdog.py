@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`watchdog` -- Detection of hung WinX-Ray processes
+================================================================================
+
+.. module:: watchdog
+   :synopsis: Detection of hung WinX-Ray processes
+
+WinX-Ray may hang without exiting (e.g. on a Wine dialog or an I/O stall).
+The :class:`Watchdog` monitors the standard output of the process and the
+growth of the files in its work directory.
+The process tree is killed if nothing happens for longer than the inactivity
+limit, or if the process runs for longer than the wall-clock limit.
+
+The number of runs, hangs and kills is accumulated in :data:`STATS`.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+import subprocess
+from collections import deque
+
+# Third party modules.
+try:
+    import psutil
+except ImportError: # pragma: no cover
+    psutil = None
+
+# Local modules.
+from pymontecarlo.program.winxray.resources import has_exited
+
+# Globals and constants variables.
+INACTIVITY = 'inactivity'
+WALL = 'wall'
+
+class HungProcessError(RuntimeError):
+
+    def __init__(self, reason, elapsed_s, output=''):
+        RuntimeError.__init__(self, 'WinX-Ray killed after %.1f s (%s)' % \
+                              (elapsed_s, reason))
+        self.reason = reason
+        self.elapsed_s = elapsed_s
+        self.output = output
+
+class WatchdogStats(object):
+
+    def __init__(self):
+        """
+        Statistics of the processes monitored by watchdogs.
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.runs = 0
+            self.hangs = {INACTIVITY: 0, WALL: 0}
+            self.kills = 0
+            self.retries = 0
+            self.failures = 0
+            self.lost_s = 0.0
+
+    def record_run(self):
+        with self._lock:
+            self.runs += 1
+
+    def record_hang(self, reason, elapsed_s, killed):
+        with self._lock:
+            self.hangs[reason] += 1
+            self.kills += int(killed)
+            self.lost_s += elapsed_s
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def as_dict(self):
+        """
+        Returns the statistics as a :class:`dict`.
+        ``lost_s`` is the total time spent in runs that were killed.
+        """
+        with self._lock:
+            return {'runs': self.runs,
+                    'hangs_inactivity': self.hangs[INACTIVITY],
+                    'hangs_wall': self.hangs[WALL],
+                    'kills': self.kills,
+                    'retries': self.retries,
+                    'failures': self.failures,
+                    'lost_s': self.lost_s}
+
+STATS = WatchdogStats()
+
+def kill_tree(pid):
+    """
+    Kills the process *pid* and all its descendants.
+    Returns ``True`` if at least one process was killed.
+    """
+    if sys.platform == 'win32':
+        returncode = subprocess.call(['taskkill', '/F', '/T', '/PID', str(pid)],
+                                     stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.DEVNULL)
+        return returncode == 0
+
+    if psutil is not None:
+        try:
+            parent = psutil.Process(pid)
+            processes = parent.children(recursive=True) + [parent]
+        except psutil.NoSuchProcess:
+            return False
+
+        for process in processes:
+            try:
+                process.kill()
+            except psutil.NoSuchProcess:
+                pass
+        return True
+
+    # Process group of the process, if it leads one
+    try:
+        if os.getpgid(pid) == pid:
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGKILL)
+    except OSError:
+        return False
+    return True
+
+def _signal_tree(pid, signum):
+    if psutil is not None:
+        try:
+            parent = psutil.Process(pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        for process in processes:
+            try:
+                process.send_signal(signum)
+            except psutil.NoSuchProcess:
+                pass
+        return
+
+    try:
+        if os.getpgid(pid) == pid:
+            os.killpg(pid, signum)
+        else:
+            os.kill(pid, signum)
+    except OSError:
+        pass
+
+def suspend_tree(pid):
+    """
+    Suspends the process *pid* and all its descendants (POSIX only).
+    """
+    if sys.platform == 'win32':
+        raise NotImplementedError('Processes cannot be suspended on Windows')
+    _signal_tree(pid, signal.SIGSTOP)
+
+def resume_tree(pid):
+    """
+    Resumes the processes suspended by :func:`suspend_tree`.
+    """
+    if sys.platform == 'win32':
+        raise NotImplementedError('Processes cannot be suspended on Windows')
+    _signal_tree(pid, signal.SIGCONT)
+
+def _workdir_snapshot(workdir):
+    size = 0
+    mtime = 0.0
+    for dirpath, _dirnames, filenames in os.walk(workdir):
+        for filename in filenames:
+            try:
+                st = os.stat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            size += st.st_size
+            mtime = max(mtime, st.st_mtime)
+    return size, mtime
+
+class Watchdog(threading.Thread):
+
+    def __init__(self, process, workdir=None, inactivity_s=None, wall_s=None,
+                 interval_s=1.0, stats=STATS):
+        """
+        Creates a watchdog of *process* (:class:`subprocess.Popen`).
+
+        :arg workdir: directory where the process writes its results; any
+            change of the size or modification time of its files counts as
+            activity
+        :arg inactivity_s: maximum time without output or file change
+            (disabled if ``None``)
+        :arg wall_s: maximum running time (disabled if ``None``)
+        :arg interval_s: time between two checks
+        """
+        threading.Thread.__init__(self, name='WinXRay watchdog')
+        self.daemon = True
+
+        self._process = process
+        self._workdir = workdir
+        self._inactivity_s = inactivity_s
+        self._wall_s = wall_s
+        self._interval_s = interval_s
+        self._stats = stats
+
+        self._stopevent = threading.Event()
+        self._lock = threading.Lock()
+        self._output = deque(maxlen=50)
+
+        self._start = time.monotonic()
+        self._last_activity = self._start
+        self._snapshot = None
+        self._paused = None
+
+        self.reason = None
+        self.elapsed_s = 0.0
+
+        self._reader = None
+        if getattr(process, 'stdout', None) is not None:
+            self._reader = threading.Thread(target=self._read,
+                                            name='WinXRay watchdog reader')
+            self._reader.daemon = True
+
+    def start(self):
+        self._stats.record_run()
+        if self._reader is not None:
+            self._reader.start()
+        threading.Thread.start(self)
+
+    def _read(self):
+        # Also drains the pipe, so the process never blocks on a full pipe
+        for line in iter(self._process.stdout.readline, b''):
+            if not line:
+                break
+            with self._lock:
+                self._last_activity = time.monotonic()
+                self._output.append(line)
+
+    def _touch(self):
+        with self._lock:
+            self._last_activity = time.monotonic()
+
+    def check(self):
+        """
+        Checks the activity of the process and returns the reason why it is
+        considered hung, or ``None``.
+        """
+        with self._lock:
+            if self._paused is not None:
+                return None
+
+        if self._workdir is not None:
+            snapshot = _workdir_snapshot(self._workdir)
+            if snapshot != self._snapshot:
+                self._snapshot = snapshot
+                self._touch()
+
+        now = time.monotonic()
+        with self._lock:
+            idle_s = now - self._last_activity
+            start = self._start
+
+        if self._wall_s is not None and now - start > self._wall_s:
+            return WALL
+        if self._inactivity_s is not None and idle_s > self._inactivity_s:
+            return INACTIVITY
+        return None
+
+    def run(self):
+        while not self._stopevent.wait(self._interval_s):
+            # Not reaped, the CPU time of the process is read once it ends
+            if has_exited(self._process):
+                return
+
+            reason = self.check()
+            if reason is None:
+                continue
+
+            self.elapsed_s = time.monotonic() - self._start
+            logging.warning('WinX-Ray (pid %i) hung (%s) after %.1f s, killing it',
+                            self._process.pid, reason, self.elapsed_s)
+            killed = kill_tree(self._process.pid)
+            self._stats.record_hang(reason, self.elapsed_s, killed)
+            self.reason = reason
+            return
+
+    def pause(self):
+        """
+        Suspends the monitoring, e.g. while the process is suspended.
+        """
+        with self._lock:
+            if self._paused is None:
+                self._paused = time.monotonic()
+
+    def resume(self):
+        """
+        Resumes the monitoring. The paused time is not counted in the
+        limits.
+        """
+        with self._lock:
+            if self._paused is None:
+                return
+            now = time.monotonic()
+            self._start += now - self._paused
+            self._last_activity = now
+            self._paused = None
+
+    def stop(self):
+        """
+        Stops monitoring the process.
+        """
+        self._stopevent.set()
+        if self.is_alive():
+            self.join()
+
+    def error(self):
+        """
+        Returns the :class:`HungProcessError` if the process was killed,
+        otherwise ``None``.
+        """
+        if self.reason is None:
+            return None
+        return HungProcessError(self.reason, self.elapsed_s, self.output)
+
+    @property
+    def output(self):
+        """
+        Last lines written by the process on its standard output.
+        """
+        with self._lock:
+            lines = list(self._output)
+        return b''.join(lines).decode('ascii', 'replace')
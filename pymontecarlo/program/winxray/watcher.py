@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+================================================================================
+:mod:`watcher` -- Import of WinX-Ray results during the simulation
+================================================================================
+
+.. module:: watcher
+   :synopsis: Import of WinX-Ray results during the simulation
+
+WinX-Ray does not write all its result files at the same time.
+The watcher polls the work directory while WinX-Ray is running and imports
+the result of a detector as soon as all its result files are complete,
+i.e. their size and modification time did not change between two polls.
+
+"""
+
+# Script information for the file.
+__author__ = "Philippe T. Pinard"
+__email__ = "philippe.pinard@gmail.com"
+__version__ = "0.1"
+__copyright__ = "Copyright (c) 2013 Philippe T. Pinard"
+__license__ = "GPL v3"
+
+# Standard library modules.
+import os
+import logging
+import threading
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo.program.winxray.importer import Importer, RESULT_FILENAMES
+import pymontecarlo.program.winxray.tracing as tracing
+
+# Globals and constants variables.
+
+def _stat(filepath):
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime
+
+class ResultWatcher(threading.Thread):
+
+    def __init__(self, options, workdir, interval_s=1.0, tracer=None,
+                 importer=None):
+        """
+        Creates a watcher importing the results of *options* written by
+        WinX-Ray in a result directory of *workdir*.
+
+        :arg interval_s: time between two polls of the work directory
+        :arg tracer: :class:`Tracer <pymontecarlo.program.winxray.tracing.Tracer>`
+            recording the import spans
+        :arg importer: :class:`Importer` of the results (default: new
+            importer)
+        """
+        threading.Thread.__init__(self, name='WinXRay watcher')
+        self.daemon = True
+
+        self._options = options
+        self._workdir = workdir
+        self._interval_s = interval_s
+        self._tracer = tracer
+
+        self._importer = importer or Importer()
+        self._stopevent = threading.Event()
+
+        self._previous = {}
+        self._results = {}
+        self._snapshots = {}
+        self._errors = {}
+
+    def run(self):
+        with tracing.activate(self._tracer):
+            while not self._stopevent.wait(self._interval_s):
+                self.poll()
+
+    def stop(self):
+        """
+        Stops watching and waits for the current poll to finish.
+        """
+        self._stopevent.set()
+        if self.is_alive():
+            self.join()
+
+    def _find_resultdir(self):
+        try:
+            names = os.listdir(self._workdir)
+        except OSError:
+            return None
+
+        resultdirs = sorted(name for name in names \
+                            if os.path.isdir(os.path.join(self._workdir, name)))
+        if not resultdirs:
+            return None
+
+        return os.path.join(self._workdir, resultdirs[-1])
+
+    def poll(self):
+        """
+        Imports the results of the detectors whose result files are
+        complete.
+        """
+        dirpath = self._find_resultdir()
+        if dirpath is None:
+            return
+
+        current = {}
+        for name, detector in self._options.detectors.items():
+            if name in self._results:
+                continue
+
+            filenames = RESULT_FILENAMES.get(detector.__class__)
+            if not filenames:
+                continue
+
+            filepaths = [os.path.join(dirpath, filename) for filename in filenames]
+            snapshot = tuple(map(_stat, filepaths))
+            if None in snapshot:
+                continue
+            current[name] = snapshot
+
+            # File(s) still growing
+            if self._previous.get(name) != snapshot:
+                continue
+
+            try:
+                with tracing.span('import %s' % name, watcher=True):
+                    result = self._importer.import_detector(self._options, name,
+                                                            detector, dirpath)
+            except Exception as ex:
+                if self._errors.get(name) != snapshot:
+                    logging.warning('Cannot import %s from %s during simulation: %s',
+                                    name, dirpath, ex)
+                self._errors[name] = snapshot
+                continue
+
+            logging.debug('Imported %s during simulation', name)
+            self._errors.pop(name, None)
+            self._results[name] = result
+            self._snapshots[name] = (filepaths, snapshot)
+
+        self._previous = current
+
+    @property
+    def results(self):
+        """
+        Results (detector key to result) imported while WinX-Ray was running
+        and whose result files have not changed since.
+        """
+        results = {}
+
+        for name, result in self._results.items():
+            filepaths, snapshot = self._snapshots[name]
+            if tuple(map(_stat, filepaths)) != snapshot:
+                logging.debug('Result files of %s changed after import', name)
+                continue
+            results[name] = result
+
+        return results
+
+    @property
+    def errors(self):
+        """
+        Keys of the detectors whose result files could not be imported.
+        """
+        return sorted(self._errors.keys())
@@ -21,6 +21,8 @@ __license__ = "GPL v3"
 # Standard library modules.
 import os
 import sys
+import time
+import shutil
 import subprocess
 import logging
 from zipfile import ZipFile
@@ -31,6 +33,23 @@ from zipfile import ZipFile
 from pymontecarlo.settings import get_settings
 from pymontecarlo.program.worker import SubprocessWorker as _Worker
 
+from pymontecarlo.program.winxray.exporter import Exporter
+from pymontecarlo.program.winxray.importer import Importer
+from pymontecarlo.program.winxray.journal import \
+    SweepJournal, SIMULATED, IMPORTED
+from pymontecarlo.program.winxray.watcher import ResultWatcher
+from pymontecarlo.program.winxray.store import ContentStore
+from pymontecarlo.program.winxray.index import ResultIndex
+from pymontecarlo.program.winxray.watchdog import \
+    (Watchdog, HungProcessError, STATS, kill_tree, suspend_tree, resume_tree)
+from pymontecarlo.program.winxray.resources import \
+    CpuMonitor, get_allocator, limit_command, limit_process, wait_exited
+from pymontecarlo.program.winxray.tracing import Tracer
+import pymontecarlo.program.winxray.tracing as tracing
+import pymontecarlo.program.winxray.metrics as metrics
+
+from winxraytools.results.GeneralResults import GeneralResults
+
 # Globals and constants variables.
 from zipfile import ZIP_DEFLATED
 
@@ -48,45 +67,357 @@ class Worker(_Worker):
         self._executable_dir = os.path.dirname(self._executable)
         logging.debug('WinX-Ray directory: %s', self._executable_dir)
 
+        self.journal = None
+        journal_filepath = getattr(get_settings().winxray, 'journal', None)
+        if journal_filepath:
+            self.journal = SweepJournal(journal_filepath)
+            logging.debug('WinX-Ray journal: %s', journal_filepath)
+
+        # Content-addressed store replacing the ZIP archives (disabled if None)
+        self.store = None
+        store_dirpath = getattr(get_settings().winxray, 'store', None)
+        if store_dirpath:
+            self.store = ContentStore(store_dirpath)
+            logging.debug('WinX-Ray results store: %s', store_dirpath)
+
+        # SQLite index of the imported results (disabled if None)
+        self.index = None
+        index_filepath = getattr(get_settings().winxray, 'index', None)
+        if index_filepath:
+            self.index = ResultIndex(index_filepath)
+            logging.debug('WinX-Ray results index: %s', index_filepath)
+
+        # Import results while WinX-Ray is running (disabled if None)
+        self.watch_interval_s = \
+            getattr(get_settings().winxray, 'watch_interval_s', None)
+        if self.watch_interval_s is not None:
+            self.watch_interval_s = float(self.watch_interval_s)
+
+        # Kill hung processes (disabled if both limits are None)
+        section = get_settings().winxray
+        self.inactivity_timeout_s = getattr(section, 'inactivity_timeout_s', None)
+        if self.inactivity_timeout_s is not None:
+            self.inactivity_timeout_s = float(self.inactivity_timeout_s)
+        self.wall_timeout_s = getattr(section, 'wall_timeout_s', None)
+        if self.wall_timeout_s is not None:
+            self.wall_timeout_s = float(self.wall_timeout_s)
+        self.retries = int(getattr(section, 'retries', 0))
+        self.retry_backoff_s = float(getattr(section, 'retry_backoff_s', 10.0))
+
+        # Pinning ('core' or 'numa') and priorities of the process
+        self.cpu_pinning = getattr(section, 'cpu_pinning', None)
+        self.nice = getattr(section, 'nice', None)
+        if self.nice is not None:
+            self.nice = int(self.nice)
+        self.ionice = getattr(section, 'ionice', None)
+        if self.ionice is not None:
+            self.ionice = int(self.ionice)
+
+        # CPU utilisation of the last run (1.0 for a full core)
+        self.cpu_utilisation = None
+
+        # Precision of the imported distributions ('float32' or 'float64')
+        self.precision = getattr(section, 'precision', None)
+        self.importer = Importer(self.precision)
+
+        # Archive of the results of the last run
+        self.archivepath = None
+
+        # Running WinX-Ray process and its watchdog
+        self.process = None
+        self._watchdog = None
+        self._killed = False
+
+        # Timing spans of the last run, saved in this directory if not None
+        self.tracer = None
+        self.trace_dir = getattr(get_settings().winxray, 'trace_dir', None)
+
+        # Metrics written to this file after each run and/or served on a port
+        self.metrics_file = getattr(section, 'metrics_file', None)
+        metrics_port = getattr(section, 'metrics_port', None)
+        if metrics_port is not None:
+            metrics.serve_once(int(metrics_port))
+
     def run(self, options, outputdir, workdir, *args, **kwargs):
         if sys.platform == 'darwin':
             self.create(options, outputdir, *args, **kwargs)
             raise NotImplementedError("Simulations with WinXRay cannot be directly run. "
                 "The .wxc file was created in the output directory.")
 
+        self.tracer = Tracer(options.name)
+        self._killed = False
+        try:
+            with tracing.activate(self.tracer):
+                return self._run(options, outputdir, workdir)
+        except Exception:
+            # Killed simulations (e.g. preempted) are not failures
+            if not self._killed:
+                metrics.FAILED_RUNS.inc()
+            raise
+        finally:
+            if self.trace_dir:
+                filepath = os.path.join(self.trace_dir, options.name + '.trace.json')
+                self.tracer.write(filepath)
+            if self.metrics_file:
+                metrics.REGISTRY.write(self.metrics_file)
+
+    def _run(self, options, outputdir, workdir):
+        # Skip simulations already recorded in the journal
+        digest = None
+        if self.journal is not None:
+            with tracing.span('journal'):
+                digest = Exporter().digest(options)
+                entry = self.journal.lookup(options.name, digest)
+            if entry is not None:
+                logging.debug('Skipping %s, results found in %s (%s)',
+                              options.name, entry.archive, entry.state)
+                metrics.CACHE_HITS.inc()
+                return self._import_archive(options, entry.archive, digest)
+            metrics.CACHE_MISSES.inc()
+
         wxcfilepath = self.create(options, workdir)
 
+        # Retry hung simulations with an exponential back-off
+        for attempt in range(self.retries + 1):
+            try:
+                prefetched = self._simulate(options, workdir, wxcfilepath)
+                break
+            except HungProcessError as ex:
+                if attempt >= self.retries:
+                    STATS.record_failure()
+                    raise
+
+                delay_s = self.retry_backoff_s * 2 ** attempt
+                logging.warning('%s, retrying %s in %.0f s', ex, options.name,
+                                delay_s)
+                STATS.record_retry()
+                self._clean_workdir(workdir, wxcfilepath)
+                time.sleep(delay_s)
+
+        return self._extract_results(options, outputdir, workdir, digest,
+                                     prefetched)
+
+    def _simulate(self, options, workdir, wxcfilepath):
+        cpus = None
+        if self.cpu_pinning:
+            cpus = get_allocator(self.cpu_pinning).acquire()
+            logging.debug('Pinning WinX-Ray to CPU(s) %s',
+                          ', '.join(map(str, sorted(cpus))))
+
+        try:
+            return self._launch(options, workdir, wxcfilepath, cpus)
+        finally:
+            if cpus is not None:
+                get_allocator(self.cpu_pinning).release(cpus)
+
+    def _launch(self, options, workdir, wxcfilepath, cpus=None):
         # Launch
         args = [self._executable, wxcfilepath.replace('/', '\\')]
+
+        # Limits inherited by the children of WinX-Ray (Wine)
+        if sys.platform != 'win32':
+            args, remaining = \
+                limit_command(args, cpus, self.nice, self.ionice)
+        else:
+            remaining = {'cpus': cpus, 'nice': self.nice, 'ionice': self.ionice}
         logging.debug('Launching %s', ' '.join(args))
 
         self._status = 'Running WinX-Ray'
 
-        self._create_process(args, stdout=subprocess.PIPE,
-                             cwd=self._executable_dir)
-        self._join_process()
+        kwargs = {}
+        if sys.platform != 'win32': # Own process group, to kill Wine children
+            kwargs['start_new_session'] = True
+
+        with tracing.span('launch'):
+            process = self._create_process(args, stdout=subprocess.PIPE,
+                                           cwd=self._executable_dir, **kwargs)
+            if any(value is not None for value in remaining.values()):
+                limit_process(process.pid, **remaining)
+
+        watchdog = None
+        if self.inactivity_timeout_s or self.wall_timeout_s:
+            watchdog = Watchdog(process, workdir, self.inactivity_timeout_s,
+                                self.wall_timeout_s)
+            watchdog.start()
+
+        self._watchdog = watchdog
+        self.process = process
+
+        watcher = None
+        if self.watch_interval_s:
+            watcher = ResultWatcher(options, workdir, self.watch_interval_s,
+                                    self.tracer, self.importer)
+            watcher.start()
+
+        monitor = CpuMonitor(process.pid)
+        monitor.start()
+
+        metrics.ACTIVE_PROCESSES.inc()
+        try:
+            with tracing.span('simulate'):
+                # Last CPU sample before the process is reaped
+                wait_exited(process.pid)
+                monitor.stop()
+                self._join_process()
+        except Exception:
+            if watchdog is None or watchdog.reason is None:
+                raise
+        finally:
+            self.process = None
+            self._watchdog = None
+            metrics.ACTIVE_PROCESSES.dec()
+            monitor.stop()
+            if watchdog is not None:
+                watchdog.stop()
+            if watcher is not None:
+                watcher.stop()
+
+        self.cpu_utilisation = monitor.utilisation
+        logging.debug('WinX-Ray CPU utilisation: %.0f%% (%.1f s in %.1f s)',
+                      self.cpu_utilisation * 100.0, monitor.cpu_s, monitor.wall_s)
+
+        if watchdog is not None and watchdog.reason is not None:
+            raise watchdog.error()
 
         logging.debug('WinX-Ray ended')
 
-        return self._extract_results(options, outputdir, workdir)
+        return watcher.results if watcher is not None else None
 
-    def _extract_results(self, options, outputdir, workdir):
+    def kill(self):
+        """
+        Kills the running WinX-Ray process and its children.
+        Returns ``False`` if no process is running.
+        """
+        process = self.process
+        if process is None:
+            return False
+        self._killed = True
+        return kill_tree(process.pid)
+
+    def suspend(self):
+        """
+        Suspends the running WinX-Ray process (SIGSTOP).
+        The watchdog does not consider a suspended process as hung.
+        Returns ``False`` if no process is running.
+        """
+        process, watchdog = self.process, self._watchdog
+        if process is None:
+            return False
+        if watchdog is not None:
+            watchdog.pause()
+        suspend_tree(process.pid)
+        self._status = 'Suspended'
+        return True
+
+    def resume(self):
+        """
+        Resumes the WinX-Ray process suspended by :meth:`suspend`.
+        """
+        process, watchdog = self.process, self._watchdog
+        if process is None:
+            return False
+        resume_tree(process.pid)
+        if watchdog is not None:
+            watchdog.resume()
+        self._status = 'Running WinX-Ray'
+        return True
+
+    def import_(self, options, dirpath, *args, **kwargs):
+        # Import with the precision of the settings
+        return self.importer.import_(options, dirpath, *args, **kwargs)
+
+    def _clean_workdir(self, workdir, wxcfilepath):
+        # Remove the partial results of a killed simulation
+        for name in os.listdir(workdir):
+            path = os.path.join(workdir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif path != wxcfilepath:
+                os.remove(path)
+
+    def _find_resultdir(self, workdir):
         resultdirs = [name for name in os.listdir(workdir) \
                       if os.path.isdir(os.path.join(workdir, name)) ]
         resultdirs.sort()
         if not resultdirs:
             raise IOError('Cannot find results directories in %s' % workdir)
 
+        return os.path.join(workdir, resultdirs[-1]) # Take last result folder
+
+    def _extract_results(self, options, outputdir, workdir, digest=None,
+                         prefetched=None):
+        path = self._find_resultdir(workdir)
+
+        with tracing.span('archive'):
+            archivepath = self._archive(options, outputdir, workdir)
+        self.archivepath = archivepath
+
+        if self.journal is not None:
+            self.journal.record(options.name, digest, SIMULATED, archivepath)
+
+        general = GeneralResults(path)
+        metrics.RUNS.inc()
+        metrics.ELECTRONS.inc(general.numberElectron)
+        metrics.SIMULATION_SECONDS.inc(general.time_s)
+        metrics.ARCHIVE_BYTES.inc(self._archive_size(archivepath))
+
         # Import results to pyMonteCarlo
         logging.debug('Importing results from WinXRay')
-        path = os.path.join(workdir, resultdirs[-1]) # Take last result folder
-        results = self.import_(options, path)
+        with tracing.span('import'):
+            results = self.import_(options, path, prefetched=prefetched)
+
+        if self.index is not None:
+            with tracing.span('index'):
+                self.index.add(options, path, archivepath, digest)
+
+        if self.journal is not None:
+            self.journal.record(options.name, digest, IMPORTED, archivepath)
+
+        return results
+
+    def _archive(self, options, outputdir, workdir):
+        # Store all WinXRay results in the content-addressed store
+        if self.store is not None:
+            return self.store.put(options.name, workdir)
 
         # Create ZIP with all WinXRay results
         zipfilepath = os.path.join(outputdir, options.name + '.zip')
         with ZipFile(zipfilepath, 'w', compression=ZIP_DEFLATED) as zipfile:
-            for filename in os.listdir(workdir):
-                filepath = os.path.join(workdir, filename)
-                zipfile.write(filepath)
+            for dirpath, _dirnames, filenames in os.walk(workdir):
+                for filename in filenames:
+                    filepath = os.path.join(dirpath, filename)
+                    zipfile.write(filepath, os.path.relpath(filepath, workdir))
+
+        return zipfilepath
+
+    def _archive_size(self, archivepath):
+        if archivepath.endswith('.zip'):
+            return os.path.getsize(archivepath)
+
+        # Bytes added to the store, not the size of the deduplicated files
+        name = os.path.splitext(os.path.basename(archivepath))[0]
+        return self.store.added_size(name)
+
+    def load_archive(self, options, archivepath):
+        """
+        Imports the results archived in *archivepath* (ZIP or manifest of the
+        store) with *options*.
+        """
+        logging.debug('Importing results from %s', archivepath)
+        with tracing.span('import', archive=archivepath):
+            if archivepath.endswith('.zip'):
+                return self.importer.import_archive(options, archivepath)
+
+            store = self.store or \
+                ContentStore(os.path.dirname(os.path.dirname(archivepath)))
+            name = os.path.splitext(os.path.basename(archivepath))[0]
+            return self.importer.import_store(options, store, name)
+
+    def _import_archive(self, options, archivepath, digest=None):
+        self.archivepath = archivepath
+        results = self.load_archive(options, archivepath)
+
+        if self.journal is not None:
+            self.journal.record(options.name, digest, IMPORTED, archivepath)
 
         return results
@@ -46,7 +46,9 @@ setup(name="pyMonteCarlo-WinXRay",
                     'pymontecarlo.program.cli':
                         'winxray=pymontecarlo.program.winxray.config_cli:cli',
                     'pymontecarlo.program.gui':
-                        'winxray=pymontecarlo.program.winxray.config_gui:gui', },
+                        'winxray=pymontecarlo.program.winxray.config_gui:gui',
+                    'console_scripts':
+                        'winxray-stub=pymontecarlo.program.winxray.stub:main', },
 
       test_suite='nose.collector',
 )